@@ -1,11 +1,49 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
-from pptx import Presentation
-from pptx.enum.shapes import MSO_SHAPE_TYPE
-from pptx.enum.text import MSO_ANCHOR, PP_ALIGN
-from pptx.util import Inches, Pt
-from pptx.dml.color import RGBColor
-from io import BytesIO
-from PIL import Image
+
+# merge_engine, incremental_merge and slide_preview pull in python-pptx and Pillow; they are
+# imported where first needed so the page loads without them
+from extraction import PPTX_MIME, create_template_txt, extract_items, make_extract_executor
+from extract_cache import ExtractionCache, cache_key
+from deck_library import DeckLibrary
+from file_spool import FileSpool, default_spool_dir
+from jobs import JobQueue, QueueFull, SharedFile
+from instrumentation import MergeMetrics, configure_logging, profile_call
+from slide_ir import SlideDeduplicator
+
+# Extraction pool settings (PPTX_MERGER_WORKERS=1 disables the pool)
+EXTRACT_WORKERS = int(os.environ.get('PPTX_MERGER_WORKERS', os.cpu_count() or 1))
+EXTRACT_POOL = os.environ.get('PPTX_MERGER_POOL', 'process')
+# Extracted-text cache: optional on-disk tier shared by every session and restart
+CACHE_DIR = os.environ.get('PPTX_MERGER_CACHE_DIR')
+CACHE_DISK_MB = int(os.environ.get('PPTX_MERGER_CACHE_MB', '512'))
+# Uploaded files are spooled to disk here, shared by every session
+SPOOL_DIR = os.environ.get('PPTX_MERGER_SPOOL_DIR') or default_spool_dir()
+SPOOL_QUOTA_MB = int(os.environ.get('PPTX_MERGER_SPOOL_MB', '2048'))
+# Merged decks are written to a temp file (in memory until this size) with this zip level
+# (merge_engine.ZIP_COMPRESS_LEVEL when unset)
+OUTPUT_MEMORY_MB = int(os.environ.get('PPTX_MERGER_OUTPUT_MEMORY_MB', '8'))
+ZIP_LEVEL = os.environ.get('PPTX_MERGER_ZIP_LEVEL')
+# Merges run as background jobs: how many at once, how many may wait, how long results are kept
+JOB_WORKERS = int(os.environ.get('PPTX_MERGER_JOB_WORKERS', '2'))
+JOB_QUEUE = int(os.environ.get('PPTX_MERGER_JOB_QUEUE', '8'))
+RESULT_TTL = int(os.environ.get('PPTX_MERGER_RESULT_TTL', '600'))
+# Per-stage merge timings are logged as JSON lines; profiles requested from the UI go to PROFILE_DIR
+LOG_LEVEL = os.environ.get('PPTX_MERGER_LOG_LEVEL', 'INFO')
+PROFILE_DIR = os.environ.get('PPTX_MERGER_PROFILE_DIR') or tempfile.gettempdir()
+PROFILER = os.environ.get('PPTX_MERGER_PROFILER', 'cprofile')
+# Threads drawing slide previews (shared by every session)
+PREVIEW_WORKERS = int(os.environ.get('PPTX_MERGER_PREVIEW_WORKERS', '4'))
+PREVIEW_PAGE_SIZE = 6
+# Searchable library of earlier uploads (disabled unless a directory is set)
+LIBRARY_DIR = os.environ.get('PPTX_MERGER_LIBRARY_DIR')
+
+configure_logging(LOG_LEVEL)
 
 st.set_page_config(page_title="PowerPoint Merger by OrvilleDev", layout="centered")
 
@@ -33,193 +71,35 @@ st.markdown("""
 
 st.title("📊 PowerPoint Merger by OrvilleDev")
 
-def resize_image_to_1920x1080(image_bytes):
-    """Resize image to 1920x1080 pixels"""
-    try:
-        # Open image from bytes
-        img = Image.open(BytesIO(image_bytes))
-        # Resize to 1920x1080 (use LANCZOS resampling for quality)
-        try:
-            # Try newer API first
-            resized_img = img.resize((1920, 1080), Image.Resampling.LANCZOS)
-        except AttributeError:
-            # Fallback for older Pillow versions
-            resized_img = img.resize((1920, 1080), Image.LANCZOS)
-        # Convert to RGB if necessary (for JPEG compatibility)
-        if resized_img.mode != 'RGB':
-            resized_img = resized_img.convert('RGB')
-        # Save to bytes
-        output = BytesIO()
-        resized_img.save(output, format='PNG')
-        output.seek(0)
-        return output.getvalue()
-    except Exception as e:
-        # If resizing fails, return original
-        return image_bytes
-
-def extract_text_from_slide(slide):
-    """Extract all text from a slide"""
-    text_content = []
-    for shape in slide.shapes:
-        if shape.has_text_frame:
-            for paragraph in shape.text_frame.paragraphs:
-                para_text = ""
-                for run in paragraph.runs:
-                    para_text += run.text
-                if para_text.strip():
-                    text_content.append(para_text.strip())
-    return "\n".join(text_content)
-
-def is_all_caps(text):
-    """Check if text is all uppercase (all caps)"""
-    return text.isupper() and any(c.isalpha() for c in text)
-
-def parse_txt_file(txt_content):
-    """Parse .txt file and extract slides with titles and verses"""
-    lines = txt_content.decode('utf-8').split('\n')
-    slides = []
-    current_slide = {'title': None, 'verses': []}
-    
-    for line in lines:
-        line = line.strip()
-        
-        # Check if line is a title
-        if line.upper().startswith('TITLE:'):
-            # If we have content in current slide, save it
-            if current_slide['title'] or current_slide['verses']:
-                slides.append(current_slide)
-            
-            # Extract title text (handle both TITLE:text and TITLE:"text" formats)
-            title_text = line[6:].strip()  # Remove "TITLE:"
-            if title_text.startswith('"') and title_text.endswith('"'):
-                title_text = title_text[1:-1]  # Remove quotes
-            
-            # Start new slide with this title
-            current_slide = {'title': title_text, 'verses': []}
-        elif line == '':
-            # Blank line - if we have content, save current slide and start new one
-            if current_slide['title'] or current_slide['verses']:
-                slides.append(current_slide)
-                current_slide = {'title': None, 'verses': []}
-        else:
-            # Regular verse line
-            if line:  # Only add non-empty lines
-                current_slide['verses'].append(line)
-    
-    # Add the last slide if it has content
-    if current_slide['title'] or current_slide['verses']:
-        slides.append(current_slide)
-    
-    return slides
-
-def create_formatted_slide(target_presentation, text, is_title, title_color, verse_color, title_font_size, verse_font_size, title_font, verse_font, background_image=None):
-    """Create a new slide with formatted text"""
-    # Use blank layout
-    blank_slide_layout = target_presentation.slide_layouts[6]
-    slide = target_presentation.slides.add_slide(blank_slide_layout)
-    
-    # Get slide dimensions
-    slide_width = target_presentation.slide_width
-    slide_height = target_presentation.slide_height
-    
-    # Add background image if provided (add it first so text appears on top)
-    if background_image:
-        try:
-            # Add image to cover entire slide
-            slide.shapes.add_picture(
-                BytesIO(background_image),
-                0,  # left
-                0,  # top
-                slide_width,  # width
-                slide_height  # height
-            )
-        except Exception:
-            pass
-    
-    # Set black background (if no image, or as fallback)
-    background = slide.background
-    fill = background.fill
-    fill.solid()
-    fill.fore_color.rgb = RGBColor(0, 0, 0)  # Black
-    
-    # Create text box stretching from left to right edge
-    width = slide_width  # Full width of slide
-    height = Inches(7)  # Keep reasonable height
-    left = 0  # Start from leftmost edge
-    top = (slide_height - height) / 2  # Center vertically
-    
-    textbox = slide.shapes.add_textbox(left, top, width, height)
-    text_frame = textbox.text_frame
-    text_frame.word_wrap = True
-    text_frame.vertical_anchor = MSO_ANCHOR.MIDDLE  # Middle vertical alignment
-    text_frame.margin_left = Inches(0.5)  # Small padding from left edge
-    text_frame.margin_right = Inches(0.5)  # Small padding from right edge
-    text_frame.margin_top = Inches(0.5)
-    text_frame.margin_bottom = Inches(0.5)
-    
-    # Clear default paragraph
-    text_frame.clear()
-    
-    # Add text with formatting
-    paragraph = text_frame.paragraphs[0]
-    paragraph.alignment = PP_ALIGN.CENTER  # Center alignment
-    paragraph.space_after = Pt(0)
-    
-    run = paragraph.add_run()
-    run.text = text  # Preserve original case
-    font = run.font
-    
-    # Check if text is all uppercase (all caps)
-    is_all_caps = text.isupper() and any(c.isalpha() for c in text)
-    
-    # Set font properties: use title settings if it's marked as title OR if it's all caps
-    if is_title or is_all_caps:
-        font.name = title_font  # Use selected title font
-        font.size = Pt(title_font_size)  # Use selected title font size
-        font.color.rgb = RGBColor(*title_color)  # Use selected title color
-        font.bold = True  # Bold for titles
-    else:
-        font.name = verse_font  # Use selected verse font
-        font.size = Pt(verse_font_size)  # Use selected verse font size
-        font.color.rgb = RGBColor(*verse_color)  # Use selected verse color
-        font.bold = False
-    
-    return slide
+@st.cache_resource
+def get_extract_executor(workers, pool):
+    """Worker pool shared by every session, so merges don't pay pool start-up"""
+    return make_extract_executor(workers, pool)
 
-def create_template_powerpoint(title_color, verse_color, title_font_size, verse_font_size, title_font, verse_font, background_image=None):
-    """Create a PowerPoint template with 1 title slide and 1 verse slide"""
-    template_prs = Presentation()
-    
-    # Set slide dimensions to 16:9 Widescreen aspect ratio
-    template_prs.slide_width = Inches(13.33)
-    template_prs.slide_height = Inches(7.5)
-    
-    # Remove default empty slide
-    if template_prs.slides:
-        template_prs.slides.remove(template_prs.slides[0])
-    
-    # Create title slide
-    create_formatted_slide(template_prs, "YOUR TITLE HERE", True, title_color, verse_color, title_font_size, verse_font_size, title_font, verse_font, background_image)
-    
-    # Create verse slide
-    create_formatted_slide(template_prs, "Your verse text here\nYou can add multiple lines\nEach line will appear on the slide", False, title_color, verse_color, title_font_size, verse_font_size, title_font, verse_font, background_image)
-    
-    return template_prs
+@st.cache_resource
+def get_file_spool():
+    """Upload spool shared by every session"""
+    return FileSpool(SPOOL_DIR, SPOOL_QUOTA_MB * 1024 * 1024)
 
-def create_template_txt():
-    """Create a .txt template with TITLE: format"""
-    template_content = """TITLE: Your Title Here
+@st.cache_resource
+def get_extract_cache():
+    """Extraction cache shared by every session"""
+    return ExtractionCache(disk_dir=CACHE_DIR, max_disk_bytes=CACHE_DISK_MB * 1024 * 1024)
 
-Your verse text here
-You can add multiple lines
-Each line will appear on the slide
+@st.cache_resource
+def get_library():
+    """Deck library shared by every session"""
+    return DeckLibrary(LIBRARY_DIR)
 
-TITLE: Another Title (Optional)
+@st.cache_resource
+def get_preview_executor():
+    """Thread pool drawing slide previews, shared by every session"""
+    return ThreadPoolExecutor(max_workers=PREVIEW_WORKERS, thread_name_prefix='preview')
 
-More verse text here
-Add as many titles and verses as you need
-Separate slides with blank lines"""
-    return template_content
+@st.cache_resource
+def get_job_queue():
+    """Merge job queue shared by every session"""
+    return JobQueue(JOB_WORKERS, JOB_QUEUE, RESULT_TTL)
 
 # Initialize session state for file ordering
 if 'file_order' not in st.session_state:
@@ -240,8 +120,86 @@ if 'verse_font' not in st.session_state:
     st.session_state.verse_font = 'Arial'  # Default Arial
 if 'background_image' not in st.session_state:
     st.session_state.background_image = None
+if 'background_encoding' not in st.session_state:
+    st.session_state.background_encoding = 'png'
+if 'background_jpeg_quality' not in st.session_state:
+    st.session_state.background_jpeg_quality = 85
+if 'background_mode' not in st.session_state:
+    st.session_state.background_mode = 'picture'  # Picture shape on every slide
+if 'text_fit' not in st.session_state:
+    st.session_state.text_fit = 'off'  # Keep the chosen sizes even if text overflows
 if 'txt_files_dict' not in st.session_state:
     st.session_state.txt_files_dict = {}
+if 'merger' not in st.session_state:
+    st.session_state.merger = None  # IncrementalMerger, created by the first merge
+if 'merge_job_id' not in st.session_state:
+    st.session_state.merge_job_id = None
+if 'merge_inputs' not in st.session_state:
+    st.session_state.merge_inputs = None  # merge_inputs_digest() when the merge job was submitted
+if 'result_inputs' not in st.session_state:
+    st.session_state.result_inputs = None  # merge_inputs_digest() when the merge result was last drawn
+if 'dedup_mode' not in st.session_state:
+    st.session_state.dedup_mode = 'off'  # Keep every slide
+
+def run_merge_job(progress, merger, items, style, digests, executor, cache, spool, profile=False, trace_memory=False, dedup='off'):
+    """Merge job body: merge into a spooled temp file and return it with the merge stats and timings"""
+    from merge_engine import ZIP_COMPRESS_LEVEL, spooled_output
+
+    output = spooled_output(OUTPUT_MEMORY_MB * 1024 * 1024)
+    metrics = MergeMetrics(trace_memory)
+    merge_kwargs = dict(output=output, digests=digests, executor=executor, cache=cache,
+                        compresslevel=int(ZIP_LEVEL) if ZIP_LEVEL else ZIP_COMPRESS_LEVEL,
+                        progress=progress, metrics=metrics, dedup=dedup)
+    profile_path = None
+    # Uploads from other sessions must not evict the input files while they are read
+    spool.pin(digests)
+    try:
+        if profile:
+            extension = 'html' if PROFILER == 'pyinstrument' else 'prof'
+            profile_path = os.path.join(PROFILE_DIR, f"merge-{time.strftime('%Y%m%d-%H%M%S')}.{extension}")
+            profile_call(profile_path, merger.merge, items, style, profiler=PROFILER, **merge_kwargs)
+        else:
+            merger.merge(items, style, **merge_kwargs)
+    finally:
+        spool.unpin(digests)
+    # Downloads read it through a lock, since the job queue closes it when the result expires
+    return {'output': SharedFile(output), 'stats': dict(merger.last_stats), 'metrics': metrics.as_dict(), 'profile_path': profile_path}
+
+def timing_rows(metrics):
+    """Merge metrics formatted for the timing breakdown table"""
+    rows = []
+    for name, stage in metrics['stages'].items():
+        rows.append({
+            'Stage': name,
+            'Wall (s)': f"{stage['wall_seconds']:.3f}",
+            'CPU (s)': f"{stage['cpu_seconds']:.3f}",
+            'Slides': stage['items'],
+            'Slides/s': f"{stage['items_per_second']:.0f}" if stage['items'] and stage['items_per_second'] else '',
+            'In (MB)': f"{stage['bytes_in'] / 1e6:.2f}",
+            'Out (MB)': f"{stage['bytes_out'] / 1e6:.2f}",
+            'Peak alloc (MB)': f"{stage['peak_bytes'] / 1e6:.2f}" if stage['peak_bytes'] is not None else '',
+        })
+    return rows
+
+def current_style():
+    """Collect the merge style settings from session state"""
+    return {
+        'title_color': st.session_state.title_color,
+        'verse_color': st.session_state.verse_color,
+        'title_font_size': st.session_state.title_font_size,
+        'verse_font_size': st.session_state.verse_font_size,
+        'title_font': st.session_state.title_font,
+        'verse_font': st.session_state.verse_font,
+        'background_image': st.session_state.background_image,
+        'background_mode': st.session_state.background_mode,
+        'text_fit': st.session_state.text_fit,
+    }
+
+def template_pptx(style):
+    """PowerPoint template for a style, built when the download is requested"""
+    from merge_engine import template_pptx_bytes
+
+    return template_pptx_bytes(style)
 
 # Common fonts compatible across all systems
 COMMON_FONTS = [
@@ -288,6 +246,21 @@ with font_col2:
     verse_font_size = st.number_input("Verse Font Size (pt)", min_value=10, max_value=200, value=st.session_state.verse_font_size, step=1, key="verse_font_size_input")
     st.session_state.verse_font_size = int(verse_font_size)
 
+text_fit_modes = {
+    'off': "Keep the size (text may overflow)",
+    'shrink': "Shrink the text",
+    'split': "Split long verses over more slides",
+}
+st.session_state.text_fit = st.radio(
+    "Text that does not fit on a slide",
+    list(text_fit_modes),
+    index=list(text_fit_modes).index(st.session_state.text_fit),
+    format_func=text_fit_modes.get,
+    key="text_fit_radio",
+    horizontal=True,
+    help="Measured with the chosen fonts; a split line that still does not fit is shrunk"
+)
+
 st.subheader("Font Family Settings")
 font_family_col1, font_family_col2 = st.columns(2)
 
@@ -304,32 +277,16 @@ st.write("Download templates to get started. Edit them and upload back to the ap
 col_template_pptx, col_template_txt = st.columns(2)
 
 with col_template_pptx:
-    # Generate template data
-    try:
-        template_prs = create_template_powerpoint(
-            st.session_state.title_color,
-            st.session_state.verse_color,
-            st.session_state.title_font_size,
-            st.session_state.verse_font_size,
-            st.session_state.title_font,
-            st.session_state.verse_font,
-            st.session_state.background_image
-        )
-        template_output = BytesIO()
-        template_prs.save(template_output)
-        template_output.seek(0)
-        pptx_template_data = template_output.getvalue()
-        
-        st.download_button(
-            label="📥 Download PowerPoint Template",
-            data=pptx_template_data,
-            file_name="powerpoint_template.pptx",
-            mime="application/vnd.openxmlformats-officedocument.presentationml.presentation",
-            key="download_pptx_template_file",
-            type="primary"
-        )
-    except Exception as e:
-        st.error(f"Error creating PowerPoint template: {str(e)}")
+    # Template is only built when the download is requested, and memoized per style
+    template_style = current_style()
+    st.download_button(
+        label="📥 Download PowerPoint Template",
+        data=lambda: template_pptx(template_style),
+        file_name="powerpoint_template.pptx",
+        mime=PPTX_MIME,
+        key="download_pptx_template_file",
+        type="primary"
+    )
 
 with col_template_txt:
     # Generate template data
@@ -376,36 +333,99 @@ background_image_file = st.file_uploader(
 if background_image_file:
     # Read image data
     image_data = background_image_file.read()
-    # Resize to 1920x1080
-    resized_image_data = resize_image_to_1920x1080(image_data)
+    background_encodings = {
+        'png': "PNG (lossless)",
+        'jpeg': "JPEG (smaller file)",
+        'passthrough': "Keep original if already 1920x1080",
+    }
+    encoding_col, quality_col = st.columns(2)
+    with encoding_col:
+        background_encoding = st.selectbox(
+            "Background encoding",
+            list(background_encodings),
+            index=list(background_encodings).index(st.session_state.background_encoding),
+            format_func=background_encodings.get,
+            key="background_encoding_select"
+        )
+        st.session_state.background_encoding = background_encoding
+    with quality_col:
+        if background_encoding == 'jpeg':
+            jpeg_quality = st.slider("JPEG quality", min_value=50, max_value=95, value=st.session_state.background_jpeg_quality, step=5, key="background_jpeg_quality_slider")
+            st.session_state.background_jpeg_quality = int(jpeg_quality)
+    # Resize to 1920x1080 (memoized, so reruns reuse the encoded image)
+    from merge_engine import resize_image_to_1920x1080
+
+    resized_image_data = resize_image_to_1920x1080(image_data, background_encoding, st.session_state.background_jpeg_quality)
     st.session_state.background_image = resized_image_data
-    st.success(f"✅ Background image loaded and resized to 1920x1080: {background_image_file.name}")
+    st.success(f"✅ Background image loaded and resized to 1920x1080: {background_image_file.name} ({len(resized_image_data) / 1024:.0f} KB)")
     # Display image preview
     background_image_file.seek(0)  # Reset file pointer
     st.image(background_image_file, width=300)
+    background_modes = {
+        'picture': "Picture on every slide",
+        'layout': "On the slide layout (smaller file)",
+    }
+    background_mode = st.radio(
+        "Background placement",
+        list(background_modes),
+        index=list(background_modes).index(st.session_state.background_mode),
+        format_func=background_modes.get,
+        key="background_mode_radio",
+        horizontal=True
+    )
+    st.session_state.background_mode = background_mode
     if st.button("Remove Background Image", key="remove_bg_image"):
         st.session_state.background_image = None
         st.rerun()
 else:
     st.session_state.background_image = None
 
+def unique_item_id(name):
+    """`name`, or `name (2)`, `name (3)`... if a file in this merge or in an uploader already uses it"""
+    taken = set(st.session_state.uploaded_files_dict) | set(st.session_state.txt_files_dict)
+    for uploader_key in ('pptx_file_uploader', 'txt_file_uploader'):
+        taken.update(file.name for file in st.session_state.get(uploader_key) or [])
+    stem, extension = os.path.splitext(name)
+    item_id, number = name, 1
+    while item_id in taken:
+        number += 1
+        item_id = f"{stem} ({number}){extension}"
+    return item_id
+
+def rename_item(files_dict, item_id, new_item_id):
+    """Move a file to a new id, keeping its place in the merge order"""
+    files_dict[new_item_id] = files_dict.pop(item_id)
+    order = st.session_state.file_order
+    if item_id in order:
+        order[order.index(item_id)] = new_item_id
+
 # Update session state when new files are uploaded
-# Store file bytes in session state so files persist across reruns
+# Store file handles in session state so files persist across reruns
 if uploaded_files is not None and len(uploaded_files) > 0:
     # Process newly uploaded files
     for file in uploaded_files:
-        # Read ALL file bytes and store in session state
-        # Make sure we read from the beginning
-        file.seek(0)
-        file_bytes = file.read()
-        # Create a copy of the bytes to ensure we have all the data
-        file_bytes = bytes(file_bytes)
+        # Skip files already stored from this same upload (keeps their hash)
+        existing = st.session_state.uploaded_files_dict.get(file.name)
+        if existing and existing.get('library'):
+            # A library file was added under this name first; uploads keep their own names
+            rename_item(st.session_state.uploaded_files_dict, file.name, unique_item_id(file.name))
+            existing = None
+        file_id = getattr(file, 'file_id', None)
+        if existing and file_id and existing.get('file_id') == file_id:
+            if file.name not in st.session_state.file_order:
+                st.session_state.file_order.append(file.name)
+            continue
+        
+        # Stream the file into the shared spool; session state only keeps a handle
+        sha256, size = get_file_spool().put(file)
         
-        # Store file info: name and bytes
+        # Store file info: name, content hash (spool key, also used by the extraction cache) and size
         file_info = {
             'name': file.name,
-            'bytes': file_bytes,
-            'type': 'pptx'
+            'type': 'pptx',
+            'sha256': sha256,
+            'size': size,
+            'file_id': file_id
         }
         st.session_state.uploaded_files_dict[file.name] = file_info
         
@@ -418,21 +438,32 @@ if uploaded_files is not None and len(uploaded_files) > 0:
     # This allows multiple files to be uploaded and kept
 
 # Also handle txt files in the ordering
-# Store file bytes in session state so files persist across reruns
+# Store file handles in session state so files persist across reruns
 if uploaded_txt_files is not None and len(uploaded_txt_files) > 0:
     # Process newly uploaded txt files
     for file in uploaded_txt_files:
-        # Read file bytes and store in session state
-        file.seek(0)  # Reset file pointer
-        file_bytes = file.read()
-        # Create a copy of the bytes to ensure we have all the data
-        file_bytes = bytes(file_bytes)
+        # Skip files already stored from this same upload (keeps their hash)
+        existing = st.session_state.txt_files_dict.get(file.name)
+        if existing and existing.get('library'):
+            # A library file was added under this name first; uploads keep their own names
+            rename_item(st.session_state.txt_files_dict, file.name, unique_item_id(file.name))
+            existing = None
+        file_id = getattr(file, 'file_id', None)
+        if existing and file_id and existing.get('file_id') == file_id:
+            if file.name not in st.session_state.file_order:
+                st.session_state.file_order.append(file.name)
+            continue
         
-        # Store file info: name and bytes
+        # Stream the file into the shared spool; session state only keeps a handle
+        sha256, size = get_file_spool().put(file)
+        
+        # Store file info: name, content hash (spool key, also used by the extraction cache) and size
         file_info = {
             'name': file.name,
-            'bytes': file_bytes,
-            'type': 'txt'
+            'type': 'txt',
+            'sha256': sha256,
+            'size': size,
+            'file_id': file_id
         }
         st.session_state.txt_files_dict[file.name] = file_info
         
@@ -443,149 +474,278 @@ if uploaded_txt_files is not None and len(uploaded_txt_files) > 0:
     # Don't automatically remove files - let the user remove them via the Remove button
     # Files persist in session state even if not in current upload
 
-# Display file reordering interface
-if st.session_state.file_order:
-    st.subheader("Arrange Files (use buttons to reorder)")
-    
-    # Filter to only show valid files (remove any manual slide references)
-    valid_file_order = [item_id for item_id in st.session_state.file_order 
-                       if not item_id.startswith("MANUAL_SLIDE_") and 
-                       (item_id in st.session_state.uploaded_files_dict or item_id in st.session_state.txt_files_dict)]
-    
-    # Update file_order to remove invalid references
-    if len(valid_file_order) != len(st.session_state.file_order):
-        st.session_state.file_order = valid_file_order
-    
-    # Display files with reordering controls
-    for i, item_id in enumerate(valid_file_order):
-        col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
-        
-        with col1:
-            st.write(f"**{i+1}.** {item_id}")
-        
-        with col2:
-            if st.button("⬆️ Up", key=f"up_{i}", disabled=(i == 0)):
-                if i > 0:
-                    valid_file_order[i], valid_file_order[i-1] = valid_file_order[i-1], valid_file_order[i]
-                    st.session_state.file_order = valid_file_order
-                    st.rerun()
-        
-        with col3:
-            if st.button("⬇️ Down", key=f"down_{i}", disabled=(i == len(valid_file_order) - 1)):
-                if i < len(valid_file_order) - 1:
-                    valid_file_order[i], valid_file_order[i+1] = valid_file_order[i+1], valid_file_order[i]
-                    st.session_state.file_order = valid_file_order
-                    st.rerun()
-        
-        with col4:
-            if st.button("🗑️ Remove", key=f"remove_{i}"):
-                valid_file_order.remove(item_id)
-                st.session_state.file_order = valid_file_order
-                if item_id in st.session_state.uploaded_files_dict:
-                    del st.session_state.uploaded_files_dict[item_id]
-                elif item_id in st.session_state.txt_files_dict:
-                    del st.session_state.txt_files_dict[item_id]
-                st.rerun()
-
-# Get ordered list of files (both pptx and txt)
-ordered_items = []
-for item_id in st.session_state.file_order:
+def add_library_item(entry):
+    """Put a library file into this merge; its stored slides seed the extraction cache so it is not parsed again"""
+    with open(get_library().path(entry['sha256']), 'rb') as f:
+        sha256, size = get_file_spool().put(f)
+    get_extract_cache().put(cache_key(entry['type'], sha256), get_library().slides(sha256, entry['type']))
+    files_dict = st.session_state.uploaded_files_dict if entry['type'] == 'pptx' else st.session_state.txt_files_dict
+    for item_id, file_info in files_dict.items():
+        if file_info['sha256'] == sha256:
+            # Already in this merge, maybe under another name
+            if item_id not in st.session_state.file_order:
+                st.session_state.file_order.append(item_id)
+            return
+    # Same-named files that differ get their own entry instead of replacing each other
+    item_id = unique_item_id(entry['name'])
+    files_dict[item_id] = {
+        'name': entry['name'],
+        'type': entry['type'],
+        'sha256': sha256,
+        'size': size,
+        'file_id': None,
+        'library': True
+    }
+    st.session_state.file_order.append(item_id)
+
+def move_item(index, offset):
+    """Swap a file with its neighbour in the merge order"""
+    order = st.session_state.file_order
+    order[index], order[index + offset] = order[index + offset], order[index]
+
+def remove_item(item_id):
+    """Take a file out of the merge"""
+    st.session_state.file_order.remove(item_id)
     if item_id in st.session_state.uploaded_files_dict:
-        # Get file bytes from session state and create BytesIO object
-        file_info = st.session_state.uploaded_files_dict[item_id]
-        # Create a fresh BytesIO object for each file and ensure it's at the start
-        file_bytes_io = BytesIO(file_info['bytes'])
-        file_bytes_io.seek(0)  # Ensure we're at the start
-        ordered_items.append(('pptx', file_bytes_io))
+        del st.session_state.uploaded_files_dict[item_id]
     elif item_id in st.session_state.txt_files_dict:
-        # Get file bytes from session state and create BytesIO object
-        file_info = st.session_state.txt_files_dict[item_id]
-        file_bytes_io = BytesIO(file_info['bytes'])
-        file_bytes_io.seek(0)  # Ensure we're at the start
-        ordered_items.append(('txt', file_bytes_io))
-
-# Check if we have any content to merge
-has_content = len(ordered_items) > 0
+        del st.session_state.txt_files_dict[item_id]
+
+def merge_job_status():
+    """Status of this session's merge job, or None"""
+    return get_job_queue().status(st.session_state.merge_job_id) if st.session_state.merge_job_id else None
+
+def merge_inputs_digest():
+    """Digest of what a merge would be made from now: the files in order, the style and the duplicate handling"""
+    from merge_engine import style_digest
+
+    files = []
+    for item_id in st.session_state.file_order:
+        file_info = st.session_state.uploaded_files_dict.get(item_id) or st.session_state.txt_files_dict.get(item_id)
+        if file_info is not None:
+            files.append([item_id, file_info['type'], file_info['sha256']])
+    inputs = [files, style_digest(current_style()), st.session_state.dedup_mode]
+    return hashlib.sha256(json.dumps(inputs).encode('utf-8')).hexdigest()
+
+def preview_slides(items, digests, dedup):
+    """(text, title_styled) of every slide the merge would render, from the extraction cache where possible"""
+    deduplicator = SlideDeduplicator(dedup)
+    slides = []
+    for batch in extract_items(items, cache=get_extract_cache(), digests=digests):
+        batch = deduplicator.filter(batch)
+        slides.extend(zip(batch.texts, batch.title_styled()))
+    return slides
 
-if has_content and st.button("Merge PowerPoints"):
-    try:
-        merged_presentation = Presentation()
-        
-        # Set slide dimensions to 16:9 Widescreen aspect ratio
-        # Width: 13.33 inches, Height: 7.5 inches
-        merged_presentation.slide_width = Inches(13.33)  # 16:9 Widescreen width
-        merged_presentation.slide_height = Inches(7.5)  # 16:9 Widescreen height
-        
-        # Remove default empty slide
-        if merged_presentation.slides:
-            merged_presentation.slides.remove(merged_presentation.slides[0])
-        
-        slide_index = 0
-        
-        for item_type, item_data in ordered_items:
-            if item_type == 'pptx':
-                # Process PowerPoint file
-                # Ensure BytesIO is at the start before creating Presentation
-                item_data.seek(0)
-                prs = Presentation(item_data)
-                first_slide_found = False  # Track if we've found the first slide with text in this file
-                first_all_caps_found = False  # Track if we've found the first all-caps slide in this file
-                
-                for slide in prs.slides:
-                    # Extract text from slide
-                    text = extract_text_from_slide(slide)
-                    
-                    if text:  # Only create slide if there's text
-                        # Check if text is all caps
-                        is_all_caps_text = is_all_caps(text)
-                        
-                        # Determine if it's a title slide:
-                        # - First slide of each PowerPoint file (regardless of caps)
-                        # - OR first all-caps slide in each PowerPoint file
-                        is_title = False
-                        if not first_slide_found:
-                            # First slide with text in this file is always a title
-                            is_title = True
-                            first_slide_found = True
-                        elif is_all_caps_text and not first_all_caps_found:
-                            # First all-caps slide in this file is also a title
-                            is_title = True
-                            first_all_caps_found = True
-                        
-                        # Create formatted slide
-                        create_formatted_slide(merged_presentation, text, is_title, st.session_state.title_color, st.session_state.verse_color, st.session_state.title_font_size, st.session_state.verse_font_size, st.session_state.title_font, st.session_state.verse_font, st.session_state.background_image)
-                        slide_index += 1
-            
-            elif item_type == 'txt':
-                # Process text file
-                item_data.seek(0)  # Ensure we're at the start
-                txt_content = item_data.read()
-                slides = parse_txt_file(txt_content)
-                
-                for slide_data in slides:
-                    # Create title slide if title exists
-                    if slide_data['title']:
-                        create_formatted_slide(merged_presentation, slide_data['title'], True, st.session_state.title_color, st.session_state.verse_color, st.session_state.title_font_size, st.session_state.verse_font_size, st.session_state.title_font, st.session_state.verse_font, st.session_state.background_image)
-                        slide_index += 1
-                    
-                    # Create verse slide(s) if verses exist
-                    if slide_data['verses']:
-                        verses_text = '\n'.join(slide_data['verses'])
-                        create_formatted_slide(merged_presentation, verses_text, False, st.session_state.title_color, st.session_state.verse_color, st.session_state.title_font_size, st.session_state.verse_font_size, st.session_state.title_font, st.session_state.verse_font, st.session_state.background_image)
-                        slide_index += 1
-        
-        output = BytesIO()
-        merged_presentation.save(output)
-        output.seek(0)
-        
-        st.success("✅ PowerPoints merged successfully!")
-        
-        st.download_button(
-            label="⬇️ Download merged PowerPoint",
-            data=output,
-            file_name="merged_presentation.pptx",
-            mime="application/vnd.openxmlformats-officedocument.presentationml.presentation"
+@st.fragment
+def merge_panel():
+    """Library, file order, previews and the Merge button; their clicks only rerun this part of the page"""
+    if LIBRARY_DIR:
+        st.markdown("## Library")
+        library_query = st.text_input("Search earlier decks and text files by name, title or lyrics", key="library_query")
+        for entry in get_library().search(library_query, limit=10):
+            col_entry, col_add = st.columns([5, 1])
+            with col_entry:
+                st.write(f"**{entry['name']}** ({entry['slides']} slides)")
+                if entry['snippet']:
+                    st.caption(entry['snippet'].replace('\n', ' / '))
+            with col_add:
+                st.button("Add", key=f"library_add_{entry['type']}_{entry['sha256']}", on_click=add_library_item, args=(entry,))
+        if st.session_state.file_order and st.button("Save current files to the library"):
+            saved = 0
+            for item_id in st.session_state.file_order:
+                file_info = st.session_state.uploaded_files_dict.get(item_id) or st.session_state.txt_files_dict.get(item_id)
+                if file_info is None or not get_file_spool().exists(file_info['sha256']):
+                    continue
+                # Reuse slides already extracted for an earlier merge
+                slides = get_extract_cache().get(cache_key(file_info['type'], file_info['sha256']))
+                entry = get_library().add(file_info['name'], file_info['type'], get_file_spool().path(file_info['sha256']),
+                                          slides=slides, sha256=file_info['sha256'])
+                saved += entry['new']
+            library_stats = get_library().stats()
+            st.success(f"Saved {saved} new files; the library now holds {library_stats['items']} files")
+
+    # Display file reordering interface
+    if st.session_state.file_order:
+        st.subheader("Arrange Files (use buttons to reorder)")
+
+        # Filter to only show valid files (remove any manual slide references)
+        valid_file_order = [item_id for item_id in st.session_state.file_order
+                           if not item_id.startswith("MANUAL_SLIDE_") and
+                           (item_id in st.session_state.uploaded_files_dict or item_id in st.session_state.txt_files_dict)]
+
+        # Update file_order to remove invalid references
+        if len(valid_file_order) != len(st.session_state.file_order):
+            st.session_state.file_order = valid_file_order
+
+        # Display files with reordering controls (the callbacks run before the panel redraws)
+        for i, item_id in enumerate(valid_file_order):
+            col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
+
+            with col1:
+                st.write(f"**{i+1}.** {item_id}")
+
+            with col2:
+                st.button("⬆️ Up", key=f"up_{i}", disabled=(i == 0), on_click=move_item, args=(i, -1))
+
+            with col3:
+                st.button("⬇️ Down", key=f"down_{i}", disabled=(i == len(valid_file_order) - 1), on_click=move_item, args=(i, 1))
+
+            with col4:
+                st.button("🗑️ Remove", key=f"remove_{i}", on_click=remove_item, args=(item_id,))
+
+    # Get ordered list of files (both pptx and txt)
+    ordered_items = []
+    ordered_digests = []
+    expired_items = []
+    for item_id in st.session_state.file_order:
+        if item_id in st.session_state.uploaded_files_dict:
+            file_info = st.session_state.uploaded_files_dict[item_id]
+        elif item_id in st.session_state.txt_files_dict:
+            file_info = st.session_state.txt_files_dict[item_id]
+        else:
+            continue
+        # Merge reads straight from the spooled file; touching it keeps it from eviction
+        if not get_file_spool().touch(file_info['sha256']):
+            expired_items.append(item_id)
+            continue
+        ordered_items.append((file_info['type'], get_file_spool().path(file_info['sha256'])))
+        ordered_digests.append(file_info['sha256'])
+
+    if expired_items:
+        st.warning(f"These files were removed from temporary storage, please upload them again: {', '.join(expired_items)}")
+
+    # Check if we have any content to merge
+    has_content = len(ordered_items) > 0
+
+    job_status = merge_job_status()
+    job_active = job_status is not None and job_status['state'] in ('queued', 'running')
+
+    if st.checkbox("👁️ Preview slides", key="show_previews",
+                   help="Draws the slides with the current colours, fonts and background without merging"):
+        from slide_preview import SAMPLE_SLIDES, fitted_slides, render_previews
+
+        slides = preview_slides(ordered_items, ordered_digests, st.session_state.dedup_mode) if has_content else SAMPLE_SLIDES
+        slides = fitted_slides(slides, current_style())
+        page_count = max(1, -(-len(slides) // PREVIEW_PAGE_SIZE))
+        page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, key="preview_page") if page_count > 1 else 1
+        first = (page - 1) * PREVIEW_PAGE_SIZE
+        # Only the visible page is drawn; previews are cached by text and style
+        page_slides = slides[first:first + PREVIEW_PAGE_SIZE]
+        previews = render_previews(page_slides, current_style(), executor=get_preview_executor())
+        preview_columns = st.columns(2)
+        for offset, png in enumerate(previews):
+            with preview_columns[offset % 2]:
+                st.image(png, caption=f"Slide {first + offset + 1}" if has_content else "Sample", width="stretch")
+
+    if has_content and not job_active:
+        dedup_modes = {
+            'off': "Keep all",
+            'consecutive': "Drop repeats of the previous slide",
+            'global': "Drop repeats of any earlier slide",
+        }
+        st.session_state.dedup_mode = st.radio(
+            "Duplicate slides",
+            list(dedup_modes),
+            index=list(dedup_modes).index(st.session_state.dedup_mode),
+            format_func=dedup_modes.get,
+            key="dedup_mode_radio",
+            horizontal=True,
+            help="Slides with the same text (ignoring extra spaces) and the same role count as duplicates"
         )
-    except Exception as e:
-        st.error(f"Error merging presentations: {str(e)}")
-        st.exception(e)
+        with st.expander("🩺 Diagnostics"):
+            st.checkbox("Profile the next merge", key="profile_merge",
+                        help=f"Writes a {PROFILER} profile of the merge to {PROFILE_DIR}")
+            st.checkbox("Trace memory allocations", key="trace_memory",
+                        help="Adds peak allocations to the timing breakdown (makes the merge slower)")
+
+    # Clicks here only rerun this panel; redraw the page when they change what the shown result was merged from
+    if st.session_state.result_inputs is not None and merge_inputs_digest() != st.session_state.result_inputs:
+        st.session_state.result_inputs = None
+        st.rerun()
+
+    if has_content and not job_active and st.button("Merge PowerPoints"):
+        if st.session_state.merger is None:
+            from incremental_merge import IncrementalMerger
+
+            # Keeps rendered slides between merges so reorders only re-link them
+            st.session_state.merger = IncrementalMerger()
+        try:
+            executor = get_extract_executor(EXTRACT_WORKERS, EXTRACT_POOL) if EXTRACT_WORKERS > 1 and len(ordered_items) > 1 else None
+            st.session_state.merge_job_id = get_job_queue().submit(
+                run_merge_job, st.session_state.merger, ordered_items, current_style(), ordered_digests,
+                executor, get_extract_cache(), get_file_spool(), files_total=len(ordered_items),
+                profile=st.session_state.get('profile_merge', False),
+                trace_memory=st.session_state.get('trace_memory', False),
+                dedup=st.session_state.dedup_mode,
+            )
+            st.session_state.merge_inputs = merge_inputs_digest()
+            st.rerun()  # The whole page, so the job's progress shows below
+        except QueueFull:
+            st.warning("The server is busy with other merges right now. Please try again in a minute.")
+
+merge_panel()
+
+@st.fragment(run_every=1.0)
+def merge_job_progress():
+    """Progress of the running merge job, refreshed every second"""
+    status = get_job_queue().status(st.session_state.merge_job_id)
+    if status is None or status['state'] not in ('queued', 'running'):
+        st.rerun()  # Finished: redraw the page with the result
+    if status['state'] == 'queued':
+        st.info("⏳ Waiting for a free merge worker...")
+    else:
+        fraction = status['files_done'] / status['files_total'] if status['files_total'] else 0.0
+        eta = f", about {status['eta_seconds']:.0f}s left" if status['eta_seconds'] is not None else ""
+        st.progress(fraction, text=f"Merged {status['files_done']} of {status['files_total']} files, "
+                                   f"{status['slides_rendered']} slides rendered{eta}")
+    if st.button("Cancel merge"):
+        get_job_queue().cancel(st.session_state.merge_job_id)
+
+job_status = merge_job_status()
+result = get_job_queue().result(st.session_state.merge_job_id) if job_status is not None and job_status['state'] == 'done' else None
+st.session_state.result_inputs = merge_inputs_digest() if result is not None else None
+if job_status is not None and job_status['state'] in ('queued', 'running'):
+    merge_job_progress()
+elif result is not None and st.session_state.result_inputs != st.session_state.merge_inputs:
+    # Reordered, removed, added or restyled since: that deck no longer matches the page
+    st.info("The files or style changed since the last merge. Merge again to download a matching deck.")
+elif result is not None:
+    stats = result['stats']
+    st.success("✅ PowerPoints merged successfully!")
+    reused = stats['files'] - stats['files_rendered']
+    reuse_note = f"; {reused} reused from the previous merge" if reused else ""
+    st.caption(f"Rendered {stats['files_rendered']} of {stats['files']} files in {job_status['elapsed_seconds']:.1f}s{reuse_note}")
+    counters = result['metrics']['counters']
+    if 'dedup_slides_saved' in counters:
+        st.caption(f"Dropped {counters['dedup_slides_saved']} duplicate slides, "
+                   f"saving {counters['dedup_bytes_saved'] / 1e3:.1f} KB of slide XML")
+    if counters.get('fit_slides_shrunk') or counters.get('fit_slides_split'):
+        st.caption(f"Fitted overflowing text: {counters['fit_slides_shrunk']} slides shrunk, "
+                   f"{counters['fit_slides_split']} split into {counters['fit_slides_added']} extra slides")
+    cache_stats = get_extract_cache().stats()
+    st.caption(f"Extraction cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses since server start")
+
+    # The deck stays in its temp file until the download is actually requested
+    st.download_button(
+        label="⬇️ Download merged PowerPoint",
+        data=result['output'].read_all,
+        file_name="merged_presentation.pptx",
+        mime=PPTX_MIME
+    )
+
+    with st.expander("⏱️ Timing breakdown"):
+        st.table(timing_rows(result['metrics']))
+        st.caption(f"Total {result['metrics']['total_seconds']:.3f}s")
+        if result['profile_path']:
+            st.caption(f"Profile written to {result['profile_path']}")
+elif job_status is not None and job_status['state'] == 'failed':
+    st.error(f"Error merging presentations: {job_status['error']}")
+    failed_job = get_job_queue().get(st.session_state.merge_job_id)
+    if failed_job is not None:
+        st.exception(failed_job.error)
+elif job_status is not None and job_status['state'] == 'cancelled':
+    st.info("Merge cancelled.")
+elif st.session_state.merge_job_id:
+    # The job and its deck were dropped PPTX_MERGER_RESULT_TTL seconds after finishing
+    st.session_state.merge_job_id = None
+    st.info("The merged deck is no longer kept. Merge again to download it.")
@@ -0,0 +1,177 @@
+"""Startup time and per-click latency of the Streamlit app.
+
+Startup is measured in fresh interpreters: the first run of app.py (what the
+first page load waits for once Streamlit itself is imported), which modules
+it left loaded, and how long a spawned extraction worker takes to extract its
+first file. Clicks are then replayed with Streamlit's AppTest against a
+session holding --files synthetic decks and text files, with previews open:
+moving a file down, turning a preview page, changing the verse font size and
+opening the previews. AppTest reruns the whole script for every click, so
+these are upper bounds; in a browser, clicks inside the file panel only rerun
+that fragment.
+
+    python benchmarks/bench_app.py
+    python benchmarks/bench_app.py --files 12 --repeat 20 --json app.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from extraction import make_extract_executor  # noqa: E402
+from file_spool import FileSpool  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, 'app.py')
+SEED = 1234
+# Modules a first page load should not need
+HEAVY_MODULES = ('pptx', 'PIL.Image', 'merge_engine', 'incremental_merge', 'slide_preview')
+
+# Run in a fresh interpreter: prints the import and first-run times as JSON
+_STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+app = AppTest.from_file(sys.argv[1], default_timeout=120).run()
+done = time.perf_counter()
+print(json.dumps({'streamlit_import': imported - start, 'first_run': done - imported,
+                  'errors': [str(e.value) for e in app.exception],
+                  'loaded': [name for name in sys.argv[2:] if name in sys.modules]}))
+"""
+
+
+def make_inputs(spool, files, rng):
+    """Put alternating synthetic decks and TITLE:-format text files into the spool; return their file infos"""
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    infos = []
+    for index in range(files):
+        if index % 2:
+            lines = []
+            for song in range(3):
+                lines += [f"TITLE: SONG {index}-{song}", ""]
+                lines += [f"Verse line {line} {rng.random():.6f}" for line in range(4)] + [""]
+            name, item_type, data = f"songs{index}.txt", 'txt', '\n'.join(lines).encode('utf-8')
+        else:
+            prs = Presentation()
+            for slide_index in range(8):
+                slide = prs.slides.add_slide(prs.slide_layouts[6])
+                slide.shapes.add_textbox(Inches(1), Inches(1), Inches(8), Inches(2)).text_frame.text = f"Slide {slide_index} {rng.random()}"
+            buffer = BytesIO()
+            prs.save(buffer)
+            name, item_type, data = f"deck{index}.pptx", 'pptx', buffer.getvalue()
+        sha256, size = spool.put(data)
+        infos.append({'name': name, 'type': item_type, 'sha256': sha256, 'size': size, 'file_id': None})
+    return infos
+
+
+def measure_startup(runs, env):
+    """Median seconds of the app's first run and of importing Streamlit, over `runs` fresh interpreters"""
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', _STARTUP_PROBE, APP_PATH, *HEAVY_MODULES],
+                                capture_output=True, text=True, env=env, cwd=ROOT, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'streamlit_import_seconds': statistics.median(r['streamlit_import'] for r in results),
+        'first_run_seconds': statistics.median(r['first_run'] for r in results),
+        'loaded_heavy_modules': results[-1]['loaded'],
+        'errors': results[-1]['errors'],
+    }
+
+
+def measure_worker_start(runs, item):
+    """Median seconds from creating a one-process extraction pool to its first extracted file"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        with make_extract_executor(1, 'process') as executor:
+            list(executor.map(_extract, [item]))
+            times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def _extract(item):
+    from extraction import extract_item
+
+    return len(extract_item(*item))
+
+
+def measure_clicks(infos, repeat):
+    """{action: [seconds, ...]} of replayed clicks on a session holding `infos`"""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP_PATH, default_timeout=120)
+    pptx_infos = {info['name']: info for info in infos if info['type'] == 'pptx'}
+    txt_infos = {info['name']: info for info in infos if info['type'] == 'txt'}
+    app.session_state['uploaded_files_dict'] = pptx_infos
+    app.session_state['txt_files_dict'] = txt_infos
+    app.session_state['file_order'] = [info['name'] for info in infos]
+    app.run()
+    app.checkbox(key='show_previews').check().run()
+
+    def timed(action):
+        start = time.perf_counter()
+        action().run()
+        if app.exception:
+            raise RuntimeError(f"app raised: {app.exception[0].value}")
+        return time.perf_counter() - start
+
+    clicks = {'move_file': [], 'preview_page': [], 'verse_font_size': [], 'open_previews': []}
+    for run in range(repeat):
+        clicks['move_file'].append(timed(lambda: app.button(key='down_0').click()))
+        clicks['preview_page'].append(timed(lambda: app.number_input(key='preview_page').set_value(2 if run % 2 == 0 else 1)))
+        clicks['verse_font_size'].append(timed(lambda: app.number_input(key='verse_font_size_input').set_value(66 if run % 2 == 0 else 65)))
+        app.checkbox(key='show_previews').uncheck().run()
+        clicks['open_previews'].append(timed(lambda: app.checkbox(key='show_previews').check()))
+    return clicks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=6, help="synthetic files in the session (default: 6)")
+    parser.add_argument('--repeat', type=int, default=10, help="times each click is replayed (default: 10)")
+    parser.add_argument('--startup-runs', type=int, default=3, help="fresh interpreters started for the startup times (default: 3)")
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as spool_dir:
+        # The app's spool is read from the environment, so clicks see the files put here
+        os.environ['PPTX_MERGER_SPOOL_DIR'] = spool_dir
+        os.environ.setdefault('PPTX_MERGER_LOG_LEVEL', 'WARNING')
+        spool = FileSpool(spool_dir)
+        infos = make_inputs(spool, max(1, args.files), random.Random(SEED))
+
+        startup = measure_startup(args.startup_runs, dict(os.environ))
+        startup['worker_first_file_seconds'] = measure_worker_start(args.startup_runs, (infos[0]['type'], spool.path(infos[0]['sha256'])))
+        clicks = measure_clicks(infos, args.repeat)
+
+    print(f"streamlit import      {startup['streamlit_import_seconds'] * 1000:8.0f} ms")
+    print(f"app first run         {startup['first_run_seconds'] * 1000:8.0f} ms  (heavy modules loaded: {', '.join(startup['loaded_heavy_modules']) or 'none'})")
+    print(f"worker first file     {startup['worker_first_file_seconds'] * 1000:8.0f} ms")
+    if startup['errors']:
+        print(f"app errors: {startup['errors']}", file=sys.stderr)
+    print(f"{'click':<20} {'median ms':>10} {'max ms':>8}")
+    for name, times in clicks.items():
+        print(f"{name:<20} {statistics.median(times) * 1000:>10.1f} {max(times) * 1000:>8.1f}")
+
+    if args.json:
+        report = {'files': args.files, 'startup': startup,
+                  'clicks': {name: {'median_seconds': statistics.median(times), 'max_seconds': max(times)} for name, times in clicks.items()}}
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    return 1 if startup['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
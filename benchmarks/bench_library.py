@@ -0,0 +1,78 @@
+"""Search latency of the deck library as it grows.
+
+Fills a throwaway library with N synthetic decks (random words, a title slide
+and several verse slides each; stored with pre-built slides so no .pptx has
+to be generated) and times single-word, multi-word and prefix searches,
+reporting the median, 95th percentile and worst latency per query kind.
+
+    python benchmarks/bench_library.py
+    python benchmarks/bench_library.py --decks 50000 --queries 500
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deck_library import DeckLibrary  # noqa: E402
+from slide_ir import SlideBatch  # noqa: E402
+
+SEED = 1234
+
+
+def fill(library, decks, rng, vocabulary):
+    """Add `decks` synthetic decks; return the seconds taken"""
+    start = time.perf_counter()
+    for index in range(decks):
+        title = ' '.join(rng.choices(vocabulary, k=3)).upper()
+        verses = ['\n'.join(' '.join(rng.choices(vocabulary, k=6)) for _ in range(4)) for _ in range(8)]
+        slides = SlideBatch.from_pairs([(title, True)] + [(verse, False) for verse in verses])
+        library.add(f"deck{index}.pptx", 'pptx', f"deck{index}".encode('utf-8'), slides=slides)
+    return time.perf_counter() - start
+
+
+def time_queries(library, queries):
+    """Latencies in milliseconds of searching for each query"""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        library.search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--decks', type=int, default=20000, help="decks in the library (default: 20000)")
+    parser.add_argument('--queries', type=int, default=200, help="searches per query kind (default: 200)")
+    parser.add_argument('--vocabulary', type=int, default=5000, help="distinct words in the synthetic text (default: 5000)")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(SEED)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    vocabulary = [''.join(rng.choices(letters, k=rng.randint(3, 9))) for _ in range(args.vocabulary)]
+    with tempfile.TemporaryDirectory() as root:
+        library = DeckLibrary(root)
+        seconds = fill(library, args.decks, rng, vocabulary)
+        stats = library.stats()
+        print(f"library: {stats['items']} decks, {stats['slides']} slides (filled in {seconds:.1f}s)")
+
+        kinds = {
+            'one word': [rng.choice(vocabulary) for _ in range(args.queries)],
+            'two words': [' '.join(rng.choices(vocabulary, k=2)) for _ in range(args.queries)],
+            'prefix': [rng.choice(vocabulary)[:3] for _ in range(args.queries)],
+        }
+        print(f"{'query':<10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+        for kind, queries in kinds.items():
+            latencies = sorted(time_queries(library, queries))
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            print(f"{kind:<10} {statistics.median(latencies):>8.2f} {p95:>8.2f} {latencies[-1]:>8.2f}")
+        library.close()
+
+
+if __name__ == '__main__':
+    main()
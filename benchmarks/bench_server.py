@@ -0,0 +1,163 @@
+"""Load test for the HTTP merge service.
+
+Starts a merge server on a free port (or uses --url) and sends --requests
+merges from --clients concurrent clients, each merging a synthetic deck and a
+TITLE:-format text file. By default the files are stored once with POST
+/files and merges reference them; --upload sends them in every request as
+multipart form data instead. Reports merges per second, the latency median,
+95th percentile and worst case, refused (503) requests and the server's own
+/metrics.
+
+    python benchmarks/bench_server.py
+    python benchmarks/bench_server.py --clients 16 --requests 200 --workers 4 --upload
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pptx import Presentation  # noqa: E402
+from pptx.util import Inches  # noqa: E402
+
+import merge_engine  # noqa: E402
+from file_spool import FileSpool  # noqa: E402
+from merge_server import MergeServer, MergeService  # noqa: E402
+
+SEED = 1234
+STYLE = {'title_color': 'FFFF00', 'verse_font': 'Georgia', 'verse_font_size': 60}
+
+
+def make_inputs(slides, songs, rng):
+    """(deck bytes, text file bytes) to merge"""
+    prs = Presentation()
+    for index in range(slides):
+        slide = prs.slides.add_slide(prs.slide_layouts[merge_engine.BLANK_LAYOUT_INDEX])
+        slide.shapes.add_textbox(Inches(1), Inches(1), Inches(8), Inches(2)).text_frame.text = f"Slide {index} {rng.random()}"
+    buffer = BytesIO()
+    prs.save(buffer)
+    lines = []
+    for song in range(songs):
+        lines += [f"TITLE: SONG {song}", ""]
+        for verse in range(4):
+            lines += [f"Verse {verse} line {line} of song {song}" for line in range(4)] + [""]
+    return buffer.getvalue(), '\n'.join(lines).encode('utf-8')
+
+
+def encode_multipart(parts):
+    """(content type, body) for (name, filename or None, bytes) parts"""
+    boundary = uuid.uuid4().hex
+    body = BytesIO()
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else '')
+        body.write(f"--{boundary}\r\nContent-Disposition: {disposition}\r\n\r\n".encode('utf-8'))
+        body.write(data)
+        body.write(b"\r\n")
+    body.write(f"--{boundary}--\r\n".encode('utf-8'))
+    return f"multipart/form-data; boundary={boundary}", body.getvalue()
+
+
+def post(url, body, content_type):
+    """(status, response body) of a POST"""
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': content_type}, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def merge_request(base_url, deck, txt, upload):
+    """(content type, body) of one /merge request"""
+    if upload:
+        return encode_multipart([('file', 'deck.pptx', deck), ('file', 'songs.txt', txt),
+                                 ('style', None, json.dumps(STYLE).encode('utf-8'))])
+    refs = []
+    for name, data in (('deck.pptx', deck), ('songs.txt', txt)):
+        status, response = post(f"{base_url}/files?name={name}", data, 'application/octet-stream')
+        if status != 201:
+            raise RuntimeError(f"POST /files failed with {status}: {response[:200]!r}")
+        stored = json.loads(response)
+        refs.append({'spool': stored['sha256'], 'type': stored['type']})
+    return 'application/json', json.dumps({'files': refs, 'style': STYLE}).encode('utf-8')
+
+
+def run_load(base_url, content_type, body, clients, requests):
+    """Latencies (seconds) of successful merges, status code counts and wall seconds"""
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+
+    def one(_):
+        start = time.perf_counter()
+        status, _ = post(f"{base_url}/merge", body, content_type)
+        elapsed = time.perf_counter() - start
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(one, range(requests)))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help="server to test (default: start one in this process)")
+    parser.add_argument('--workers', type=int, default=2, help="worker processes of the started server (default: 2)")
+    parser.add_argument('--queue', type=int, default=8, help="queue places of the started server (default: 8)")
+    parser.add_argument('--clients', type=int, default=8, help="concurrent clients (default: 8)")
+    parser.add_argument('--requests', type=int, default=50, help="merges to send (default: 50)")
+    parser.add_argument('--slides', type=int, default=100, help="slides in the synthetic deck (default: 100)")
+    parser.add_argument('--songs', type=int, default=50, help="songs in the synthetic text file (default: 50)")
+    parser.add_argument('--upload', action='store_true', help="upload the files with every merge instead of referencing them")
+    args = parser.parse_args(argv)
+
+    deck, txt = make_inputs(args.slides, args.songs, random.Random(SEED))
+    server = service = None
+    with tempfile.TemporaryDirectory() as spool_dir:
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            service = MergeService(FileSpool(spool_dir), workers=args.workers, max_pending=args.queue, log_level='WARNING')
+            server = MergeServer(('127.0.0.1', 0), service)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f"http://127.0.0.1:{server.server_port}"
+        try:
+            content_type, body = merge_request(base_url, deck, txt, args.upload)
+            # Warm-up: start the workers and fill their extraction caches
+            run_load(base_url, content_type, body, min(args.clients, args.workers), args.workers)
+            latencies, statuses, seconds = run_load(base_url, content_type, body, args.clients, args.requests)
+            with urllib.request.urlopen(f"{base_url}/metrics") as response:
+                metrics = json.loads(response.read())
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+                service.shutdown()
+
+    print(f"{args.requests} merges from {args.clients} clients in {seconds:.2f}s: "
+          f"{statuses.get(200, 0) / seconds:.1f} merges/s, statuses {dict(sorted(statuses.items()))}")
+    if latencies:
+        latencies.sort()
+        p95 = latencies[math.ceil(0.95 * len(latencies)) - 1]  # Nearest rank
+        print(f"latency p50 {statistics.median(latencies) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms")
+    print(f"server: {json.dumps(metrics, sort_keys=True)}")
+    return 0 if statuses.get(200) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
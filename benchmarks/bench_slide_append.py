@@ -0,0 +1,59 @@
+"""Per-slide append cost as the merged deck grows.
+
+Renders N stamped verse slides into a fresh presentation and reports the
+average cost per slide for each N. With O(1) appends the per-slide cost stays
+flat from 100 to 20,000 slides. --baseline also times python-pptx's own
+slides.add_slide(), which grows with the deck size.
+
+    python benchmarks/bench_slide_append.py
+    python benchmarks/bench_slide_append.py --sizes 100 1000 5000 --baseline
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import merge_engine  # noqa: E402
+
+
+def time_stamped(count, style):
+    """Seconds to render `count` slides through the stamping renderer"""
+    prs = merge_engine.new_presentation()
+    renderer = merge_engine.slide_renderer(prs, style, 'stamp')
+    slides = merge_engine.SlideBatch.from_pairs((f"Verse line {i}\nSecond line {i}", i % 20 == 0) for i in range(count))
+    start = time.perf_counter()
+    merge_engine.render_slides(renderer, slides)
+    return time.perf_counter() - start
+
+
+def time_add_slide(count):
+    """Seconds to append `count` blank slides with python-pptx's add_slide()"""
+    prs = merge_engine.new_presentation()
+    layout = prs.slide_layouts[6]
+    start = time.perf_counter()
+    for _ in range(count):
+        prs.slides.add_slide(layout)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000, 20000])
+    parser.add_argument('--baseline', action='store_true', help="also time python-pptx slides.add_slide()")
+    parser.add_argument('--baseline-max', type=int, default=5000, help="largest size timed for the baseline")
+    args = parser.parse_args(argv)
+
+    style = merge_engine.resolve_style()
+    print(f"{'slides':>8}  {'stamped us/slide':>16}  {'add_slide us/slide':>18}")
+    for count in args.sizes:
+        stamped = time_stamped(count, style) / count * 1e6
+        baseline = ''
+        if args.baseline and count <= args.baseline_max:
+            baseline = f"{time_add_slide(count) / count * 1e6:.1f}"
+        print(f"{count:>8}  {stamped:>16.1f}  {baseline:>18}")
+
+
+if __name__ == '__main__':
+    main()
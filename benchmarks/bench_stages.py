@@ -0,0 +1,293 @@
+"""Per-stage benchmarks on synthetic inputs, with a stored baseline.
+
+Generates its inputs locally (decks with N slides of M text shapes, a deck
+carrying a large media payload, a huge TITLE:-format text file and background
+images of several sizes) and times each merge stage on its own: text
+extraction, .txt parsing, slide creation, text fitting, background resizing
+and saving.
+Each stage reports its best time over --repeat runs, items per second and the
+peak memory allocated while it runs (traced with tracemalloc in a separate
+run, so memory held by lxml's C library is not included).
+
+    python benchmarks/bench_stages.py
+    python benchmarks/bench_stages.py --quick --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_stages.py --quick --compare benchmarks/baseline.json --threshold 0.25
+
+With --compare the exit status is 1 when any stage is slower, or allocates
+more, than the baseline by more than the threshold. Baselines are only
+comparable on the same machine and with the same size options.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+from pptx import Presentation  # noqa: E402
+from pptx.util import Inches, Pt  # noqa: E402
+
+import merge_engine  # noqa: E402
+from text_fit import TextFitter  # noqa: E402
+
+SEED = 1234
+SIZE_OPTIONS = ('slides', 'shapes', 'media_mb', 'songs', 'render_slides', 'background_sizes')
+QUICK_SIZES = {'slides': 200, 'shapes': 4, 'media_mb': 8, 'songs': 500, 'render_slides': 500,
+               'background_sizes': ['1280x720', '1920x1080', '4000x3000']}
+FULL_SIZES = {'slides': 2000, 'shapes': 8, 'media_mb': 64, 'songs': 5000, 'render_slides': 5000,
+              'background_sizes': ['1280x720', '1920x1080', '4000x3000', '8000x6000']}
+
+
+def noise_image(width, height, rng):
+    """RGB image of random pixels (incompressible, like a photo payload)"""
+    return Image.frombytes('RGB', (width, height), rng.randbytes(width * height * 3))
+
+
+def image_bytes(image, image_format):
+    buffer = BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def make_deck(slide_count, shape_count, rng, media_bytes=0):
+    """.pptx bytes with `slide_count` slides of `shape_count` text boxes, plus optional media"""
+    prs = Presentation()
+    layout = prs.slide_layouts[merge_engine.BLANK_LAYOUT_INDEX]
+    for slide_index in range(slide_count):
+        slide = prs.slides.add_slide(layout)
+        for shape_index in range(shape_count):
+            textbox = slide.shapes.add_textbox(Inches(0.5), Inches(0.5 + shape_index * 0.8), Inches(9), Inches(0.7))
+            text = f"Verse {slide_index} line {shape_index} " + ' '.join(
+                rng.choice(('grace', 'light', 'hope', 'peace', 'joy')) for _ in range(6))
+            textbox.text_frame.text = text.upper() if slide_index % 25 == 0 else text
+            textbox.text_frame.paragraphs[0].runs[0].font.size = Pt(24)
+    if media_bytes:
+        side = max(1, int((media_bytes / 3) ** 0.5))
+        picture = BytesIO(image_bytes(noise_image(side, side, rng), 'PNG'))
+        prs.slides[0].shapes.add_picture(picture, 0, 0, prs.slide_width, prs.slide_height)
+    buffer = BytesIO()
+    prs.save(buffer)
+    return buffer.getvalue()
+
+
+def make_txt(song_count, rng):
+    """TITLE:-format text with `song_count` songs of four verses each"""
+    lines = []
+    for song in range(song_count):
+        lines.append(f'TITLE: "Song {song}"')
+        lines.append('')
+        for verse in range(4):
+            for line in range(4):
+                lines.append(f"Verse {verse} line {line} of song {song} " + rng.choice(('amen', 'alleluia', 'glory')))
+            lines.append('')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def make_inputs(sizes):
+    """Generate every synthetic input (not timed)"""
+    rng = random.Random(SEED)
+    inputs = {
+        'deck': make_deck(sizes['slides'], sizes['shapes'], rng),
+        'media_deck': make_deck(4, 1, rng, sizes['media_mb'] * 1024 * 1024),
+        'txt': make_txt(sizes['songs'], rng),
+        'backgrounds': {},
+    }
+    for size in sizes['background_sizes']:
+        width, height = (int(part) for part in size.split('x'))
+        inputs['backgrounds'][size] = image_bytes(noise_image(width, height, rng), 'JPEG')
+    return inputs
+
+
+def stage_cases(inputs, sizes):
+    """(name, setup) pairs; setup() returns (run, items, bytes_in) and run() returns bytes out or None"""
+    style = merge_engine.resolve_style()
+    bg_style = merge_engine.resolve_style({
+        'background_image': merge_engine.resize_image_to_1920x1080(inputs['backgrounds'][sizes['background_sizes'][0]]),
+    })
+    verse_pairs = [(f"Verse line {i}\nSecond line {i}", i % 20 == 0) for i in range(sizes['render_slides'])]
+    verse_slides = merge_engine.SlideBatch.from_pairs(verse_pairs)
+
+    def load_pptx():
+        data = inputs['deck']
+        return (lambda: Presentation(BytesIO(data)) and None), sizes['slides'], len(data)
+
+    def load_media_pptx():
+        data = inputs['media_deck']
+        return (lambda: Presentation(BytesIO(data)) and None), 4, len(data)
+
+    def extract_text_from_slide():
+        slides = list(Presentation(BytesIO(inputs['deck'])).slides)
+        return (lambda: [merge_engine.extract_text_from_slide(slide) for slide in slides] and None), len(slides), len(inputs['deck'])
+
+    def extract_pptx_streaming():
+        data = inputs['deck']
+        return (lambda: merge_engine.extract_pptx_slides(data) and None), sizes['slides'], len(data)
+
+    def extract_media_pptx_streaming():
+        data = inputs['media_deck']
+        return (lambda: merge_engine.extract_pptx_slides(data) and None), 4, len(data)
+
+    def parse_txt_file():
+        data = inputs['txt']
+        slide_count = len(merge_engine.extract_txt_slides(data))
+        return (lambda: merge_engine.parse_txt_file(data) and None), slide_count, len(data)
+
+    def parse_txt_streaming():
+        data = inputs['txt']
+        slide_count = len(merge_engine.extract_txt_slides(data))
+        return (lambda: sum(1 for _ in merge_engine.iter_txt_slides(data)) and None), slide_count, len(data)
+
+    def create_formatted_slide():
+        def run():
+            prs = merge_engine.new_presentation()
+            for text, is_title in verse_pairs:
+                merge_engine.create_formatted_slide(
+                    prs, text, is_title, style['title_color'], style['verse_color'], style['title_font_size'],
+                    style['verse_font_size'], style['title_font'], style['verse_font'])
+        return run, len(verse_slides), 0
+
+    def render_stamp():
+        def run():
+            prs = merge_engine.new_presentation()
+            merge_engine.render_slides(merge_engine.slide_renderer(prs, bg_style, 'stamp'), verse_slides)
+        return run, len(verse_slides), 0
+
+    def fit_text():
+        # The song verses wrap to more lines than fit at the default sizes, so most get split
+        slides = merge_engine.extract_txt_slides(inputs['txt'])
+        texts, title_styled = slides.texts, slides.title_styled()
+        split_style = merge_engine.resolve_style({'text_fit': 'split'})
+        return (lambda: TextFitter(split_style).fit_slides(texts, title_styled) and None), len(slides), 0
+
+    def save():
+        prs = merge_engine.new_presentation()
+        merge_engine.render_slides(merge_engine.slide_renderer(prs, bg_style, 'stamp'), verse_slides)
+        return (lambda: len(merge_engine.save_presentation(prs))), len(verse_slides), 0
+
+    def merge():
+        items = [('pptx', inputs['deck']), ('txt', inputs['txt']), ('pptx', inputs['media_deck'])]
+        slide_count = len(merge_engine.build_merged_presentation(items).slides)
+        bytes_in = sum(len(data) for _, data in items)
+        return (lambda: len(merge_engine.merge(items, bg_style))), slide_count, bytes_in
+
+    cases = [
+        ('load_pptx', load_pptx),
+        ('load_media_pptx', load_media_pptx),
+        ('extract_text_from_slide', extract_text_from_slide),
+        ('extract_pptx_streaming', extract_pptx_streaming),
+        ('extract_media_pptx_streaming', extract_media_pptx_streaming),
+        ('parse_txt_file', parse_txt_file),
+        ('parse_txt_streaming', parse_txt_streaming),
+        ('create_formatted_slide', create_formatted_slide),
+        ('render_stamp', render_stamp),
+        ('fit_text', fit_text),
+        ('save', save),
+        ('merge', merge),
+    ]
+    for size, data in inputs['backgrounds'].items():
+        def resize(data=data):
+            def run():
+                merge_engine._resize_cache.clear()  # Time the resize itself, not the memo
+                return len(merge_engine.resize_image_to_1920x1080(data))
+            return run, 1, len(data)
+        cases.append((f"resize_background_{size}", resize))
+    return cases
+
+
+def measure(setup, repeat):
+    """Best wall time over `repeat` runs, then one traced run for the allocation peak"""
+    run, items, bytes_in = setup()
+    best = None
+    bytes_out = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        bytes_out = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'seconds': best,
+        'items': items,
+        'items_per_second': items / best if best else 0.0,
+        'bytes_in': bytes_in,
+        'bytes_out': bytes_out or 0,
+        'peak_bytes': peak,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Names of stages slower or hungrier than the baseline by more than `threshold`"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline['stages'].get(name)
+        if base is None:
+            continue
+        for key in ('seconds', 'peak_bytes'):
+            if base[key] and result[key] > base[key] * (1 + threshold):
+                regressions.append(f"{name}: {key} {result[key]:.4g} vs baseline {base[key]:.4g} "
+                                   f"(+{(result[key] / base[key] - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help="smaller inputs, for CI and quick checks")
+    parser.add_argument('--slides', type=int, help="slides in the synthetic deck")
+    parser.add_argument('--shapes', type=int, help="text shapes per slide")
+    parser.add_argument('--media-mb', type=int, help="size of the media payload deck's picture in MB")
+    parser.add_argument('--songs', type=int, help="songs in the synthetic TITLE: text file")
+    parser.add_argument('--render-slides', type=int, help="slides rendered by the rendering and save stages")
+    parser.add_argument('--background-sizes', nargs='+', help="background image sizes, e.g. 1920x1080 4000x3000")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per stage; the best is kept (default: 3)")
+    parser.add_argument('--stages', nargs='+', help="only run stages whose name starts with one of these")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--save-baseline', help="store the results as a baseline file")
+    parser.add_argument('--compare', help="compare against a baseline file")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown before failing (default: 0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    sizes = dict(QUICK_SIZES if args.quick else FULL_SIZES)
+    for key in SIZE_OPTIONS:
+        if getattr(args, key) is not None:
+            sizes[key] = getattr(args, key)
+
+    inputs = make_inputs(sizes)
+    results = {}
+    print(f"{'stage':<34} {'seconds':>9} {'items/s':>11} {'peak MB':>9}")
+    for name, setup in stage_cases(inputs, sizes):
+        if args.stages and not any(name.startswith(prefix) for prefix in args.stages):
+            continue
+        result = measure(setup, args.repeat)
+        results[name] = result
+        print(f"{name:<34} {result['seconds']:>9.4f} {result['items_per_second']:>11.0f} {result['peak_bytes'] / 1e6:>9.1f}")
+
+    report = {'sizes': sizes, 'python': sys.version.split()[0], 'stages': results}
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('sizes') != sizes:
+            print("warning: baseline was recorded with different sizes", file=sys.stderr)
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"no stage regressed by more than {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""Persistent, searchable library of decks and TITLE:-format text files.
+
+Files are ingested once: their bytes go into a content-addressed store (a
+FileSpool without a quota) and their extracted slides into an SQLite
+database as a SlideBatch blob, so adding a library item to a merge never
+parses the file again (see ExtractionCache.put). An SQLite FTS5 index over
+file names, title slides and slide text answers searches such as "the deck
+with this chorus" without opening any file.
+
+    python deck_library.py LIBRARY_DIR add services/shared/
+    python deck_library.py LIBRARY_DIR search "amazing grace"
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from extract_cache import sha256_of
+from extraction import extract_item, item_type_for
+from file_spool import FileSpool
+from slide_ir import SlideBatch
+
+# Bump when the schema changes; the index of an older database is dropped and files must be added again
+LIBRARY_FORMAT_VERSION = 1
+
+# bm25 column weights for (name, titles, body): a match in a name or a title ranks first
+_RANK_WEIGHTS = (10.0, 5.0, 1.0)
+_TOKEN = re.compile(r"\w+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    slide_count INTEGER NOT NULL,
+    added REAL NOT NULL,
+    slides BLOB NOT NULL,
+    UNIQUE (sha256, type)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+    name, titles, body, tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+_ITEM_COLUMNS = "items.sha256, items.type, items.name, items.size, items.slide_count, items.added"
+
+
+def _item_dict(row):
+    sha256, item_type, name, size, slide_count, added = row[:6]
+    return {'sha256': sha256, 'type': item_type, 'name': name, 'size': size, 'slides': slide_count, 'added': added}
+
+
+def match_query(text):
+    """FTS5 query matching every word of `text` (the last one as a prefix), or None if it has no words"""
+    tokens = _TOKEN.findall(text)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'  # Search as you type
+    return ' '.join(terms)
+
+
+class DeckLibrary:
+    """Library stored in `root`: library.sqlite3 plus a files/ directory"""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.files = FileSpool(os.path.join(root, 'files'), quota_bytes=float('inf'))
+        # One connection shared by the app's script threads, serialized by the lock
+        self._db = sqlite3.connect(os.path.join(root, 'library.sqlite3'), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            if version not in (0, LIBRARY_FORMAT_VERSION):
+                self._db.executescript("DROP TABLE IF EXISTS items; DROP TABLE IF EXISTS items_fts;")
+            self._db.executescript(_SCHEMA)
+            self._db.execute(f"PRAGMA user_version = {LIBRARY_FORMAT_VERSION}")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def add(self, name, item_type, source, slides=None, sha256=None):
+        """Ingest one file given as bytes, a path or a binary file object; return its item dict.
+
+        `slides` may supply the file's already extracted SlideBatch and
+        `sha256` its digest. A file already in the library (same content and
+        type) is not stored or extracted again; its dict has 'new' False.
+        """
+        if item_type not in ('pptx', 'txt'):
+            raise ValueError(f"Unsupported item type: {item_type!r}")
+        sha256 = sha256 or sha256_of(source)
+        existing = self.get(sha256, item_type)
+        if existing is not None:
+            return dict(existing, new=False)
+
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                stored_sha256, size = self.files.put(f)
+        else:
+            stored_sha256, size = self.files.put(source)
+        if slides is None:
+            slides = extract_item(item_type, self.files.path(stored_sha256))
+
+        titles = '\n'.join(text for text, is_title in slides.pairs() if is_title)
+        body = '\n'.join(slides.texts)
+        added = time.time()
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO items (sha256, type, name, size, slide_count, added, slides) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (stored_sha256, item_type, name, size, len(slides), added, slides.to_bytes()))
+            if cursor.rowcount:
+                self._db.execute("INSERT INTO items_fts (rowid, name, titles, body) VALUES (?, ?, ?, ?)",
+                                 (cursor.lastrowid, name, titles, body))
+        return {'sha256': stored_sha256, 'type': item_type, 'name': name, 'size': size, 'slides': len(slides),
+                'added': added, 'new': bool(cursor.rowcount)}
+
+    def add_path(self, path):
+        """Ingest a supported file, or every supported file under a directory; return the item dicts"""
+        if not os.path.isdir(path):
+            item_type = item_type_for(path)
+            if item_type is None:
+                raise ValueError(f"{path}: unsupported file type")
+            return [self.add(os.path.basename(path), item_type, path)]
+        entries = []
+        for directory, _, names in os.walk(path):
+            for name in sorted(names):
+                item_type = item_type_for(name)
+                if item_type and not name.startswith('~$'):  # Skip Office lock files
+                    entries.append(self.add(name, item_type, os.path.join(directory, name)))
+        return entries
+
+    def get(self, sha256, item_type):
+        """Item dict for a stored file, or None"""
+        with self._lock:
+            row = self._db.execute(f"SELECT {_ITEM_COLUMNS} FROM items WHERE sha256 = ? AND type = ?",
+                                   (sha256, item_type)).fetchone()
+        return _item_dict(row) if row else None
+
+    def slides(self, sha256, item_type):
+        """Stored SlideBatch of a file (re-extracted if it was stored in an older format), or None"""
+        with self._lock:
+            row = self._db.execute("SELECT id, slides FROM items WHERE sha256 = ? AND type = ?", (sha256, item_type)).fetchone()
+        if row is None:
+            return None
+        try:
+            return SlideBatch.from_bytes(row[1])
+        except ValueError:
+            slides = extract_item(item_type, self.path(sha256))
+            with self._lock, self._db:
+                self._db.execute("UPDATE items SET slides = ? WHERE id = ?", (slides.to_bytes(), row[0]))
+            return slides
+
+    def path(self, sha256):
+        """Path of a stored file"""
+        return self.files.path(sha256)
+
+    def remove(self, sha256, item_type):
+        """Drop a file from the library; return False if it was not there"""
+        with self._lock, self._db:
+            row = self._db.execute("SELECT id FROM items WHERE sha256 = ? AND type = ?", (sha256, item_type)).fetchone()
+            if row is None:
+                return False
+            self._db.execute("DELETE FROM items WHERE id = ?", row)
+            self._db.execute("DELETE FROM items_fts WHERE rowid = ?", row)
+            shared = self._db.execute("SELECT 1 FROM items WHERE sha256 = ?", (sha256,)).fetchone()
+        if not shared:
+            try:
+                os.remove(self.files.path(sha256))
+            except OSError:
+                pass
+        return True
+
+    def search(self, text, limit=20):
+        """Best matches for `text` in names, titles and slide text, as item dicts with a 'snippet'.
+
+        Every word must match (the last one as a prefix). Without any words the
+        most recently added items are returned.
+        """
+        query = match_query(text)
+        with self._lock:
+            if query is None:
+                rows = self._db.execute(f"SELECT {_ITEM_COLUMNS}, '' FROM items ORDER BY added DESC LIMIT ?", (limit,)).fetchall()
+            else:
+                rows = self._db.execute(
+                    f"SELECT {_ITEM_COLUMNS}, snippet(items_fts, -1, '[', ']', '…', 12) FROM items_fts "
+                    "JOIN items ON items.id = items_fts.rowid "
+                    f"WHERE items_fts MATCH ? ORDER BY bm25(items_fts, {', '.join(map(str, _RANK_WEIGHTS))}) LIMIT ?",
+                    (query, limit)).fetchall()
+        return [dict(_item_dict(row), snippet=row[6]) for row in rows]
+
+    def stats(self):
+        """Number of items, slides and stored bytes"""
+        with self._lock:
+            items, slides, size = self._db.execute("SELECT COUNT(*), TOTAL(slide_count), TOTAL(size) FROM items").fetchone()
+        return {'items': items, 'slides': int(slides), 'bytes': int(size)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the searchable deck library.")
+    parser.add_argument('library', help="library directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    add_parser = commands.add_parser('add', help="ingest files and/or directories")
+    add_parser.add_argument('paths', nargs='+')
+    search_parser = commands.add_parser('search', help="search names, titles and slide text")
+    search_parser.add_argument('query')
+    search_parser.add_argument('--limit', type=int, default=20)
+    commands.add_parser('stats', help="show library size")
+    args = parser.parse_args(argv)
+
+    library = DeckLibrary(args.library)
+    try:
+        if args.command == 'add':
+            for path in args.paths:
+                for entry in library.add_path(path):
+                    status = 'added' if entry['new'] else 'known'
+                    print(f"{status:>5}  {entry['name']} ({entry['slides']} slides)")
+        elif args.command == 'search':
+            start = time.perf_counter()
+            hits = library.search(args.query, args.limit)
+            elapsed = time.perf_counter() - start
+            for hit in hits:
+                print(f"{hit['name']} ({hit['type']}, {hit['slides']} slides) {hit['sha256'][:12]}")
+                if hit['snippet']:
+                    print(f"    {' / '.join(hit['snippet'].splitlines())}")
+            print(f"{len(hits)} results in {elapsed * 1000:.1f} ms")
+        else:
+            stats = library.stats()
+            print(f"{stats['items']} files, {stats['slides']} slides, {stats['bytes'] / 1e6:.1f} MB")
+    finally:
+        library.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""Content-addressed cache of extracted slides (slide_ir.SlideBatch).
+
+Entries are keyed by the item type and the SHA-256 of the file bytes, so the
+same deck uploaded twice, by anyone, is only extracted once. A bounded
+in-memory LRU tier sits in front of an optional on-disk tier that evicts the
+least recently used files once it grows past its size limit. Disk entries
+hold the batch's compact binary form.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from slide_ir import SlideBatch
+
+# Bump when extraction output changes so stale disk entries are ignored
+CACHE_FORMAT_VERSION = 2
+
+# Suffixes of cache files, current and older formats (older ones are only evicted)
+_DISK_SUFFIXES = ('.bin', '.json')
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_of(data):
+    """Hex SHA-256 of bytes, a file path or a binary file object"""
+    digest = hashlib.sha256()
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        digest.update(data)
+    elif isinstance(data, (str, os.PathLike)):
+        with open(data, 'rb') as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+    else:
+        data.seek(0)
+        for chunk in iter(lambda: data.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        data.seek(0)
+    return digest.hexdigest()
+
+
+def cache_key(item_type, sha256_hex):
+    """Cache key for an item of `item_type` whose bytes hash to `sha256_hex`"""
+    return f"{item_type}-{sha256_hex}"
+
+
+class ExtractionCache:
+    """Two-tier (memory LRU + optional disk) cache of SlideBatches"""
+
+    def __init__(self, max_entries=256, disk_dir=None, max_disk_bytes=512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._disk_bytes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    @property
+    def hits(self):
+        return self.memory_hits + self.disk_hits
+
+    def stats(self):
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_entries': len(self._memory),
+                'disk_bytes': self._disk_bytes,
+            }
+
+    def get(self, key):
+        """Return the cached SlideBatch for `key`, or None (counts a hit or miss)"""
+        with self._lock:
+            slides = self._memory.get(key)
+            if slides is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return slides
+
+        slides = self._read_disk(key)
+        with self._lock:
+            if slides is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, slides)
+        return slides
+
+    def put(self, key, slides):
+        """Store a SlideBatch (or a list of (text, is_title) pairs) in both tiers"""
+        if not isinstance(slides, SlideBatch):
+            slides = SlideBatch.from_pairs(slides)
+        with self._lock:
+            self._remember(key, slides)
+        if self.disk_dir:
+            self._write_disk(key, slides)
+
+    def clear(self):
+        """Drop the memory tier and reset counters (disk entries are kept)"""
+        with self._lock:
+            self._memory.clear()
+            self.memory_hits = self.disk_hits = self.misses = 0
+
+    def _remember(self, key, slides):
+        self._memory[key] = slides
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.v{CACHE_FORMAT_VERSION}.bin")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                slides = SlideBatch.from_bytes(f.read())
+            os.utime(path)  # Mark as recently used for eviction
+        except (OSError, ValueError):
+            return None
+        return slides
+
+    def _write_disk(self, key, slides):
+        payload = slides.to_bytes()
+        path = self._disk_path(key)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            existing = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes += len(payload) - existing
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _disk_entries(self):
+        """(path, size, mtime) for every cache file on disk"""
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and entry.name.endswith(_DISK_SUFFIXES):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict_disk(self):
+        """Remove least recently used disk entries until under the size limit"""
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._disk_bytes = total
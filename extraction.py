@@ -0,0 +1,337 @@
+"""Turn input files into SlideBatches, optionally on a worker pool.
+
+Nothing in here imports python-pptx or Pillow up front: .pptx text is read
+straight from the zip (see zip_extract) and .txt files are decoded
+incrementally (see txt_stream). Extraction workers started with the 'spawn'
+method therefore only import this module, and merge_engine, which renders
+the slides, re-exports everything for existing callers.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+from extract_cache import cache_key, sha256_of
+from slide_ir import ROLE_TITLE, ROLE_VERSE, Slide, SlideBatch, is_all_caps
+from txt_stream import iter_line_batches
+from zip_extract import iter_slide_texts
+
+PPTX_MIME = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+# Input file types by extension
+SUPPORTED_EXTENSIONS = {'.pptx': 'pptx', '.txt': 'txt'}
+
+# Worker pools extraction can fan out over
+EXTRACT_POOLS = ('process', 'thread')
+
+
+def extract_text_from_slide(slide):
+    """Extract all text from a slide"""
+    text_content = []
+    for shape in slide.shapes:
+        if shape.has_text_frame:
+            for paragraph in shape.text_frame.paragraphs:
+                para_text = ""
+                for run in paragraph.runs:
+                    para_text += run.text
+                if para_text.strip():
+                    text_content.append(para_text.strip())
+    return "\n".join(text_content)
+
+
+def iter_txt_file(source):
+    """Yield the slides of a TITLE:-format .txt file one at a time, reading it incrementally.
+
+    `source` is bytes, a path or a binary file object; the encoding is detected
+    (see txt_stream). Each slide is a {'title': ..., 'verses': [...]} dict.
+    """
+    current_slide = {'title': None, 'verses': []}
+
+    # Lines arrive a decoded chunk at a time
+    for lines in iter_line_batches(source):
+        for line in lines:
+            line = line.strip()
+
+            # Check if line is a title
+            if line.upper().startswith('TITLE:'):
+                # If we have content in current slide, save it
+                if current_slide['title'] or current_slide['verses']:
+                    yield current_slide
+
+                # Extract title text (handle both TITLE:text and TITLE:"text" formats)
+                title_text = line[6:].strip()  # Remove "TITLE:"
+                if title_text.startswith('"') and title_text.endswith('"'):
+                    title_text = title_text[1:-1]  # Remove quotes
+
+                # Start new slide with this title
+                current_slide = {'title': title_text, 'verses': []}
+            elif line == '':
+                # Blank line - if we have content, save current slide and start new one
+                if current_slide['title'] or current_slide['verses']:
+                    yield current_slide
+                    current_slide = {'title': None, 'verses': []}
+            else:
+                # Regular verse line
+                if line:  # Only add non-empty lines
+                    current_slide['verses'].append(line)
+
+    # Add the last slide if it has content
+    if current_slide['title'] or current_slide['verses']:
+        yield current_slide
+
+
+def parse_txt_file(txt_content):
+    """Parse .txt file and extract slides with titles and verses"""
+    return list(iter_txt_file(txt_content))
+
+
+def create_template_txt():
+    """Create a .txt template with TITLE: format"""
+    template_content = """TITLE: Your Title Here
+
+Your verse text here
+You can add multiple lines
+Each line will appear on the slide
+
+TITLE: Another Title (Optional)
+
+More verse text here
+Add as many titles and verses as you need
+Separate slides with blank lines"""
+    return template_content
+
+
+def item_type_for(path):
+    """Return 'pptx' or 'txt' for a supported input path, else None"""
+    return SUPPORTED_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def _read_bytes(data):
+    """Return the raw bytes of an item given as bytes, a path or a file object"""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return bytes(data)
+    if isinstance(data, (str, os.PathLike)):
+        with open(data, 'rb') as f:
+            return f.read()
+    data.seek(0)  # Ensure we're at the start
+    return data.read()
+
+
+def item_size(data):
+    """Size in bytes of an item given as bytes, a path or a file object"""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return len(data)
+    if isinstance(data, (str, os.PathLike)):
+        return os.path.getsize(data)
+    size = data.seek(0, os.SEEK_END)
+    data.seek(0)
+    return size
+
+
+def _open_item(data):
+    """Return something python-pptx can open: a path or a file object at position 0"""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return BytesIO(data)
+    if isinstance(data, (str, os.PathLike)):
+        return data
+    data.seek(0)  # Ensure we're at the start
+    return data
+
+
+def classify_pptx_slides(slide_texts, source=''):
+    """Turn per-slide texts of one .pptx into a SlideBatch, skipping slides without text"""
+    slides = SlideBatch(source)
+    first_slide_found = False  # Track if we've found the first slide with text in this file
+    first_all_caps_found = False  # Track if we've found the first all-caps slide in this file
+
+    for index, text in enumerate(slide_texts):
+        if text:  # Only create slide if there's text
+            # Determine if it's a title slide:
+            # - First slide of each PowerPoint file (regardless of caps)
+            # - OR first all-caps slide in each PowerPoint file
+            role = ROLE_VERSE
+            if not first_slide_found:
+                # First slide with text in this file is always a title
+                role = ROLE_TITLE
+                first_slide_found = True
+            elif is_all_caps(text) and not first_all_caps_found:
+                # First all-caps slide in this file is also a title
+                role = ROLE_TITLE
+                first_all_caps_found = True
+
+            slides.append(text, role, index)
+
+    return slides
+
+
+def extract_pptx_slides(data, streaming=True, source=''):
+    """Extract a SlideBatch from a .pptx file; slide indexes are positions in the deck.
+
+    By default slide text is read straight from the zip (see zip_extract); with
+    `streaming=False` the file is loaded as a full python-pptx Presentation.
+    """
+    if streaming:
+        return classify_pptx_slides(iter_slide_texts(data), source)
+    from pptx import Presentation  # Only this fallback needs python-pptx
+
+    prs = Presentation(_open_item(data))
+    return classify_pptx_slides((extract_text_from_slide(slide) for slide in prs.slides), source)
+
+
+def _iter_txt_roles(data):
+    """Yield (text, role) for each slide of a TITLE:-format .txt file"""
+    for slide_data in iter_txt_file(data):
+        # Create title slide if title exists
+        if slide_data['title']:
+            yield slide_data['title'], ROLE_TITLE
+
+        # Create verse slide(s) if verses exist
+        if slide_data['verses']:
+            yield '\n'.join(slide_data['verses']), ROLE_VERSE
+
+
+def iter_txt_slides(data, source=''):
+    """Yield Slide records from a TITLE:-format .txt file while it is being read"""
+    for index, (text, role) in enumerate(_iter_txt_roles(data)):
+        yield Slide(text, role, source, index)
+
+
+def extract_txt_slides(data, source=''):
+    """Extract a SlideBatch from a TITLE:-format .txt file"""
+    slides = SlideBatch(source)
+    for text, role in _iter_txt_roles(data):
+        slides.append(text, role)
+    return slides
+
+
+def extract_item(item_type, data, source=''):
+    """Extract a SlideBatch from one 'pptx' or 'txt' item"""
+    if item_type == 'pptx':
+        return extract_pptx_slides(data, source=source)
+    if item_type == 'txt':
+        return extract_txt_slides(data, source)
+    raise ValueError(f"Unsupported item type: {item_type!r}")
+
+
+def iter_item_slides(item_type, data, source=''):
+    """Like extract_item(), but .txt files are parsed lazily into Slide records as they are consumed"""
+    if item_type == 'txt':
+        return iter_txt_slides(data, source)
+    return extract_item(item_type, data, source)
+
+
+def _extract_item_job(item):
+    """Worker entry point for extract_items() (module level so process pools can pickle it).
+
+    The SlideBatch comes back from process workers in its compact binary form.
+    """
+    return extract_item(*item)
+
+
+def _portable_item(item):
+    """Make an item safe to send to another process (file objects become bytes)"""
+    item_type, data = item
+    if isinstance(data, (bytes, str, os.PathLike)):
+        return item
+    return item_type, _read_bytes(data)
+
+
+def make_extract_executor(workers=None, pool='process'):
+    """Create a reusable executor for extract_items().
+
+    Process pools use the 'spawn' start method so they are safe to create from
+    threaded hosts such as the Streamlit server.
+    """
+    workers = workers or os.cpu_count() or 1
+    if pool == 'process':
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    if pool == 'thread':
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='extract')
+    raise ValueError(f"Unsupported extraction pool: {pool!r}")
+
+
+def _iter_extract_uncached(items, workers, pool, executor, lazy=False):
+    """Extract items directly, on a pool when one is configured, yielding in item order"""
+    if executor is None and (workers <= 1 or len(items) <= 1):
+        extract = iter_item_slides if lazy else extract_item
+        for item_type, item_data in items:
+            yield extract(item_type, item_data)
+        return
+
+    if executor is not None:
+        if isinstance(executor, ProcessPoolExecutor):
+            items = [_portable_item(item) for item in items]
+        yield from executor.map(_extract_item_job, items)
+        return
+
+    if pool == 'process':
+        items = [_portable_item(item) for item in items]
+    with make_extract_executor(min(workers, len(items)), pool) as pool_executor:
+        yield from pool_executor.map(_extract_item_job, items)
+
+
+def _cached_slides(slides, batch, cache, key):
+    """Yield Slides while copying them into `batch`, which is cached once the file has been read to the end"""
+    for slide in slides:
+        batch.append(slide.text, slide.role, slide.index)
+        yield slide
+    cache.put(key, batch)
+
+
+def iter_extract_items(items, workers=1, pool='process', executor=None, cache=None, digests=None, lazy=False):
+    """Generator form of extract_items(): yields each item's slides as soon as they are ready.
+
+    Consumers can render one file while later files are still being extracted;
+    closing the generator early cancels extraction that has not started yet.
+    With `lazy`, .txt items that are not cached come as iterators that parse
+    the file while they are consumed (without a cache, only when there is no
+    pool either); exhaust each before asking for the next.
+    """
+    items = list(items)
+    if cache is None:
+        yield from _iter_extract_uncached(items, workers, pool, executor, lazy)
+        return
+
+    keys = [
+        cache_key(item_type, (digests[index] if digests else None) or sha256_of(item_data))
+        for index, (item_type, item_data) in enumerate(items)
+    ]
+    results = [cache.get(key) for key in keys]
+
+    # Extract each missing file once, even if it appears several times in the merge; with `lazy`,
+    # .txt files are parsed here while they are rendered and cached when they have been read
+    missing = {}
+    streamed = set()
+    for index, slides in enumerate(results):
+        if slides is None:
+            if lazy and items[index][0] == 'txt':
+                streamed.add(keys[index])
+            else:
+                missing.setdefault(keys[index], index)
+    extracted = _iter_extract_uncached([items[index] for index in missing.values()], workers, pool, executor)
+    by_key = {}
+    for index, slides in enumerate(results):
+        if slides is None:
+            key = keys[index]
+            if key in streamed and key not in by_key:
+                # Later uses of the same file get the batch, complete by then
+                by_key[key] = SlideBatch()
+                yield _cached_slides(iter_txt_slides(items[index][1]), by_key[key], cache, key)
+                continue
+            if key not in by_key:
+                # Missing keys are extracted in order of first use, so the next result is this one
+                by_key[key] = next(extracted)
+                cache.put(key, by_key[key])
+            slides = by_key[key]
+        yield slides
+
+
+def extract_items(items, workers=1, pool='process', executor=None, cache=None, digests=None):
+    """Extract a SlideBatch for every item, keeping item order.
+
+    With an `executor`, or `workers` > 1, files are extracted concurrently; the
+    results are always returned in the order of `items` so output stays
+    deterministic. With an ExtractionCache only files not seen before are
+    extracted; `digests` may supply precomputed SHA-256 hex digests per item.
+    """
+    return list(iter_extract_items(items, workers, pool, executor, cache, digests))
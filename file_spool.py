@@ -0,0 +1,145 @@
+"""Content-addressed spool directory for uploaded files.
+
+Uploads are streamed to disk once, named by the SHA-256 of their bytes, so a
+deck uploaded by several sessions is stored a single time and sessions only
+keep small handles. Readers get a file path (zip readers then page data in
+from disk on demand). Total size is bounded by a quota; the least recently
+used files are evicted first. Files pinned by a running merge, or used within
+the last `lease_seconds` (which covers merges still queued and other processes
+sharing the directory), are never evicted, so the spool may go over its quota
+for a while.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class FileSpool:
+    """Deduplicating on-disk store with an LRU size quota"""
+
+    def __init__(self, root, quota_bytes=2 * 1024 * 1024 * 1024, lease_seconds=600):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._pins = {}  # sha256 hex -> number of merges using the file
+        os.makedirs(root, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    def path(self, sha256_hex):
+        """Path of the spooled file for a digest (it may have been evicted)"""
+        return os.path.join(self.root, sha256_hex)
+
+    def exists(self, sha256_hex):
+        return os.path.exists(self.path(sha256_hex))
+
+    def put(self, source):
+        """Spool bytes or a binary file object; return (sha256 hex, size in bytes)"""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                if isinstance(source, (bytes, bytearray, memoryview)):
+                    digest.update(source)
+                    out.write(source)
+                    size = len(source)
+                else:
+                    source.seek(0)
+                    for chunk in iter(lambda: source.read(_COPY_CHUNK_SIZE), b''):
+                        digest.update(chunk)
+                        out.write(chunk)
+                        size += len(chunk)
+            sha256_hex = digest.hexdigest()
+            final_path = self.path(sha256_hex)
+            with self._lock:
+                if os.path.exists(final_path):
+                    # Already spooled by this or another session
+                    os.remove(tmp_path)
+                    os.utime(final_path)
+                    return sha256_hex, size
+                os.replace(tmp_path, final_path)
+                self._total_bytes += size
+                if self._total_bytes > self.quota_bytes:
+                    self._evict(keep=sha256_hex)
+            return sha256_hex, size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def open(self, sha256_hex):
+        """Open a spooled file for reading and mark it as recently used"""
+        path = self.path(sha256_hex)
+        handle = open(path, 'rb')
+        self.touch(sha256_hex)
+        return handle
+
+    def touch(self, sha256_hex):
+        """Mark a spooled file as recently used; return False if it was evicted"""
+        try:
+            os.utime(self.path(sha256_hex))
+        except OSError:
+            return False
+        return True
+
+    def pin(self, digests):
+        """Keep spooled files from eviction until they are unpinned as many times"""
+        with self._lock:
+            for sha256_hex in digests:
+                self._pins[sha256_hex] = self._pins.get(sha256_hex, 0) + 1
+
+    def unpin(self, digests):
+        with self._lock:
+            for sha256_hex in digests:
+                count = self._pins.get(sha256_hex, 0) - 1
+                if count > 0:
+                    self._pins[sha256_hex] = count
+                else:
+                    self._pins.pop(sha256_hex, None)
+
+    def read_bytes(self, sha256_hex):
+        """Whole contents of a spooled file"""
+        with self.open(sha256_hex) as f:
+            return f.read()
+
+    def usage(self):
+        """Bytes currently spooled and the quota"""
+        with self._lock:
+            return {'bytes': self._total_bytes, 'quota_bytes': self.quota_bytes}
+
+    def _entries(self):
+        """(path, size, mtime) for every spooled file"""
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.endswith('.part'):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self, keep=None):
+        """Remove least recently used files until the spool fits its quota, sparing pinned and leased ones"""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        leased_since = time.time() - self.lease_seconds
+        for path, size, mtime in entries:
+            if total <= self.quota_bytes or mtime > leased_since:
+                break  # Sorted by mtime: every later file is leased too
+            name = os.path.basename(path)
+            if name == keep or name in self._pins:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._total_bytes = total
+
+
+def default_spool_dir():
+    """Spool location used when none is configured"""
+    return os.path.join(tempfile.gettempdir(), 'pptx-merger-spool')
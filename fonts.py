@@ -0,0 +1,102 @@
+"""Locate TrueType files for the font families offered in the app.
+
+Slide text is rendered by PowerPoint with whatever fonts the viewer has, but
+previews and text measurement need a font file here. A family resolves to
+its own file when installed (Windows, macOS or msttcorefonts names), else to
+a metric-compatible substitute (Liberation, Carlito), else to a DejaVu face of
+the same kind, else to Pillow's built-in font.
+"""
+import functools
+import os
+import sys
+
+from PIL import ImageFont
+
+# Windows file names (regular, bold) of the families offered in the app
+_WINDOWS_FILES = {
+    'arial': ('arial', 'arialbd'),
+    'times new roman': ('times', 'timesbd'),
+    'calibri': ('calibri', 'calibrib'),
+    'verdana': ('verdana', 'verdanab'),
+    'georgia': ('georgia', 'georgiab'),
+    'tahoma': ('tahoma', 'tahomabd'),
+    'trebuchet ms': ('trebuc', 'trebucbd'),
+    'courier new': ('cour', 'courbd'),
+    'comic sans ms': ('comic', 'comicbd'),
+    'impact': ('impact', 'impact'),
+}
+
+# Metric-compatible families, tried before the generic fallback
+_SUBSTITUTES = {
+    'arial': 'liberation sans',
+    'times new roman': 'liberation serif',
+    'courier new': 'liberation mono',
+    'calibri': 'carlito',
+}
+_SERIF_FAMILIES = ('times new roman', 'georgia', 'liberation serif')
+_MONO_FAMILIES = ('courier new', 'liberation mono')
+
+
+def font_dirs():
+    """Directories searched for font files on this platform"""
+    home = os.path.expanduser('~')
+    if sys.platform.startswith('win'):
+        windir = os.environ.get('WINDIR', r'C:\Windows')
+        return [os.path.join(windir, 'Fonts'), os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft', 'Windows', 'Fonts')]
+    if sys.platform == 'darwin':
+        return ['/System/Library/Fonts', '/System/Library/Fonts/Supplemental', '/Library/Fonts', os.path.join(home, 'Library', 'Fonts')]
+    return ['/usr/share/fonts', '/usr/local/share/fonts', os.path.join(home, '.fonts'), os.path.join(home, '.local', 'share', 'fonts')]
+
+
+@functools.lru_cache(maxsize=1)
+def _font_index():
+    """Lower-case file stem -> path of every TrueType/OpenType file found (first one wins)"""
+    index = {}
+    for directory in font_dirs():
+        for root, _, names in os.walk(directory):
+            for name in sorted(names):
+                stem, extension = os.path.splitext(name)
+                if extension.lower() in ('.ttf', '.otf', '.ttc'):
+                    index.setdefault(stem.lower(), os.path.join(root, name))
+    return index
+
+
+def _candidate_stems(family, bold):
+    """File stems a family's regular or bold face is commonly installed under"""
+    compact = family.replace(' ', '')
+    underscored = family.replace(' ', '_')
+    stems = []
+    if family in _WINDOWS_FILES:
+        stems.append(_WINDOWS_FILES[family][1 if bold else 0])
+    if bold:
+        stems += [f"{compact}-bold", f"{compact}bold", f"{underscored}_bold", f"{family} bold"]
+    else:
+        stems += [compact, f"{compact}-regular", underscored, family]
+    return stems
+
+
+def find_font_file(family, bold=False):
+    """Path of the best available file for `family` (see module docstring), or None"""
+    family = (family or '').strip().lower()
+    index = _font_index()
+    generic = 'dejavu serif' if family in _SERIF_FAMILIES else 'dejavu sans mono' if family in _MONO_FAMILIES else 'dejavu sans'
+    for candidate in (family, _SUBSTITUTES.get(family), generic):
+        if not candidate:
+            continue
+        for stem in _candidate_stems(candidate, bold):
+            path = index.get(stem)
+            if path:
+                return path
+    return None
+
+
+@functools.lru_cache(maxsize=128)
+def load_font(family, size, bold=False):
+    """Pillow font for `family` at `size` pixels (Pillow's built-in font if no file is found)"""
+    path = find_font_file(family, bold)
+    if path is None:
+        try:
+            return ImageFont.load_default(size)
+        except TypeError:  # Pillow < 10.1: fixed-size bitmap font only
+            return ImageFont.load_default()
+    return ImageFont.truetype(path, size)
@@ -0,0 +1,184 @@
+"""Incremental merging: keep rendered slides between merges and only render what changed.
+
+An IncrementalMerger owns a live merged Presentation. Each input file's slides
+form a fragment keyed by the file's content hash; fragments are reused while the
+style is unchanged, so reordering files, or adding or removing one, only renders
+the new files and re-links the existing slide parts in the new order. Changing
+any style setting starts a fresh presentation.
+
+A merger is used by one merge at a time (calls are serialized); a merge that
+fails or is aborted from its progress callback starts the next one afresh.
+Merges with slide deduplication collapse slides across files, so they are
+built from scratch and leave the kept fragments alone.
+"""
+import threading
+
+from pptx.opc.constants import RELATIONSHIP_TARGET_MODE as RTM, RELATIONSHIP_TYPE as RT
+from pptx.opc.package import _Relationship
+
+from extract_cache import cache_key, sha256_of
+from instrumentation import MergeMetrics
+from merge_engine import (
+    ZIP_COMPRESS_LEVEL,
+    _no_progress,
+    build_merged_presentation,
+    item_size,
+    iter_extract_items,
+    new_presentation,
+    render_items,
+    resolve_style,
+    save_presentation,
+    slide_renderer,
+    style_digest,
+)
+
+MIN_SLIDE_ID = 256
+
+
+class IncrementalMerger:
+    """Reusable merge state for one user's session"""
+
+    def __init__(self, render_mode='stamp'):
+        self.render_mode = render_mode
+        self._style_key = None
+        self._prs = None
+        self._renderer = None
+        self._fragments = {}  # item key -> list of fragments, each a list of slide rIds
+        self._lock = threading.RLock()
+        self.last_stats = {}
+
+    def reset(self):
+        """Forget every rendered fragment"""
+        self._style_key = None
+        self._prs = None
+        self._renderer = None
+        self._fragments = {}
+
+    def build(self, items, style=None, digests=None, executor=None, cache=None, progress=None, metrics=None, dedup='off'):
+        """Bring the merged presentation up to date with `items` and return it.
+
+        Same arguments as merge_engine.build_merged_presentation(); `digests` lets
+        the caller supply each item's SHA-256 so files are not re-hashed. Reused
+        files count as done as soon as progress is first reported.
+        """
+        metrics = metrics if metrics is not None else MergeMetrics()
+        with self._lock:
+            if dedup != 'off':
+                return self._build_deduplicated(list(items), style, digests, executor, cache, progress, metrics, dedup)
+            try:
+                return self._build(list(items), style, digests, executor, cache, progress or _no_progress, metrics)
+            except BaseException:
+                # The presentation may be half updated
+                self.reset()
+                raise
+
+    def _build_deduplicated(self, items, style, digests, executor, cache, progress, metrics, dedup):
+        """Build a fresh deduplicated presentation, leaving the fragments alone"""
+        prs = build_merged_presentation(items, style, self.render_mode, executor=executor, cache=cache, digests=digests,
+                                        progress=progress, metrics=metrics, dedup=dedup)
+        self.last_stats = {
+            'files': len(items),
+            'files_rendered': len(items),
+            'slides': len(prs.slides),
+            'slides_rendered': len(prs.slides),
+            'slides_removed': 0,
+        }
+        return prs
+
+    def _build(self, items, style, digests, executor, cache, progress, metrics):
+        style = resolve_style(style)
+        key = style_digest(style)
+        if key != self._style_key or self._prs is None:
+            self._prs = new_presentation()
+            self._renderer = slide_renderer(self._prs, style, self.render_mode)
+            self._fragments = {}
+            self._style_key = key
+
+        with metrics.stage('hash') as timer:
+            item_digests = []
+            for index, (_, item_data) in enumerate(items):
+                digest = digests[index] if digests else None
+                if digest is None:
+                    digest = sha256_of(item_data)
+                    timer.add(items=1, bytes_in=item_size(item_data))
+                item_digests.append(digest)
+        keys = [cache_key(item_type, digest) for (item_type, _), digest in zip(items, item_digests)]
+
+        # Hand out existing fragments to the items that still need them
+        available = {item_key: list(fragments) for item_key, fragments in self._fragments.items()}
+        assigned = [available[item_key].pop(0) if available.get(item_key) else None for item_key in keys]
+
+        # Fragments nobody claimed belong to removed files
+        prs_rels = self._prs.part.rels
+        removed_slides = 0
+        for fragments in available.values():
+            for fragment in fragments:
+                for rId in fragment:
+                    prs_rels.pop(rId)
+                removed_slides += len(fragment)
+        sldIdLst = self._prs._element.get_or_add_sldIdLst()
+        for sldId in list(sldIdLst):
+            if sldId.rId not in prs_rels:
+                sldIdLst.remove(sldId)
+        self._renderer.sync()
+
+        # Render only the items without a fragment
+        missing = [index for index, fragment in enumerate(assigned) if fragment is None]
+        files_done = len(items) - len(missing)
+        progress(files_done, len(items), 0)
+        missing_items = [items[index] for index in missing]
+        extracted = iter_extract_items(missing_items, executor=executor, cache=cache,
+                                       digests=[item_digests[index] for index in missing], lazy=True)
+        rendered_slides = 0
+        first = len(sldIdLst)
+        for position, count in render_items(self._prs, self._renderer, style, missing_items, extracted,
+                                            metrics, progress, files_done, len(items)):
+            assigned[missing[position]] = [sldId.rId for sldId in sldIdLst[first:]]
+            first = len(sldIdLst)
+            rendered_slides += count
+
+        # Re-link every slide in item order with the ids and partnames a fresh merge would use
+        sldId_by_rId = {sldId.rId: sldId for sldId in sldIdLst}
+        for sldId in list(sldIdLst):
+            sldIdLst.remove(sldId)
+        order = [rId for fragment in assigned for rId in fragment]
+        for position, rId in enumerate(order):
+            sldId = sldId_by_rId[rId]
+            sldId.set('id', str(MIN_SLIDE_ID + position))
+            sldIdLst.append(sldId)
+        self._prs.part.rename_slide_parts(order)
+        self._refresh_slide_rels(order)
+        self._renderer.sync()
+
+        self._fragments = {}
+        for item_key, fragment in zip(keys, assigned):
+            self._fragments.setdefault(item_key, []).append(fragment)
+        self.last_stats = {
+            'files': len(items),
+            'files_rendered': len(missing),
+            'slides': len(order),
+            'slides_rendered': rendered_slides,
+            'slides_removed': removed_slides,
+        }
+        return self._prs
+
+    def _refresh_slide_rels(self, rIds):
+        """Recreate slide relationships whose cached target no longer matches the partname"""
+        prs_part = self._prs.part
+        prs_rels = prs_part.rels
+        base_uri = prs_part.partname.baseURI
+        for rId in rIds:
+            rel = prs_rels[rId]
+            # _Relationship caches target_ref, so a renamed slide needs a fresh relationship
+            if rel.target_ref != rel.target_part.partname.relative_ref(base_uri):
+                prs_rels._rels[rId] = _Relationship(base_uri, rId, RT.SLIDE, RTM.INTERNAL, rel.target_part)
+
+    def merge(self, items, style=None, output=None, digests=None, executor=None, cache=None,
+              compresslevel=ZIP_COMPRESS_LEVEL, progress=None, metrics=None, dedup='off'):
+        """Like merge_engine.merge(), reusing fragments from earlier merges"""
+        metrics = metrics if metrics is not None else MergeMetrics()
+        with self._lock:
+            prs = self.build(items, style, digests, executor, cache, progress, metrics, dedup)
+            result = save_presentation(prs, output, compresslevel, metrics)
+        metrics.finish().log(render_mode=self.render_mode, dedup=dedup, **self.last_stats)
+        return result
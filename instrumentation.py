@@ -0,0 +1,206 @@
+"""Per-stage timing and memory instrumentation for merges.
+
+A MergeMetrics collects one StageTimer per merge stage ('hash', 'extract',
+'background', 'render', 'save'). Each timer accumulates wall time, CPU time
+of the merging thread, items (slides) processed, bytes in and out and, when
+memory tracing is on, the peak Python allocation seen while the stage ran.
+Work done on extraction pool workers shows up as wall time only. Plain
+counters (such as slides and bytes saved by deduplication) sit alongside the
+stages.
+
+Metrics are logged as one JSON line on the 'pptx_merger' logger, and
+profile_call() can dump a cProfile (or pyinstrument, when installed) profile
+of a single merge.
+"""
+import cProfile
+import json
+import logging
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger('pptx_merger')
+
+STAGES = ('hash', 'extract', 'background', 'render', 'save')
+PROFILERS = ('cprofile', 'pyinstrument')
+
+# tracemalloc has one process-wide peak; timers share it through these (see _fold_peak)
+_trace_lock = threading.Lock()
+_active_timers = set()  # StageTimers currently tracing a stage
+_trace_users = 0  # MergeMetrics tracing memory; tracemalloc stops when the last one finishes
+_started_tracing = False
+
+
+def _fold_peak():
+    """Credit the peak since the last reset to every active timer, then reset it (call with _trace_lock held)"""
+    peak = tracemalloc.get_traced_memory()[1]
+    for timer in _active_timers:
+        timer._peak = max(timer._peak, peak)
+    tracemalloc.reset_peak()
+
+
+def _start_tracing():
+    global _trace_users, _started_tracing
+    with _trace_lock:
+        if _trace_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _trace_users += 1
+
+
+def _stop_tracing():
+    global _trace_users, _started_tracing
+    with _trace_lock:
+        _trace_users -= 1
+        if _trace_users == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+class StageTimer:
+    """Accumulated measurements for one stage; use as a context manager around each piece of work"""
+
+    def __init__(self, name, trace_memory=False):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.items = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.peak_bytes = 0
+        self._start = None
+
+    def __enter__(self):
+        if self.trace_memory:
+            # Other stages running meanwhile (nested or in other jobs) keep their peak
+            with _trace_lock:
+                _fold_peak()
+                self._base_bytes = self._peak = tracemalloc.get_traced_memory()[0]
+                _active_timers.add(self)
+        self._start = (time.perf_counter(), time.thread_time())
+        return self
+
+    def __exit__(self, *exc):
+        wall_start, cpu_start = self._start
+        self.wall_seconds += time.perf_counter() - wall_start
+        self.cpu_seconds += time.thread_time() - cpu_start
+        self.calls += 1
+        if self.trace_memory:
+            with _trace_lock:
+                _fold_peak()
+                _active_timers.discard(self)
+            self.peak_bytes = max(self.peak_bytes, self._peak - self._base_bytes)
+        return False
+
+    def add(self, items=0, bytes_in=0, bytes_out=0):
+        """Count work done by the stage"""
+        self.items += items
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'wall_seconds': round(self.wall_seconds, 6),
+            'cpu_seconds': round(self.cpu_seconds, 6),
+            'items': self.items,
+            'items_per_second': round(self.items / self.wall_seconds, 1) if self.wall_seconds else None,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'peak_bytes': self.peak_bytes if self.trace_memory else None,
+        }
+
+
+class MergeMetrics:
+    """Stage timers for one merge.
+
+    With `trace_memory` tracemalloc is started (if it is not already running)
+    until finish() is called by the last merge tracing memory; it slows the merge down noticeably and counts
+    allocations from every thread, so keep it for diagnosis.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self._tracing = trace_memory
+        if trace_memory:
+            _start_tracing()
+        self.stages = {}
+        self.counters = {}
+        self._start = time.perf_counter()
+        self.total_seconds = None
+
+    def stage(self, name):
+        """The StageTimer for `name`, created on first use"""
+        timer = self.stages.get(name)
+        if timer is None:
+            timer = self.stages[name] = StageTimer(name, self.trace_memory)
+        return timer
+
+    def count(self, name, value=1):
+        """Add `value` to the counter `name`"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self):
+        """Stop the clock (and memory tracing started by this object); return self"""
+        if self.total_seconds is None:
+            self.total_seconds = time.perf_counter() - self._start
+            if self._tracing:
+                _stop_tracing()
+                self._tracing = False
+        return self
+
+    def as_dict(self):
+        ordered = sorted(self.stages, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES))
+        return {
+            'total_seconds': round(self.total_seconds if self.total_seconds is not None else time.perf_counter() - self._start, 6),
+            'stages': {name: self.stages[name].as_dict() for name in ordered},
+            'counters': dict(self.counters),
+        }
+
+    def rows(self):
+        """One flat dict per stage, for tables"""
+        return [dict(stage=name, **values) for name, values in self.as_dict()['stages'].items()]
+
+    def log(self, event='merge', **fields):
+        """Emit the metrics as one structured (JSON) log line"""
+        record = {'event': event, **fields, **self.as_dict()}
+        logger.info(json.dumps(record, sort_keys=True))
+        return record
+
+
+def configure_logging(level='INFO'):
+    """Send merge metrics to stderr as bare JSON lines (once per process)"""
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level)
+
+
+def profile_call(path, fn, *args, profiler='cprofile', **kwargs):
+    """Call fn(*args, **kwargs) under a profiler, write the profile to `path` and return fn's result.
+
+    cProfile writes a pstats file (open with `python -m pstats` or snakeviz);
+    pyinstrument, if installed, writes an HTML report.
+    """
+    if profiler == 'pyinstrument':
+        from pyinstrument import Profiler  # Optional dependency
+
+        session = Profiler()
+        session.start()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            session.stop()
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(session.output_html())
+    if profiler != 'cprofile':
+        raise ValueError(f"Unsupported profiler: {profiler!r}")
+    session = cProfile.Profile()
+    try:
+        return session.runcall(fn, *args, **kwargs)
+    finally:
+        session.dump_stats(path)
@@ -0,0 +1,210 @@
+"""Background merge jobs on a bounded worker pool.
+
+Merges are submitted as jobs so a long merge never blocks a Streamlit script
+run. A JobQueue runs at most `max_workers` jobs at once and admits at most
+`max_pending` more waiting behind them; further submissions are refused with
+QueueFull. Jobs report files done and slides rendered through the merge
+progress callback, can be cancelled, and keep their result for `result_ttl`
+seconds after finishing. A file a job returns can be wrapped in a SharedFile so
+that downloads may read it while the result expires.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_STATES = ('queued', 'running', 'done', 'failed', 'cancelled')
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+
+class QueueFull(Exception):
+    """Raised when a JobQueue already holds as many jobs as it admits"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been cancelled"""
+
+
+class ResultExpired(Exception):
+    """Raised when reading a job result that has already been dropped"""
+
+
+class SharedFile:
+    """A file in a job result that several readers may read whole at once; close() waits for reads in progress"""
+
+    def __init__(self, file):
+        self._file = file
+        self._lock = threading.Lock()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def read_all(self):
+        """The whole file; raises ResultExpired once the job's result has been dropped"""
+        with self._lock:
+            if self._file.closed:
+                raise ResultExpired("The result has expired; run the job again")
+            self._file.seek(0)
+            return self._file.read()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Job:
+    """State of one submitted job"""
+
+    def __init__(self, files_total):
+        self.id = uuid.uuid4().hex
+        self.state = 'queued'
+        self.files_total = files_total
+        self.files_done = 0
+        self.slides_rendered = 0
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.future = None
+        self.cancel_requested = threading.Event()
+
+    def progress(self, files_done, files_total, slides_rendered):
+        """Merge progress callback: record counts and stop the merge if cancelled"""
+        if self.cancel_requested.is_set():
+            raise JobCancelled()
+        self.files_done = files_done
+        self.files_total = files_total
+        self.slides_rendered = slides_rendered
+
+    def eta_seconds(self):
+        """Estimated seconds left, from the time taken per file so far (None if unknown)"""
+        if self.state != 'running' or not self.files_done or not self.files_total:
+            return None
+        elapsed = time.monotonic() - self.started
+        return elapsed / self.files_done * (self.files_total - self.files_done)
+
+    def status(self):
+        """Snapshot of the job's progress, safe to show in a UI"""
+        end = self.finished or time.monotonic()
+        return {
+            'id': self.id,
+            'state': self.state,
+            'files_done': self.files_done,
+            'files_total': self.files_total,
+            'slides_rendered': self.slides_rendered,
+            'eta_seconds': self.eta_seconds(),
+            'elapsed_seconds': end - self.started if self.started else 0.0,
+            'error': str(self.error) if self.error else None,
+        }
+
+
+class JobQueue:
+    """Bounded pool of background jobs with admission control and result expiry"""
+
+    def __init__(self, max_workers=2, max_pending=8, result_ttl=600):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='merge-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, files_total=0, **kwargs):
+        """Queue fn(progress, *args, **kwargs) and return its job id.
+
+        `progress` is the job's merge progress callback; pass it on to the merge
+        so the job reports progress and can be cancelled. Raises QueueFull when
+        max_workers + max_pending jobs are already queued or running.
+        """
+        with self._lock:
+            self._expire()
+            active = sum(1 for job in self._jobs.values() if job.state not in FINISHED_STATES)
+            if active >= self.max_workers + self.max_pending:
+                raise QueueFull(f"{active} merges are already queued or running")
+            job = Job(files_total)
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def _run(self, job, fn, args, kwargs):
+        with self._lock:
+            if job.cancel_requested.is_set():
+                self._finish(job, 'cancelled')
+                return
+            job.state = 'running'
+            job.started = time.monotonic()
+        try:
+            result = fn(job.progress, *args, **kwargs)
+        except JobCancelled:
+            with self._lock:
+                self._finish(job, 'cancelled')
+        except Exception as e:
+            with self._lock:
+                job.error = e
+                self._finish(job, 'failed')
+        else:
+            with self._lock:
+                job.result = result
+                self._finish(job, 'done')
+
+    def _finish(self, job, state):
+        job.state = state
+        job.finished = time.monotonic()
+        if job.started is None:
+            job.started = job.finished
+
+    def get(self, job_id):
+        """The Job for `job_id`, or None if unknown or expired"""
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def status(self, job_id):
+        """Progress snapshot for `job_id`, or None if unknown or expired"""
+        job = self.get(job_id)
+        return job.status() if job else None
+
+    def result(self, job_id):
+        """Result of a finished job, or None"""
+        job = self.get(job_id)
+        return job.result if job and job.state == 'done' else None
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; return False if it had already finished"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINISHED_STATES:
+                return False
+            job.cancel_requested.set()
+            if job.state == 'queued' and job.future.cancel():
+                self._finish(job, 'cancelled')
+        return True
+
+    def stats(self):
+        """Number of jobs in each state"""
+        with self._lock:
+            self._expire()
+            counts = dict.fromkeys(JOB_STATES, 0)
+            for job in self._jobs.values():
+                counts[job.state] += 1
+            return counts
+
+    def shutdown(self, wait=True):
+        """Cancel everything still queued and stop the workers"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.state not in FINISHED_STATES:
+                    job.cancel_requested.set()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _expire(self):
+        """Forget finished jobs older than the result TTL, closing file-like results"""
+        now = time.monotonic()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and now - job.finished > self.result_ttl:
+                del self._jobs[job_id]
+                for value in (job.result.values() if isinstance(job.result, dict) else [job.result]):
+                    if hasattr(value, 'close'):
+                        value.close()
@@ -0,0 +1,240 @@
+"""Command-line batch merger.
+
+Each positional argument is one job: either a directory (its .pptx/.txt files
+are merged in name order) or a JSON manifest describing one or more jobs:
+
+    {"jobs": [{"name": "sunday", "files": ["intro.pptx", "songs.txt"],
+               "style": {"title_font_size": 80}}]}
+
+Manifest file paths are relative to the manifest. All jobs run in one process
+and a timing line is printed per job.
+
+    python merge_cli.py services/2024-06-02 services/batch.json -o out/
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import merge_engine
+from extract_cache import ExtractionCache
+from instrumentation import PROFILERS, MergeMetrics, configure_logging, profile_call
+
+def parse_color(value):
+    """Parse a colour given as 'RRGGBB', '#RRGGBB' or 'r,g,b' into a list of ints"""
+    value = value.strip()
+    if ',' in value:
+        color = [int(part) for part in value.split(',')]
+    else:
+        value = value.lstrip('#')
+        if len(value) != 6:
+            raise argparse.ArgumentTypeError(f"invalid colour: {value!r}")
+        color = [int(value[i:i+2], 16) for i in (0, 2, 4)]
+    if len(color) != 3 or not all(0 <= c <= 255 for c in color):
+        raise argparse.ArgumentTypeError(f"invalid colour: {value!r}")
+    return color
+
+
+def jobs_from_directory(path):
+    """Build a single job from the supported files in a directory"""
+    files = sorted(
+        os.path.join(path, name) for name in os.listdir(path)
+        if merge_engine.item_type_for(name) and not name.startswith('~$')  # Skip Office lock files
+    )
+    return [{'name': os.path.basename(os.path.normpath(path)), 'files': files, 'style': {}}]
+
+
+def jobs_from_manifest(path):
+    """Build jobs from a JSON manifest (a job object, a list of jobs or {"jobs": [...]})"""
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    default_name = os.path.splitext(os.path.basename(path))[0]
+
+    if isinstance(manifest, dict) and 'jobs' in manifest:
+        entries = manifest['jobs']
+    elif isinstance(manifest, list):
+        entries = manifest
+    else:
+        entries = [manifest]
+
+    jobs = []
+    for index, entry in enumerate(entries):
+        name = entry.get('name') or (default_name if len(entries) == 1 else f"{default_name}_{index + 1}")
+        files = [os.path.join(base_dir, file_path) for file_path in entry.get('files', [])]
+        jobs.append({'name': name, 'files': files, 'style': entry.get('style', {}), 'output': entry.get('output')})
+    return jobs
+
+
+def collect_jobs(paths):
+    """Expand positional arguments into a list of job dicts"""
+    jobs = []
+    for path in paths:
+        if os.path.isdir(path):
+            jobs.extend(jobs_from_directory(path))
+        elif path.lower().endswith('.json'):
+            jobs.extend(jobs_from_manifest(path))
+        else:
+            raise ValueError(f"{path}: expected a directory or a .json manifest")
+    return jobs
+
+
+def style_from_args(args):
+    """Build the base style dict from command-line options"""
+    style = {}
+    for key in ('title_color', 'verse_color', 'title_font_size', 'verse_font_size', 'title_font', 'verse_font', 'background_mode', 'text_fit'):
+        value = getattr(args, key)
+        if value is not None:
+            style[key] = value
+    if args.background:
+        with open(args.background, 'rb') as f:
+            style['background_image'] = merge_engine.resize_image_to_1920x1080(f.read(), args.background_encoding, args.jpeg_quality)
+    return style
+
+
+def run_job(job, base_style, output_dir, render_mode='stamp', executor=None, cache=None, compresslevel=merge_engine.ZIP_COMPRESS_LEVEL,
+            metrics=None, dedup='off'):
+    """Merge one job and return its timing report"""
+    items = []
+    for file_path in job['files']:
+        item_type = merge_engine.item_type_for(file_path)
+        if item_type is None:
+            raise ValueError(f"{file_path}: unsupported file type")
+        items.append((item_type, file_path))
+
+    style = dict(base_style)
+    style.update(job.get('style') or {})
+    output_path = job.get('output') or os.path.join(output_dir, f"{job['name']}.pptx")
+
+    metrics = metrics if metrics is not None else MergeMetrics()
+    start = time.perf_counter()
+    prs = merge_engine.build_merged_presentation(items, style, render_mode, executor=executor, cache=cache, metrics=metrics, dedup=dedup)
+    built = time.perf_counter()
+    merge_engine.save_presentation(prs, output_path, compresslevel, metrics)
+    finished = time.perf_counter()
+    metrics.finish().log(job=job['name'], files=len(items), slides=len(prs.slides), render_mode=render_mode, dedup=dedup)
+
+    return {
+        'name': job['name'],
+        'output': output_path,
+        'files': len(items),
+        'slides': len(prs.slides),
+        'build_seconds': built - start,
+        'save_seconds': finished - built,
+        'total_seconds': finished - start,
+        'dedup_slides_saved': metrics.counters.get('dedup_slides_saved', 0),
+        'dedup_bytes_saved': metrics.counters.get('dedup_bytes_saved', 0),
+        'fit_slides_shrunk': metrics.counters.get('fit_slides_shrunk', 0),
+        'fit_slides_split': metrics.counters.get('fit_slides_split', 0),
+        'fit_slides_added': metrics.counters.get('fit_slides_added', 0),
+        'metrics': metrics.as_dict(),
+    }
+
+
+def print_stage_timings(metrics):
+    """Print the per-stage breakdown of one job"""
+    for name, stage in metrics['stages'].items():
+        peak = f", peak {stage['peak_bytes'] / 1e6:.1f} MB" if stage['peak_bytes'] is not None else ""
+        print(f"  {name:<10} {stage['wall_seconds']:8.3f}s wall {stage['cpu_seconds']:8.3f}s cpu "
+              f"{stage['items']:>7} slides {stage['bytes_in'] / 1e6:8.2f} MB in {stage['bytes_out'] / 1e6:8.2f} MB out{peak}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge PowerPoint and TITLE:-format text files without the web UI.")
+    parser.add_argument('inputs', nargs='+', help="job directories and/or JSON manifests")
+    parser.add_argument('-o', '--output-dir', default='.', help="directory for merged decks (default: current directory)")
+    parser.add_argument('--title-color', type=parse_color, help="title colour, e.g. FFFF00 or 255,255,0")
+    parser.add_argument('--verse-color', type=parse_color, help="verse colour, e.g. FFFFFF")
+    parser.add_argument('--title-font-size', type=int, help="title font size in points")
+    parser.add_argument('--verse-font-size', type=int, help="verse font size in points")
+    parser.add_argument('--title-font', help="title font family")
+    parser.add_argument('--verse-font', help="verse font family")
+    parser.add_argument('--background', help="background image applied to every slide")
+    parser.add_argument('--background-encoding', choices=merge_engine.IMAGE_ENCODINGS, default='png', help="how the resized background is stored (default: png)")
+    parser.add_argument('--jpeg-quality', type=int, default=85, help="JPEG quality for --background-encoding jpeg (default: 85)")
+    parser.add_argument('--background-mode', choices=merge_engine.BACKGROUND_MODES, help="put the background on every slide (picture) or once on the slide layout (layout)")
+    parser.add_argument('--text-fit', choices=merge_engine.FIT_MODES,
+                        help="shrink overflowing text, or split long verses over more slides (default: off)")
+    parser.add_argument('--render-mode', choices=merge_engine.RENDER_MODES, default='stamp', help="slide rendering strategy (default: stamp)")
+    parser.add_argument('--dedup', choices=merge_engine.DEDUP_MODES, default='off',
+                        help="drop slides repeating the previous slide (consecutive) or any earlier slide (global) (default: off)")
+    parser.add_argument('--compress-level', type=int, choices=range(10), default=merge_engine.ZIP_COMPRESS_LEVEL, metavar='0-9',
+                        help=f"zip deflate level for the output (default: {merge_engine.ZIP_COMPRESS_LEVEL}); media is always stored as-is")
+    parser.add_argument('--workers', type=int, default=1, help="extract input files on N workers (default: 1, 0 = one per CPU)")
+    parser.add_argument('--pool', choices=merge_engine.EXTRACT_POOLS, default='process', help="worker pool type for --workers (default: process)")
+    parser.add_argument('--cache-dir', help="keep extracted slide text on disk here, shared between runs")
+    parser.add_argument('--cache-mb', type=int, default=512, help="size limit of --cache-dir in MB (default: 512)")
+    parser.add_argument('--timings', action='store_true', help="print a per-stage timing breakdown for each job")
+    parser.add_argument('--trace-memory', action='store_true', help="also measure peak allocations per stage (slower)")
+    parser.add_argument('--log-json', action='store_true', help="log each job's stage metrics to stderr as a JSON line")
+    parser.add_argument('--profile-dir', help="write a profile of each job to this directory")
+    parser.add_argument('--profiler', choices=PROFILERS, default='cprofile', help="profiler for --profile-dir (default: cprofile)")
+    parser.add_argument('--keep-going', action='store_true', help="continue with the next job when one fails")
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = collect_jobs(args.inputs)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.profile_dir:
+        os.makedirs(args.profile_dir, exist_ok=True)
+    if args.log_json:
+        configure_logging('INFO')
+    base_style = style_from_args(args)
+    # Decks shared between jobs are only extracted once per batch (or once ever with --cache-dir)
+    cache = ExtractionCache(disk_dir=args.cache_dir, max_disk_bytes=args.cache_mb * 1024 * 1024)
+
+    failures = 0
+    total_slides = 0
+    batch_start = time.perf_counter()
+    # One pool for the whole batch so worker start-up is paid once
+    executor = merge_engine.make_extract_executor(args.workers or None, args.pool) if args.workers != 1 else None
+    try:
+        for job in jobs:
+            try:
+                job_args = (job, base_style, args.output_dir, args.render_mode, executor, cache, args.compress_level,
+                            MergeMetrics(args.trace_memory), args.dedup)
+                if args.profile_dir:
+                    extension = 'html' if args.profiler == 'pyinstrument' else 'prof'
+                    profile_path = os.path.join(args.profile_dir, f"{job['name']}.{extension}")
+                    report = profile_call(profile_path, run_job, *job_args, profiler=args.profiler)
+                else:
+                    report = run_job(*job_args)
+            except Exception as e:
+                failures += 1
+                print(f"FAILED {job['name']}: {e}", file=sys.stderr)
+                if not args.keep_going:
+                    return 1
+                continue
+            total_slides += report['slides']
+            slides_per_second = report['slides'] / report['total_seconds'] if report['total_seconds'] else 0.0
+            print(
+                f"{report['name']}: {report['files']} files, {report['slides']} slides "
+                f"in {report['total_seconds']:.2f}s (build {report['build_seconds']:.2f}s, "
+                f"save {report['save_seconds']:.2f}s, {slides_per_second:.0f} slides/s) -> {report['output']}"
+            )
+            if args.dedup != 'off':
+                print(f"  dedup: {report['dedup_slides_saved']} duplicate slides dropped, "
+                      f"{report['dedup_bytes_saved'] / 1e3:.1f} KB of slide XML saved")
+            if report['fit_slides_shrunk'] or report['fit_slides_split']:
+                print(f"  text fit: {report['fit_slides_shrunk']} slides shrunk, "
+                      f"{report['fit_slides_split']} split into {report['fit_slides_added']} extra slides")
+            if args.timings:
+                print_stage_timings(report['metrics'])
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    elapsed = time.perf_counter() - batch_start
+    cache_stats = cache.stats()
+    print(
+        f"{len(jobs) - failures}/{len(jobs)} jobs, {total_slides} slides in {elapsed:.2f}s "
+        f"(extraction cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses)"
+    )
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
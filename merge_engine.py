@@ -0,0 +1,734 @@
+"""Headless merge engine used by the Streamlit app and the command-line tool.
+
+Everything in here is free of Streamlit so that merges can run in batch jobs,
+worker processes or tests without a browser session.
+"""
+import copy
+import hashlib
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+import weakref
+import zipfile
+from collections import OrderedDict
+from io import BytesIO
+
+from pptx import Presentation
+from pptx.enum.text import MSO_ANCHOR, PP_ALIGN
+from pptx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from pptx.opc.oxml import serialize_part_xml
+from pptx.opc.package import Part
+from pptx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI, PackURI
+from pptx.opc.serialized import _ContentTypesItem
+from pptx.oxml import parse_xml
+from pptx.oxml.shapes.picture import CT_Picture
+from pptx.parts.slide import SlidePart
+from pptx.util import Inches, Pt
+from pptx.dml.color import RGBColor
+from PIL import Image
+
+# Extraction lives in its own module so worker processes don't import python-pptx; re-exported here
+from extraction import (  # noqa: F401
+    EXTRACT_POOLS,
+    PPTX_MIME,
+    SUPPORTED_EXTENSIONS,
+    classify_pptx_slides,
+    create_template_txt,
+    extract_item,
+    extract_items,
+    extract_pptx_slides,
+    extract_text_from_slide,
+    extract_txt_slides,
+    item_size,
+    item_type_for,
+    iter_extract_items,
+    iter_item_slides,
+    iter_txt_file,
+    iter_txt_slides,
+    make_extract_executor,
+    parse_txt_file,
+)
+from instrumentation import MergeMetrics
+from slide_ir import DEDUP_MODES, ROLE_TITLE, ROLE_VERSE, Slide, SlideBatch, SlideDeduplicator, is_all_caps
+from text_fit import FIT_MODES, TextFitter
+
+# Style used when a caller does not override a setting (matches the app defaults)
+DEFAULT_STYLE = {
+    'title_color': [255, 255, 0],  # Yellow
+    'verse_color': [255, 255, 255],  # White
+    'title_font_size': 72,
+    'verse_font_size': 65,
+    'title_font': 'Arial',
+    'verse_font': 'Arial',
+    'background_image': None,
+    'background_mode': 'picture',
+    'text_fit': 'off',  # See text_fit.FIT_MODES
+}
+
+# 'picture' adds a full-slide picture to every slide (one shared image part),
+# 'layout' puts it on the blank layout once so slides carry no picture shape
+BACKGROUND_MODES = ('picture', 'layout')
+
+BLANK_LAYOUT_INDEX = 6
+LAYOUT_BACKGROUND_NAME = "Background Picture"
+
+_background_parts = weakref.WeakKeyDictionary()  # presentation part -> (image bytes, ImagePart)
+
+# Background image output encodings (see resize_image_to_1920x1080)
+IMAGE_ENCODINGS = ('png', 'jpeg', 'passthrough')
+BACKGROUND_SIZE = (1920, 1080)
+RESIZE_CACHE_ENTRIES = 16
+
+_resize_cache = OrderedDict()  # (source sha256, size, encoding, quality) -> encoded bytes
+_resize_lock = threading.Lock()
+
+TEMPLATE_CACHE_ENTRIES = 8
+
+_template_cache = OrderedDict()  # style digest -> template .pptx bytes
+_template_lock = threading.Lock()
+
+# zlib level for XML parts (0-9); media listed below is stored as-is since deflating it gains nothing
+ZIP_COMPRESS_LEVEL = 6
+STORED_CONTENT_TYPES = frozenset((CT.PNG, CT.JPEG, CT.GIF, CT.MP4, CT.MPG, CT.MOV))
+# Output written to a spooled_output() stays in memory up to this size, then moves to a temp file
+OUTPUT_SPOOL_BYTES = 8 * 1024 * 1024
+
+# 'stamp' clones per-style prototype slide XML, 'objects' builds every slide through python-pptx
+RENDER_MODES = ('stamp', 'objects')
+
+# Progress callbacks get (files_done, files_total, slides_rendered): once before extraction, after
+# every PROGRESS_SLIDES slides and after each file. An exception raised by the callback aborts the merge.
+PROGRESS_SLIDES = 50
+
+# Control characters python-pptx rewrites as _xHHHH_ when setting run text (tab and newline are kept)
+_RUN_CTRL_CHARS = re.compile(r"[\x00-\x08\x0B-\x1F]")
+_STAMP_MARKER = b"@@SLIDE_TEXT@@"
+
+
+def _encode_image(img, encoding, jpeg_quality):
+    """Encode a PIL image as optimized PNG or quality-controlled JPEG"""
+    # Convert to RGB if necessary (for JPEG compatibility)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    output = BytesIO()
+    if encoding == 'jpeg':
+        img.save(output, format='JPEG', quality=jpeg_quality, optimize=True)
+    else:
+        img.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+
+def resize_image_to_1920x1080(image_bytes, encoding='png', jpeg_quality=85, size=BACKGROUND_SIZE):
+    """Resize image to 1920x1080 pixels.
+
+    `encoding` picks the output: 'png' (lossless, optimized), 'jpeg' (at
+    `jpeg_quality`) or 'passthrough' (the original bytes when the source is
+    already a PNG/JPEG of the target size, otherwise PNG). Results are memoized
+    by source hash and settings, so Streamlit reruns don't redo the work.
+    """
+    if encoding not in IMAGE_ENCODINGS:
+        raise ValueError(f"Unsupported image encoding: {encoding!r}")
+    key = (hashlib.sha256(image_bytes).hexdigest(), tuple(size), encoding, jpeg_quality if encoding == 'jpeg' else None)
+    with _resize_lock:
+        cached = _resize_cache.get(key)
+        if cached is not None:
+            _resize_cache.move_to_end(key)
+            return cached
+
+    try:
+        # Open image from bytes
+        img = Image.open(BytesIO(image_bytes))
+        if encoding == 'passthrough' and img.size == tuple(size) and img.format in ('PNG', 'JPEG'):
+            result = image_bytes
+        else:
+            if encoding == 'passthrough':
+                encoding = 'png'
+            # Resize to 1920x1080 (use LANCZOS resampling for quality)
+            try:
+                # Try newer API first
+                resized_img = img.resize(tuple(size), Image.Resampling.LANCZOS)
+            except AttributeError:
+                # Fallback for older Pillow versions
+                resized_img = img.resize(tuple(size), Image.LANCZOS)
+            result = _encode_image(resized_img, encoding, jpeg_quality)
+    except Exception as e:
+        # If resizing fails, return original
+        return image_bytes
+
+    with _resize_lock:
+        _resize_cache[key] = result
+        while len(_resize_cache) > RESIZE_CACHE_ENTRIES:
+            _resize_cache.popitem(last=False)
+    return result
+
+
+def background_image_part(target_presentation, background_image):
+    """Image part for `background_image`, added to the presentation's package only once.
+
+    python-pptx's add_picture() re-parses and SHA-1 hashes the image and walks every
+    part in the package looking for a duplicate on each call.
+    """
+    prs_part = target_presentation.part
+    cached = _background_parts.get(prs_part)
+    if cached is not None and (cached[0] is background_image or cached[0] == background_image):
+        return cached[1]
+    image_part = prs_part.package.get_or_add_image_part(BytesIO(background_image))
+    _background_parts[prs_part] = (background_image, image_part)
+    return image_part
+
+
+def apply_layout_background(target_presentation, background_image):
+    """Put the background picture on the blank slide layout (once per presentation)"""
+    layout = target_presentation.slide_layouts[BLANK_LAYOUT_INDEX]
+    spTree = layout._element.cSld.spTree
+    if any(pic.get('name') == LAYOUT_BACKGROUND_NAME for pic in spTree.xpath('./p:pic/p:nvPicPr/p:cNvPr')):
+        return
+    image_part = background_image_part(target_presentation, background_image)
+    rId = layout.part.relate_to(image_part, RT.IMAGE)
+    shape_id = max([int(shape_id) for shape_id in spTree.xpath('.//p:cNvPr/@id')] + [0]) + 1
+    pic = CT_Picture.new_pic(shape_id, LAYOUT_BACKGROUND_NAME, image_part.desc, rId, 0, 0, target_presentation.slide_width, target_presentation.slide_height)
+    # First in z-order (right after p:nvGrpSpPr and p:grpSpPr), behind any layout shapes
+    spTree.insert(2, pic)
+
+
+def create_formatted_slide(target_presentation, text, is_title, title_color, verse_color, title_font_size, verse_font_size, title_font, verse_font, background_image=None, background_mode='picture'):
+    """Create a new slide with formatted text"""
+    # Use blank layout
+    blank_slide_layout = target_presentation.slide_layouts[BLANK_LAYOUT_INDEX]
+    slide = target_presentation.slides.add_slide(blank_slide_layout)
+
+    # Get slide dimensions
+    slide_width = target_presentation.slide_width
+    slide_height = target_presentation.slide_height
+
+    # Add background image if provided (add it first so text appears on top)
+    if background_image:
+        try:
+            if background_mode == 'layout':
+                # Picture lives on the blank layout, so the slide needs no shape of its own
+                apply_layout_background(target_presentation, background_image)
+            else:
+                # Add image to cover entire slide, sharing one image part across slides
+                image_part = background_image_part(target_presentation, background_image)
+                rId = slide.part.relate_to(image_part, RT.IMAGE)
+                slide.shapes._add_pic_from_image_part(
+                    image_part,
+                    rId,
+                    0,  # left
+                    0,  # top
+                    slide_width,  # width
+                    slide_height  # height
+                )
+        except Exception:
+            pass
+
+    # Set black background (if no image, or as fallback)
+    background = slide.background
+    fill = background.fill
+    fill.solid()
+    fill.fore_color.rgb = RGBColor(0, 0, 0)  # Black
+
+    # Create text box stretching from left to right edge
+    width = slide_width  # Full width of slide
+    height = Inches(7)  # Keep reasonable height
+    left = 0  # Start from leftmost edge
+    top = (slide_height - height) / 2  # Center vertically
+
+    textbox = slide.shapes.add_textbox(left, top, width, height)
+    text_frame = textbox.text_frame
+    text_frame.word_wrap = True
+    text_frame.vertical_anchor = MSO_ANCHOR.MIDDLE  # Middle vertical alignment
+    text_frame.margin_left = Inches(0.5)  # Small padding from left edge
+    text_frame.margin_right = Inches(0.5)  # Small padding from right edge
+    text_frame.margin_top = Inches(0.5)
+    text_frame.margin_bottom = Inches(0.5)
+
+    # Clear default paragraph
+    text_frame.clear()
+
+    # Add text with formatting
+    paragraph = text_frame.paragraphs[0]
+    paragraph.alignment = PP_ALIGN.CENTER  # Center alignment
+    paragraph.space_after = Pt(0)
+
+    run = paragraph.add_run()
+    run.text = text  # Preserve original case
+    font = run.font
+
+    # Set font properties: use title settings if it's marked as title OR if it's all caps
+    if is_title or is_all_caps(text):
+        font.name = title_font  # Use selected title font
+        font.size = Pt(title_font_size)  # Use selected title font size
+        font.color.rgb = RGBColor(*title_color)  # Use selected title color
+        font.bold = True  # Bold for titles
+    else:
+        font.name = verse_font  # Use selected verse font
+        font.size = Pt(verse_font_size)  # Use selected verse font size
+        font.color.rgb = RGBColor(*verse_color)  # Use selected verse color
+        font.bold = False
+
+    return slide
+
+
+def escape_run_text(text):
+    """Escape run text exactly as python-pptx and lxml would when serializing an a:t element"""
+    text = _RUN_CTRL_CHARS.sub(lambda match: "_x%04X_" % ord(match.group()), text)
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').encode('utf-8')
+
+
+class SlideAppender:
+    """Append slide parts to a presentation in O(1) per slide.
+
+    python-pptx's add_slide() looks for an existing relationship to the new part
+    by rebuilding a map of every presentation relationship, and picks the next
+    slide id by scanning every p:sldId, so appends get slower as the deck grows.
+    This tracks the slide count and next slide id directly. Call sync() after
+    slides are added or removed any other way.
+    """
+
+    def __init__(self, target_presentation):
+        self.target_presentation = target_presentation
+        self._prs_part = target_presentation.part
+        self._sldIdLst = target_presentation._element.get_or_add_sldIdLst()
+        self.sync()
+
+    def sync(self):
+        """Re-read the counters from the presentation"""
+        self._slide_count = len(self._sldIdLst)
+        self._next_slide_id = self._sldIdLst._next_id
+
+    def next_partname(self):
+        """Partname for the next appended slide (same numbering as python-pptx)"""
+        return PackURI("/ppt/slides/slide%d.xml" % (self._slide_count + 1))
+
+    def append(self, slide_part):
+        """Relate `slide_part` to the presentation and add it to the end of the slide list"""
+        # The part is new, so skip get_or_add()'s search for an existing relationship
+        rId = self._prs_part.rels._add_relationship(RT.SLIDE, slide_part)
+        self._sldIdLst._add_sldId(id=self._next_slide_id, rId=rId)
+        self._slide_count += 1
+        self._next_slide_id += 1
+        return rId
+
+
+class StampedSlidePart(SlidePart):
+    """Slide part holding stamped XML bytes, parsed only if something reads the slide element"""
+
+    def __init__(self, partname, package, blob):
+        Part.__init__(self, partname, CT.PML_SLIDE, package)
+        self._stamped_blob = blob
+        self._parsed_element = None
+
+    @property
+    def _element(self):
+        if self._parsed_element is None:
+            self._parsed_element = parse_xml(self._stamped_blob)
+            self._stamped_blob = None
+        return self._parsed_element
+
+    @_element.setter
+    def _element(self, element):
+        self._parsed_element = element
+        self._stamped_blob = None
+
+    @property
+    def blob(self):
+        if self._stamped_blob is not None:
+            return self._stamped_blob
+        return serialize_part_xml(self._parsed_element)
+
+
+class SlideStamper:
+    """Append formatted slides by cloning prototype slide XML instead of building shapes.
+
+    The first slide of each styling is created normally with
+    create_formatted_slide() and becomes a prototype; a slide at another font
+    size gets a copy with only the run's size changed. Every later slide reuses
+    the prototype's serialized XML with only the escaped run text substituted, so
+    the saved package is byte-for-byte what the 'objects' path produces.
+    """
+
+    def __init__(self, target_presentation, style):
+        self.target_presentation = target_presentation
+        self.style = style
+        # (is_title_styled, font size or None) -> (prefix, suffix, [(reltype, target_part), ...])
+        self._prototypes = {}
+        self._appender = SlideAppender(target_presentation)
+
+    def add_slide(self, text, is_title, font_size=None):
+        """Append one formatted slide for `text`"""
+        self.add_slides([text], [bool(is_title or is_all_caps(text))], [font_size])
+
+    def add_slides(self, texts, title_styled, font_sizes=None):
+        """Append a formatted slide per text; `title_styled` holds each slide's precomputed styling flag.
+
+        `font_sizes` may give a slide a size other than the style's (None keeps it).
+        """
+        package = self.target_presentation.part.package
+        for text, styled, font_size in zip(texts, title_styled, font_sizes or itertools.repeat(None)):
+            prototype = self._prototypes.get((styled, font_size))
+            if prototype is None:
+                prototype = self._resized_prototype(styled, font_size)
+            if prototype is None:
+                slide = ObjectSlideRenderer(self.target_presentation, self.style).add_slide(text, styled, font_size)
+                self._prototypes[styled, font_size] = self._capture_prototype(slide)
+                self._appender.sync()
+                continue
+
+            prefix, suffix, relationships = prototype
+            slide_part = StampedSlidePart(self._appender.next_partname(), package, prefix + escape_run_text(text) + suffix)
+            # Relate in prototype order so the rIds inside the XML (layout, picture) line up
+            for reltype, target_part in relationships:
+                slide_part.relate_to(target_part, reltype)
+            self._appender.append(slide_part)
+
+    def slide_xml_overhead(self, title_styled):
+        """Bytes of slide XML besides the run text (a slide with this styling must have been added)"""
+        prefix, suffix, _ = next(prototype for (styled, _), prototype in self._prototypes.items() if styled == title_styled)
+        return len(prefix) + len(suffix)
+
+    def sync(self):
+        """Re-read slide counters after slides were added or removed outside this renderer"""
+        self._appender.sync()
+
+    def _resized_prototype(self, title_styled, font_size):
+        """Prototype at `font_size` derived from the style-size one, or None if there is none yet"""
+        base = self._prototypes.get((title_styled, None))
+        if base is None or font_size is None:
+            return None
+        prefix, suffix, relationships = base
+        style_size = self.style['title_font_size' if title_styled else 'verse_font_size']
+        size_attribute = b' sz="%d"' % Pt(style_size).centipoints
+        if prefix.count(size_attribute) != 1:
+            return None
+        prototype = prefix.replace(size_attribute, b' sz="%d"' % Pt(font_size).centipoints), suffix, relationships
+        self._prototypes[title_styled, font_size] = prototype
+        return prototype
+
+    def _capture_prototype(self, slide):
+        """Split a rendered slide's XML around its run text"""
+        element = copy.deepcopy(slide._element)
+        text_elements = element.xpath('.//a:r/a:t')
+        if len(text_elements) != 1:
+            raise ValueError("Prototype slide must contain exactly one text run")
+        text_elements[0].text = _STAMP_MARKER.decode('ascii')
+        prefix, suffix = serialize_part_xml(element).split(_STAMP_MARKER)
+
+        rels = slide.part.rels
+        relationships = [
+            (rels[rId].reltype, rels[rId].target_part)
+            for rId in sorted(rels.keys(), key=lambda rId: int(rId[3:]))
+        ]
+        return prefix, suffix, relationships
+
+
+class ObjectSlideRenderer:
+    """Append formatted slides by building each one through python-pptx"""
+
+    def __init__(self, target_presentation, style):
+        self.target_presentation = target_presentation
+        self.style = style
+        self._xml_overhead = {}  # is_title_styled -> slide XML bytes besides the run text
+
+    def sync(self):
+        """Nothing to re-read; python-pptx recomputes its counters on every append"""
+
+    def add_slide(self, text, is_title, font_size=None):
+        """Append one formatted slide for `text` (at `font_size` instead of the style's size, if given) and return it"""
+        style = self.style
+        title_font_size = font_size or style['title_font_size']
+        verse_font_size = font_size or style['verse_font_size']
+        slide = create_formatted_slide(self.target_presentation, text, is_title, style['title_color'], style['verse_color'], title_font_size, verse_font_size, style['title_font'], style['verse_font'], style['background_image'], style['background_mode'])
+        title_styled = bool(is_title or is_all_caps(text))
+        if title_styled not in self._xml_overhead:
+            self._xml_overhead[title_styled] = len(serialize_part_xml(slide._element)) - len(escape_run_text(text))
+        return slide
+
+    def slide_xml_overhead(self, title_styled):
+        """Bytes of slide XML besides the run text (a slide with this styling must have been added)"""
+        return self._xml_overhead[title_styled]
+
+    def add_slides(self, texts, title_styled, font_sizes=None):
+        """Append a formatted slide per text; `title_styled` holds each slide's precomputed styling flag"""
+        for text, styled, font_size in zip(texts, title_styled, font_sizes or itertools.repeat(None)):
+            self.add_slide(text, styled, font_size)
+
+
+def slide_renderer(target_presentation, style, render_mode='stamp'):
+    """Return the slide renderer for `render_mode` (see RENDER_MODES)"""
+    if render_mode == 'stamp':
+        return SlideStamper(target_presentation, style)
+    if render_mode == 'objects':
+        return ObjectSlideRenderer(target_presentation, style)
+    raise ValueError(f"Unsupported render mode: {render_mode!r}")
+
+
+def new_presentation():
+    """Create an empty 16:9 widescreen presentation"""
+    prs = Presentation()
+
+    # Set slide dimensions to 16:9 Widescreen aspect ratio
+    # Width: 13.33 inches, Height: 7.5 inches
+    prs.slide_width = Inches(13.33)
+    prs.slide_height = Inches(7.5)
+
+    # Remove default empty slide
+    if prs.slides:
+        prs.slides.remove(prs.slides[0])
+
+    return prs
+
+
+def create_template_powerpoint(title_color, verse_color, title_font_size, verse_font_size, title_font, verse_font, background_image=None, background_mode='picture'):
+    """Create a PowerPoint template with 1 title slide and 1 verse slide"""
+    template_prs = new_presentation()
+
+    # Create title slide
+    create_formatted_slide(template_prs, "YOUR TITLE HERE", True, title_color, verse_color, title_font_size, verse_font_size, title_font, verse_font, background_image, background_mode)
+
+    # Create verse slide
+    create_formatted_slide(template_prs, "Your verse text here\nYou can add multiple lines\nEach line will appear on the slide", False, title_color, verse_color, title_font_size, verse_font_size, title_font, verse_font, background_image, background_mode)
+
+    return template_prs
+
+
+def template_pptx_bytes(style=None):
+    """Saved .pptx bytes of the template for `style`, memoized by style_digest()"""
+    style = resolve_style(style)
+    key = style_digest(style)
+    with _template_lock:
+        cached = _template_cache.get(key)
+        if cached is not None:
+            _template_cache.move_to_end(key)
+            return cached
+
+    template_prs = create_template_powerpoint(style['title_color'], style['verse_color'], style['title_font_size'], style['verse_font_size'], style['title_font'], style['verse_font'], style['background_image'], style['background_mode'])
+    data = save_presentation(template_prs)
+
+    with _template_lock:
+        _template_cache[key] = data
+        while len(_template_cache) > TEMPLATE_CACHE_ENTRIES:
+            _template_cache.popitem(last=False)
+    return data
+
+
+def resolve_style(style=None):
+    """Return a complete style dict, filling missing settings from DEFAULT_STYLE"""
+    resolved = dict(DEFAULT_STYLE)
+    if style:
+        resolved.update(style)
+    return resolved
+
+
+def style_digest(style):
+    """Stable hex digest of a style dict (the background image is hashed by content)"""
+    style = resolve_style(style)
+    background_image = style['background_image']
+    comparable = dict(style, background_image=hashlib.sha256(background_image).hexdigest() if background_image else None)
+    return hashlib.sha256(json.dumps(comparable, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _styled_chunks(slides, size):
+    """(texts, title_styled) lists of up to `size` slides from a SlideBatch or an iterable of Slides or (text, is_title) pairs"""
+    if isinstance(slides, SlideBatch):
+        texts, styled = slides.texts, slides.title_styled()
+        for start in range(0, len(texts), size):
+            yield texts[start:start + size], styled[start:start + size]
+        return
+    slides = iter(slides)
+    while True:
+        chunk = list(itertools.islice(slides, size))
+        if not chunk:
+            return
+        if not isinstance(chunk[0], Slide):
+            chunk = [Slide(text, ROLE_TITLE if is_title else ROLE_VERSE) for text, is_title in chunk]
+        yield [slide.text for slide in chunk], [slide.title_styled for slide in chunk]
+
+
+def render_slides(renderer, slides, on_slides=None, fitter=None):
+    """Append formatted slides for a SlideBatch (or an iterable of Slides) using a slide renderer; return how many.
+
+    Plain (text, is_title) pairs are accepted too. Slides are handed to the renderer PROGRESS_SLIDES at a time with their
+    precomputed styling. `on_slides`, if given, is called with the number of
+    slides appended so far every PROGRESS_SLIDES slides. `fitter`, an optional
+    text_fit.TextFitter, shrinks or splits slides whose text overflows.
+    """
+    count = 0
+    for texts, title_styled in _styled_chunks(slides, PROGRESS_SLIDES):
+        if fitter is None:
+            renderer.add_slides(texts, title_styled)
+            count += len(texts)
+        else:
+            fitted_texts, fitted_styled, font_sizes = fitter.fit_slides(texts, title_styled)
+            renderer.add_slides(fitted_texts, fitted_styled, font_sizes)
+            count += len(fitted_texts)
+        if on_slides is not None and len(texts) == PROGRESS_SLIDES:
+            on_slides(count)
+    return count
+
+
+def _no_progress(files_done, files_total, slides_rendered):
+    pass
+
+
+def _timed_iter(iterator, timer):
+    """Yield from `iterator`, adding the time spent producing each element to `timer`"""
+    while True:
+        with timer:
+            element = next(iterator, None)
+        if element is None:
+            return
+        yield element
+
+
+def prepare_background(target_presentation, style):
+    """Add the style's background image to the package ahead of the first slide; return its size"""
+    background_image = style['background_image']
+    if not background_image:
+        return 0
+    if style['background_mode'] == 'layout':
+        apply_layout_background(target_presentation, background_image)
+    else:
+        background_image_part(target_presentation, background_image)
+    return len(background_image)
+
+
+def render_items(target_presentation, renderer, style, items, extracted, metrics, progress, files_done=0, files_total=None,
+                 dedup=None):
+    """Render each item's slides as its extraction finishes, timing the 'extract', 'background' and 'render' stages.
+
+    `extracted` yields the slides of `items` in order, as SlideBatches or (for
+    lazily parsed files) iterators of Slides. `dedup` is an optional
+    SlideDeduplicator the slides pass through first. Overflowing text is fitted
+    as the style's 'text_fit' says, counting 'fit_slides_shrunk', 'fit_slides_split'
+    and 'fit_slides_added' in `metrics`. Yields (item index, slide count) after
+    each item is rendered.
+    """
+    files_total = len(items) if files_total is None else files_total
+    fitter = TextFitter(style) if style['text_fit'] != 'off' else None
+    extract_timer = metrics.stage('extract')
+    render_timer = metrics.stage('render')
+    background_ready = False
+    slides_rendered = 0
+    for index, (_, item_data) in enumerate(items):
+        with extract_timer:
+            slides = next(extracted)
+            if dedup is not None:
+                slides = dedup.filter(slides)
+            if not isinstance(slides, SlideBatch):
+                slides = iter(slides)
+                first = next(slides, None)
+                slides = [] if first is None else itertools.chain([first], _timed_iter(slides, extract_timer))
+        if slides and not background_ready:
+            with metrics.stage('background') as timer:
+                timer.add(bytes_in=prepare_background(target_presentation, style))
+            background_ready = True
+        # Lazily parsed slides are extracted during rendering: keep that time out of 'render'
+        extract_wall, extract_cpu = extract_timer.wall_seconds, extract_timer.cpu_seconds
+        with render_timer:
+            count = render_slides(renderer, slides, lambda count: progress(files_done, files_total, slides_rendered + count), fitter)
+        render_timer.wall_seconds -= extract_timer.wall_seconds - extract_wall
+        render_timer.cpu_seconds -= extract_timer.cpu_seconds - extract_cpu
+        extract_timer.add(items=count, bytes_in=item_size(item_data))
+        render_timer.add(items=count)
+        slides_rendered += count
+        files_done += 1
+        progress(files_done, files_total, slides_rendered)
+        yield index, count
+    if fitter is not None:
+        metrics.count('fit_slides_shrunk', fitter.slides_shrunk)
+        metrics.count('fit_slides_split', fitter.slides_split)
+        metrics.count('fit_slides_added', fitter.slides_added)
+
+
+def build_merged_presentation(items, style=None, render_mode='stamp', workers=1, pool='process', executor=None, cache=None, digests=None,
+                              progress=None, metrics=None, dedup='off'):
+    """Build the merged Presentation for ordered (item_type, data) items.
+
+    `workers`, `pool`, `executor`, `cache` and `digests` control extraction
+    (see extract_items); files are rendered as soon as they are extracted.
+    `progress` is an optional progress callback (see PROGRESS_SLIDES) and
+    `metrics` an optional instrumentation.MergeMetrics to record stages in.
+    `dedup` (see DEDUP_MODES) drops slides repeating the previous slide or
+    any earlier one; the slides and slide XML bytes saved are counted in
+    `metrics` as 'dedup_slides_saved' and 'dedup_bytes_saved'. The style's
+    'text_fit' (see FIT_MODES) shrinks or splits slides whose text overflows.
+    """
+    items = list(items)
+    progress = progress or _no_progress
+    metrics = metrics if metrics is not None else MergeMetrics()
+    style = resolve_style(style)
+    merged_presentation = new_presentation()
+    renderer = slide_renderer(merged_presentation, style, render_mode)
+    deduplicator = SlideDeduplicator(dedup, lambda text: len(escape_run_text(text))) if dedup != 'off' else None
+    progress(0, len(items), 0)
+    extracted = iter_extract_items(items, workers, pool, executor, cache, digests, lazy=True)
+    for _ in render_items(merged_presentation, renderer, style, items, extracted, metrics, progress, dedup=deduplicator):
+        pass
+    if deduplicator is not None:
+        metrics.count('dedup_slides_saved', deduplicator.slides_saved)
+        metrics.count('dedup_bytes_saved', deduplicator.bytes_saved(renderer.slide_xml_overhead))
+    return merged_presentation
+
+
+def spooled_output(max_memory=OUTPUT_SPOOL_BYTES):
+    """Temporary file for a merged deck that only spills to disk once it gets large"""
+    return tempfile.SpooledTemporaryFile(max_size=max_memory, mode='w+b', suffix='.pptx')
+
+
+def write_package(prs, output, compresslevel=ZIP_COMPRESS_LEVEL):
+    """Write a presentation's package to `output` (path or seekable file object).
+
+    Same members as Presentation.save(), written one part at a time, but with a
+    configurable deflate level and already-compressed media stored uncompressed.
+    """
+    package = prs.part.package
+    parts = tuple(package.iter_parts())
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=compresslevel,
+                         strict_timestamps=False) as zf:
+        zf.writestr(CONTENT_TYPES_URI.membername, serialize_part_xml(_ContentTypesItem.xml_for(parts)))
+        zf.writestr(PACKAGE_URI.rels_uri.membername, package._rels.xml)
+        for part in parts:
+            if part.content_type in STORED_CONTENT_TYPES:
+                zf.writestr(part.partname.membername, part.blob, compress_type=zipfile.ZIP_STORED)
+            else:
+                zf.writestr(part.partname.membername, part.blob)
+            if part._rels:
+                zf.writestr(part.partname.rels_uri.membername, part.rels.xml)
+
+
+def save_presentation(prs, output=None, compresslevel=ZIP_COMPRESS_LEVEL, metrics=None):
+    """Save a presentation to `output` (path or file object), or return its bytes"""
+    with (metrics if metrics is not None else MergeMetrics()).stage('save') as timer:
+        if output is None:
+            buffer = BytesIO()
+            write_package(prs, buffer, compresslevel)
+            timer.add(items=len(prs.slides), bytes_out=buffer.tell())
+            return buffer.getvalue()
+        write_package(prs, output, compresslevel)
+        if hasattr(output, 'seek'):
+            timer.add(items=len(prs.slides), bytes_out=output.tell())
+            output.seek(0)
+        else:
+            timer.add(items=len(prs.slides), bytes_out=os.path.getsize(output))
+        return output
+
+
+def merge(items, style=None, output=None, render_mode='stamp', workers=1, pool='process', executor=None, cache=None, digests=None,
+          compresslevel=ZIP_COMPRESS_LEVEL, progress=None, metrics=None, dedup='off'):
+    """Merge ordered (item_type, data) items into one formatted presentation.
+
+    `items` is a sequence of ('pptx' | 'txt', data) pairs where data is bytes, a
+    path or a binary file object. Returns the .pptx bytes when `output` is None,
+    otherwise writes to `output` (a path or file object, e.g. spooled_output())
+    and returns it, rewound. Stage metrics are logged when the merge finishes.
+    """
+    items = list(items)
+    metrics = metrics if metrics is not None else MergeMetrics()
+    prs = build_merged_presentation(items, style, render_mode, workers, pool, executor, cache, digests, progress, metrics, dedup)
+    result = save_presentation(prs, output, compresslevel, metrics)
+    metrics.finish().log(files=len(items), slides=len(prs.slides), render_mode=render_mode, dedup=dedup)
+    return result
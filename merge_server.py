@@ -0,0 +1,448 @@
+"""Local HTTP merge service for scheduling systems and other pipelines.
+
+Runs next to (or instead of) the Streamlit app and merges on a bounded pool
+of worker processes. Requests beyond the workers wait in a queue of
+--queue places; when that is full the server answers 503 with Retry-After.
+
+    python merge_server.py --port 8502 --workers 4
+
+    POST /files    store the request body in the upload spool (name it with
+                   ?name=songs.txt); answers {"sha256", "size", "type"}
+    POST /merge    merge and stream back the .pptx, given either
+                   multipart/form-data: "file" parts (uploads) and "ref" parts
+                   (JSON references, below) in merge order, plus optional
+                   "style" (JSON), "dedup" and "background" (an image) parts
+                   or application/json: {"files": [ref, ...], "style": {...},
+                   "dedup": "off", "background": {"spool": sha256}}
+    GET  /health   liveness and queue state
+    GET  /metrics  request, merge and throughput counters
+
+A ref is {"spool": sha256} for a file stored with POST /files (or uploaded in
+the app) or {"library": sha256} for a deck library file, with "type" ('pptx'
+or 'txt') or a "name" to take it from. Style keys are those of
+merge_engine.DEFAULT_STYLE; colours may also be given as 'RRGGBB' strings.
+Errors are JSON {"error": ...} with status 400, 404, 411, 413 or 503.
+"""
+import argparse
+import collections
+import json
+import math
+import multiprocessing
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from email import policy
+from email.parser import BytesParser
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import merge_engine
+from deck_library import DeckLibrary
+from extract_cache import ExtractionCache
+from file_spool import FileSpool, default_spool_dir
+from instrumentation import MergeMetrics, configure_logging, logger
+from jobs import QueueFull
+from merge_cli import parse_color
+
+DEFAULT_PORT = 8502
+MAX_REQUEST_MB = 256
+LATENCY_SAMPLES = 1000  # Recent merges kept for the latency percentiles
+_STREAM_CHUNK_SIZE = 1024 * 1024
+_SHA256_HEX = re.compile(r"[0-9a-f]{64}")
+_ZIP_MAGIC = b"PK\x03\x04"  # Start of every .pptx (a zip package)
+
+_worker_cache = None  # Extraction cache of a worker process
+
+
+class UnknownFile(Exception):
+    """Raised for a reference to a file that is not in the spool or library"""
+
+
+def parse_style(data):
+    """Validated style dict from a request's style JSON object (without the background image)"""
+    if not isinstance(data, dict):
+        raise ValueError("style must be a JSON object")
+    style = {}
+    for key, value in data.items():
+        if key not in merge_engine.DEFAULT_STYLE or key == 'background_image':
+            raise ValueError(f"Unknown style setting: {key!r}")
+        if key.endswith('_color'):
+            try:
+                if isinstance(value, str):
+                    value = parse_color(value)
+                elif any(isinstance(part, bool) for part in value):
+                    raise TypeError("colour parts must be numbers")
+                else:
+                    value = [int(part) for part in value]
+            except (argparse.ArgumentTypeError, TypeError, ValueError) as e:
+                raise ValueError(f"{key}: {e}")
+            if len(value) != 3 or not all(0 <= part <= 255 for part in value):
+                raise ValueError(f"{key} must be three values from 0 to 255")
+        elif key.endswith('_font_size'):
+            try:
+                if isinstance(value, bool):
+                    raise TypeError("a boolean is not a size")
+                value = int(value)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"{key} must be a number: {e}")
+            if not 1 <= value <= 400:
+                raise ValueError(f"{key} must be between 1 and 400")
+        elif key == 'background_mode' and value not in merge_engine.BACKGROUND_MODES:
+            raise ValueError(f"background_mode must be one of {', '.join(merge_engine.BACKGROUND_MODES)}")
+        elif key == 'text_fit' and value not in merge_engine.FIT_MODES:
+            raise ValueError(f"text_fit must be one of {', '.join(merge_engine.FIT_MODES)}")
+        elif key.endswith('_font') and not isinstance(value, str):
+            raise ValueError(f"{key} must be a string")
+        style[key] = value
+    return style
+
+
+def check_item_type(item_type, head):
+    """Raise ValueError unless a file starting with `head` can be a `item_type` item (.pptx files are zips)"""
+    if (item_type == 'pptx') != head.startswith(_ZIP_MAGIC):
+        raise ValueError(f"File contents do not match its type {item_type!r}")
+
+
+def parse_multipart(content_type, body):
+    """(name, filename, bytes) of each part of a multipart/form-data body, in order"""
+    message = BytesParser(policy=policy.HTTP).parsebytes(b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+    if not message.is_multipart():
+        raise ValueError("Malformed multipart body")
+    return [(part.get_param('name', header='content-disposition'), part.get_filename(), part.get_payload(decode=True) or b'')
+            for part in message.iter_parts()]
+
+
+def _init_worker(log_level, cache_dir, cache_mb):
+    global _worker_cache
+    configure_logging(log_level)
+    _worker_cache = ExtractionCache(disk_dir=cache_dir, max_disk_bytes=cache_mb * 1024 * 1024)
+
+
+def _merge_job(items, style, background_path, dedup, output_path):
+    """Merge in a worker process, writing the deck to `output_path`; return (slide count, metrics dict)"""
+    style = dict(style)
+    if background_path:
+        with open(background_path, 'rb') as f:
+            style['background_image'] = merge_engine.resize_image_to_1920x1080(f.read())
+    metrics = MergeMetrics()
+    merge_engine.merge(items, style, output=output_path, cache=_worker_cache, metrics=metrics, dedup=dedup)
+    return metrics.stages['save'].items, metrics.as_dict()
+
+
+class MergeService:
+    """Merges on a process pool with admission control, plus the counters behind /metrics"""
+
+    def __init__(self, spool, library=None, workers=2, max_pending=8, cache_dir=None, cache_mb=512, log_level='INFO'):
+        self.spool = spool
+        self.library = library
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_init_worker, initargs=(log_level, cache_dir, cache_mb))
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._started = time.monotonic()
+        self._latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.counters = dict.fromkeys(('requests', 'merges_done', 'merges_failed', 'merges_rejected', 'files_merged',
+                                       'slides_merged', 'bytes_in', 'bytes_out'), 0)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def resolve(self, ref):
+        """(item_type, path) of a file reference (see the module docstring); raises UnknownFile or ValueError"""
+        if not isinstance(ref, dict):
+            raise ValueError("A file reference must be a JSON object")
+        name = ref.get('name', '')
+        if not isinstance(name, str):
+            raise ValueError(f"A file reference's name must be a string: {ref!r}")
+        item_type = ref.get('type') or merge_engine.item_type_for(name)
+        if item_type not in ('pptx', 'txt'):
+            raise ValueError(f"File reference without a supported type: {ref!r}")
+        if 'library' in ref:
+            if self.library is None:
+                raise ValueError("This server has no library (start it with --library-dir)")
+            if not isinstance(ref['library'], str) or self.library.get(ref['library'], item_type) is None:
+                raise UnknownFile(f"Not in the library: {ref['library']}")
+            return item_type, self.library.path(ref['library'])
+        if 'spool' in ref:
+            path = self.spooled_path(ref['spool'])
+            with open(path, 'rb') as f:
+                check_item_type(item_type, f.read(len(_ZIP_MAGIC)))
+            return item_type, path
+        raise ValueError(f"A file reference needs 'spool' or 'library': {ref!r}")
+
+    def spooled_path(self, sha256):
+        """Path of a spooled file, marked as recently used; raises UnknownFile if it is not (or no longer) there"""
+        if not isinstance(sha256, str) or not _SHA256_HEX.fullmatch(sha256) or not self.spool.touch(sha256):
+            raise UnknownFile(f"Not in the upload spool: {sha256}")
+        return self.spool.path(sha256)
+
+    def merge(self, items, style, background_path=None, dedup='off'):
+        """Merge on the pool and return (path of the .pptx, slide count, metrics); raises QueueFull when busy"""
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_pending:
+                self.counters['merges_rejected'] += 1
+                raise QueueFull(f"{self._in_flight} merges are already queued or running")
+            self._in_flight += 1
+        fd, output_path = tempfile.mkstemp(suffix='.pptx', prefix='merge-')
+        os.close(fd)
+        # Uploads by other requests must not evict spooled inputs while this merge waits and runs
+        paths = [path for _, path in items] + [background_path]
+        spooled = [os.path.basename(path) for path in paths if path and os.path.dirname(path) == self.spool.root]
+        self.spool.pin(spooled)
+        start = time.perf_counter()
+        try:
+            slides, metrics = self._executor.submit(_merge_job, items, style, background_path, dedup, output_path).result()
+        except BaseException:
+            os.remove(output_path)
+            self.count('merges_failed')
+            raise
+        finally:
+            self.spool.unpin(spooled)
+            with self._lock:
+                self._in_flight -= 1
+        with self._lock:
+            self._latencies.append(time.perf_counter() - start)
+            self.counters['merges_done'] += 1
+            self.counters['files_merged'] += len(items)
+            self.counters['slides_merged'] += slides
+        return output_path, slides, metrics
+
+    def health(self):
+        with self._lock:
+            running = min(self._in_flight, self.workers)
+            return {'status': 'ok', 'workers': self.workers, 'running': running, 'queued': self._in_flight - running,
+                    'queue_limit': self.max_pending}
+
+    def metrics(self):
+        """Counters, queue state, merge latency percentiles and throughput since start"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counters = dict(self.counters)
+        uptime = time.monotonic() - self._started
+        result = dict(self.health(), **counters, uptime_seconds=round(uptime, 3))
+        result['merges_per_second'] = round(counters['merges_done'] / uptime, 3) if uptime else 0.0
+        result['slides_per_second'] = round(counters['slides_merged'] / uptime, 1) if uptime else 0.0
+        if latencies:
+            result['merge_latency_seconds'] = {  # Queueing included
+                'p50': round(statistics.median(latencies), 4),
+                'p95': round(latencies[math.ceil(0.95 * len(latencies)) - 1], 4),  # Nearest rank
+                'max': round(latencies[-1], 4),
+            }
+        return result
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+class MergeRequestHandler(BaseHTTPRequestHandler):
+    """Routes requests to the server's MergeService"""
+
+    server_version = "PowerPointMerger/1.0"
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message, headers=None):
+        self.send_json(status, {'error': message}, headers)
+
+    def read_body(self):
+        """The request body, or None after answering 411/413"""
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self.send_error_json(HTTPStatus.LENGTH_REQUIRED, "Content-Length is required")
+            return None
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self.send_error_json(HTTPStatus.BAD_REQUEST, "Content-Length must be a non-negative integer")
+            return None
+        if length > self.server.max_request_bytes:
+            self.close_connection = True
+            self.send_error_json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                 f"Request larger than {self.server.max_request_bytes // (1024 * 1024)} MB")
+            return None
+        self.service.count('bytes_in', length)
+        return self.rfile.read(length)
+
+    def do_GET(self):
+        self.service.count('requests')
+        path = urlparse(self.path).path
+        if path == '/health':
+            self.send_json(HTTPStatus.OK, self.service.health())
+        elif path == '/metrics':
+            self.send_json(HTTPStatus.OK, self.service.metrics())
+        else:
+            self.send_error_json(HTTPStatus.NOT_FOUND, f"No such endpoint: {path}")
+
+    def do_POST(self):
+        self.service.count('requests')
+        url = urlparse(self.path)
+        if url.path not in ('/files', '/merge'):
+            self.send_error_json(HTTPStatus.NOT_FOUND, f"No such endpoint: {url.path}")
+            return
+        body = self.read_body()
+        if body is None:
+            return
+        try:
+            if url.path == '/files':
+                self.store_file(body, parse_qs(url.query).get('name', [''])[0])
+            else:
+                self.merge(body)
+        except UnknownFile as e:
+            self.send_error_json(HTTPStatus.NOT_FOUND, str(e))
+        except ValueError as e:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, str(e))
+        except zipfile.BadZipFile as e:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, f"Unreadable .pptx file: {e}")
+        except QueueFull as e:
+            self.send_error_json(HTTPStatus.SERVICE_UNAVAILABLE, str(e), {'Retry-After': '1'})
+        except ConnectionError:
+            self.close_connection = True  # The client went away while the deck was streamed
+        except Exception as e:
+            logger.exception("Merge request failed")
+            self.send_error_json(HTTPStatus.INTERNAL_SERVER_ERROR, f"Merge failed: {e}")
+
+    def store_file(self, body, name):
+        sha256, size = self.service.spool.put(body)
+        self.send_json(HTTPStatus.CREATED, {'sha256': sha256, 'size': size, 'type': merge_engine.item_type_for(name)})
+
+    def parse_merge_request(self, body):
+        """(items, style, background path, dedup) of a /merge request body"""
+        content_type = self.headers.get('Content-Type', '')
+        items, style, background_path, dedup = [], {}, None, 'off'
+        if content_type.startswith('multipart/form-data'):
+            for name, filename, data in parse_multipart(content_type, body):
+                if name == 'file':
+                    item_type = merge_engine.item_type_for(filename or '')
+                    if item_type is None:
+                        raise ValueError(f"{filename}: unsupported file type")
+                    check_item_type(item_type, data[:len(_ZIP_MAGIC)])
+                    sha256, _ = self.service.spool.put(data)
+                    items.append((item_type, self.service.spool.path(sha256)))
+                elif name == 'ref':
+                    items.append(self.service.resolve(json.loads(data)))
+                elif name == 'style':
+                    style = json.loads(data)
+                elif name == 'dedup':
+                    dedup = data.decode('utf-8').strip()
+                elif name == 'background':
+                    background_path = self.service.spool.path(self.service.spool.put(data)[0])
+                else:
+                    raise ValueError(f"Unknown form field: {name!r}")
+        elif content_type.startswith('application/json'):
+            request = json.loads(body)
+            if not isinstance(request, dict):
+                raise ValueError("Request must be a JSON object")
+            files = request.get('files') or []
+            if not isinstance(files, list):
+                raise ValueError("files must be a JSON array of file references")
+            items = [self.service.resolve(ref) for ref in files]
+            style = request.get('style') or {}
+            dedup = request.get('dedup', 'off')
+            if request.get('background'):
+                if not isinstance(request['background'], dict):
+                    raise ValueError("background must be a JSON object with a 'spool' digest")
+                background_path = self.service.spooled_path(request['background'].get('spool'))
+        else:
+            raise ValueError("Send multipart/form-data or application/json")
+        if not items:
+            raise ValueError("No files to merge")
+        if dedup not in merge_engine.DEDUP_MODES:
+            raise ValueError(f"dedup must be one of {', '.join(merge_engine.DEDUP_MODES)}")
+        return items, parse_style(style), background_path, dedup
+
+    def merge(self, body):
+        items, style, background_path, dedup = self.parse_merge_request(body)
+        output_path, slides, metrics = self.service.merge(items, style, background_path, dedup)
+        try:
+            size = os.path.getsize(output_path)
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', merge_engine.PPTX_MIME)
+            self.send_header('Content-Length', str(size))
+            self.send_header('Content-Disposition', 'attachment; filename="merged_presentation.pptx"')
+            self.send_header('X-Merge-Slides', str(slides))
+            self.send_header('X-Merge-Seconds', f"{metrics['total_seconds']:.3f}")
+            self.end_headers()
+            with open(output_path, 'rb') as f:
+                shutil.copyfileobj(f, self.wfile, _STREAM_CHUNK_SIZE)
+            self.service.count('bytes_out', size)
+        finally:
+            os.remove(output_path)
+
+
+class MergeServer(ThreadingHTTPServer):
+    """HTTP server holding the MergeService its handlers share"""
+
+    daemon_threads = True
+
+    def __init__(self, address, service, max_request_bytes=MAX_REQUEST_MB * 1024 * 1024):
+        super().__init__(address, MergeRequestHandler)
+        self.service = service
+        self.max_request_bytes = max_request_bytes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve merges over HTTP for automated pipelines.")
+    parser.add_argument('--host', default='127.0.0.1', help="interface to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="merge worker processes (default: one per CPU)")
+    parser.add_argument('--queue', type=int, default=8, help="merges that may wait for a worker before requests get 503 (default: 8)")
+    parser.add_argument('--max-request-mb', type=int, default=MAX_REQUEST_MB, help=f"largest accepted request body (default: {MAX_REQUEST_MB})")
+    parser.add_argument('--spool-dir', default=os.environ.get('PPTX_MERGER_SPOOL_DIR') or default_spool_dir(),
+                        help="upload spool, shared with the app (default: $PPTX_MERGER_SPOOL_DIR or the app's)")
+    parser.add_argument('--spool-mb', type=int, default=int(os.environ.get('PPTX_MERGER_SPOOL_MB', '2048')), help="size limit of the spool")
+    parser.add_argument('--library-dir', default=os.environ.get('PPTX_MERGER_LIBRARY_DIR'), help="deck library for {\"library\": ...} references")
+    parser.add_argument('--cache-dir', default=os.environ.get('PPTX_MERGER_CACHE_DIR'), help="on-disk extraction cache shared by the workers")
+    parser.add_argument('--cache-mb', type=int, default=int(os.environ.get('PPTX_MERGER_CACHE_MB', '512')), help="size limit of --cache-dir")
+    parser.add_argument('--log-level', default=os.environ.get('PPTX_MERGER_LOG_LEVEL', 'INFO'))
+    args = parser.parse_args(argv)
+
+    configure_logging(args.log_level)
+    spool = FileSpool(args.spool_dir, args.spool_mb * 1024 * 1024)
+    library = DeckLibrary(args.library_dir) if args.library_dir else None
+    service = MergeService(spool, library, args.workers, args.queue, args.cache_dir, args.cache_mb, args.log_level)
+    server = MergeServer((args.host, args.port), service, args.max_request_mb * 1024 * 1024)
+    print(f"Serving merges on http://{args.host}:{server.server_port} with {args.workers} workers", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+        if library is not None:
+            library.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
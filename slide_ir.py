@@ -0,0 +1,249 @@
+"""Compact intermediate representation of extracted slides.
+
+Extraction produces a SlideBatch per input file: the slide texts in a list and
+everything else in parallel arrays (a flag byte per slide holding the title
+role and the precomputed all-caps test, and the slide's position in its source
+file). Batches are what the extraction cache stores and what worker processes
+send back, in the binary form produced by to_bytes(), and renderers take them
+in one pass. Iterating a batch, or a lazily parsed .txt file, yields Slide
+records.
+
+A SlideDeduplicator drops repeated slides before they are rendered: slides
+whose whitespace-normalized text and role match the previous slide
+('consecutive') or any earlier slide of the merge ('global').
+"""
+import hashlib
+import struct
+import sys
+from array import array
+
+ROLE_VERSE = 0
+ROLE_TITLE = 1
+
+_FLAG_TITLE = 1
+_FLAG_ALL_CAPS = 2
+
+# magic, format version, source length, slide count, text bytes
+_HEADER = struct.Struct('<4sBIII')
+_MAGIC = b'SLIR'
+FORMAT_VERSION = 1
+
+DEDUP_MODES = ('off', 'consecutive', 'global')
+
+
+def is_all_caps(text):
+    """Check if text is all uppercase (all caps)"""
+    return text.isupper() and any(c.isalpha() for c in text)
+
+
+class Slide:
+    """One extracted slide: its text, role, source file and position in that file"""
+
+    __slots__ = ('text', 'role', 'source', 'index', 'all_caps')
+
+    def __init__(self, text, role=ROLE_VERSE, source='', index=0, all_caps=None):
+        self.text = text
+        self.role = role
+        self.source = source
+        self.index = index
+        self.all_caps = is_all_caps(text) if all_caps is None else all_caps
+
+    @property
+    def is_title(self):
+        return self.role == ROLE_TITLE
+
+    @property
+    def title_styled(self):
+        """Whether the slide gets the title style (a title, or all caps)"""
+        return self.role == ROLE_TITLE or self.all_caps
+
+    def __eq__(self, other):
+        if not isinstance(other, Slide):
+            return NotImplemented
+        return (self.text, self.role, self.source, self.index) == (other.text, other.role, other.source, other.index)
+
+    def __repr__(self):
+        return f"Slide({self.text!r}, role={self.role}, source={self.source!r}, index={self.index})"
+
+
+class SlideBatch:
+    """The slides of one source file, stored as a text list plus flag and index arrays"""
+
+    __slots__ = ('source', 'texts', 'flags', 'indexes')
+
+    def __init__(self, source=''):
+        self.source = source
+        self.texts = []
+        self.flags = array('B')
+        self.indexes = array('I')
+
+    def append(self, text, role=ROLE_VERSE, index=None):
+        """Add a slide; `index` defaults to the slide's position in the batch"""
+        self.texts.append(text)
+        self.flags.append((_FLAG_TITLE if role == ROLE_TITLE else 0) | (_FLAG_ALL_CAPS if is_all_caps(text) else 0))
+        self.indexes.append(len(self.indexes) if index is None else index)
+
+    @classmethod
+    def from_slides(cls, slides, source=''):
+        """Batch of Slide records (their own source is not kept)"""
+        batch = cls(source)
+        for slide in slides:
+            batch.texts.append(slide.text)
+            batch.flags.append((_FLAG_TITLE if slide.role == ROLE_TITLE else 0) | (_FLAG_ALL_CAPS if slide.all_caps else 0))
+            batch.indexes.append(slide.index)
+        return batch
+
+    @classmethod
+    def from_pairs(cls, pairs, source=''):
+        """Batch of (text, is_title) pairs"""
+        batch = cls(source)
+        for text, is_title in pairs:
+            batch.append(text, ROLE_TITLE if is_title else ROLE_VERSE)
+        return batch
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __bool__(self):
+        return bool(self.texts)
+
+    def __getitem__(self, position):
+        flags = self.flags[position]
+        return Slide(self.texts[position], ROLE_TITLE if flags & _FLAG_TITLE else ROLE_VERSE, self.source,
+                     self.indexes[position], bool(flags & _FLAG_ALL_CAPS))
+
+    def __iter__(self):
+        for position in range(len(self.texts)):
+            yield self[position]
+
+    def __eq__(self, other):
+        if not isinstance(other, SlideBatch):
+            return NotImplemented
+        return (self.source, self.texts, self.flags, self.indexes) == (other.source, other.texts, other.flags, other.indexes)
+
+    def __repr__(self):
+        return f"SlideBatch({len(self)} slides, source={self.source!r})"
+
+    def __reduce__(self):
+        # Travel between processes in the compact binary form
+        return SlideBatch.from_bytes, (self.to_bytes(),)
+
+    def title_styled(self):
+        """Per-slide title styling flags (a title, or all caps) as a list of bools"""
+        return [bool(flags) for flags in self.flags]
+
+    def pairs(self):
+        """(text, is_title) pairs"""
+        return [(text, bool(flags & _FLAG_TITLE)) for text, flags in zip(self.texts, self.flags)]
+
+    def to_bytes(self):
+        """Serialize to the compact binary format read by from_bytes()"""
+        source = self.source.encode('utf-8')
+        encoded = [text.encode('utf-8') for text in self.texts]
+        lengths = array('I', map(len, encoded))
+        indexes = array('I', self.indexes)
+        if sys.byteorder == 'big':
+            lengths.byteswap()
+            indexes.byteswap()
+        text_bytes = b''.join(encoded)
+        return b''.join((
+            _HEADER.pack(_MAGIC, FORMAT_VERSION, len(source), len(encoded), len(text_bytes)),
+            source,
+            self.flags.tobytes(),
+            indexes.tobytes(),
+            lengths.tobytes(),
+            text_bytes,
+        ))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuild a batch from to_bytes() output; raises ValueError if it is not one"""
+        data = memoryview(data)
+        if len(data) < _HEADER.size:
+            raise ValueError("Truncated slide batch")
+        magic, version, source_length, count, text_length = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Not a slide batch in a supported format")
+        offset = _HEADER.size
+        item_bytes = array('I').itemsize
+        if len(data) != offset + source_length + count * (1 + 2 * item_bytes) + text_length:
+            raise ValueError("Truncated slide batch")
+
+        batch = cls(str(data[offset:offset + source_length], 'utf-8'))
+        offset += source_length
+        batch.flags.frombytes(data[offset:offset + count])
+        offset += count
+        batch.indexes.frombytes(data[offset:offset + count * item_bytes])
+        offset += count * item_bytes
+        lengths = array('I')
+        lengths.frombytes(data[offset:offset + count * item_bytes])
+        offset += count * item_bytes
+        if sys.byteorder == 'big':
+            batch.indexes.byteswap()
+            lengths.byteswap()
+
+        text_bytes = bytes(data[offset:])
+        texts = batch.texts
+        position = 0
+        for length in lengths:
+            texts.append(text_bytes[position:position + length].decode('utf-8'))
+            position += length
+        return batch
+
+
+def slide_key(text, role):
+    """Hash of a slide's role and its text with whitespace runs collapsed on every line"""
+    normalized = '\n'.join(' '.join(line.split()) for line in text.strip().split('\n'))
+    return hashlib.blake2b(bytes((role,)) + normalized.encode('utf-8'), digest_size=16).digest()
+
+
+class SlideDeduplicator:
+    """Drop slides that repeat an earlier one (see DEDUP_MODES) across all the batches it filters.
+
+    `measure`, if given, returns the bytes a slide's text takes once rendered
+    (the default is its UTF-8 length); see bytes_saved().
+    """
+
+    def __init__(self, mode='global', measure=None):
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"Unsupported dedup mode: {mode!r}")
+        self.mode = mode
+        self.measure = measure or (lambda text: len(text.encode('utf-8')))
+        self.slides_saved = 0
+        self.saved_text_bytes = 0
+        self.saved_by_styling = {False: 0, True: 0}  # is_title_styled -> slides dropped
+        self._seen = set()
+        self._last = None
+
+    def _keep(self, text, role, title_styled):
+        """Whether to render this slide; counts it as saved if not"""
+        if self.mode == 'off':
+            return True
+        key = slide_key(text, role)
+        if self.mode == 'global':
+            repeated = key in self._seen
+            self._seen.add(key)
+        else:
+            repeated = key == self._last
+            self._last = key
+        if repeated:
+            self.slides_saved += 1
+            self.saved_text_bytes += self.measure(text)
+            self.saved_by_styling[title_styled] += 1
+        return not repeated
+
+    def bytes_saved(self, overhead):
+        """Bytes of the dropped slides, given overhead(title_styled): the bytes of a slide besides its text"""
+        return self.saved_text_bytes + sum(count * overhead(styled) for styled, count in self.saved_by_styling.items() if count)
+
+    def filter(self, slides):
+        """A SlideBatch of the slides to render, or for any other iterable of Slides a generator"""
+        if not isinstance(slides, SlideBatch):
+            return (slide for slide in slides if self._keep(slide.text, slide.role, slide.title_styled))
+        kept = SlideBatch(slides.source)
+        for text, flags, index in zip(slides.texts, slides.flags, slides.indexes):
+            if self._keep(text, ROLE_TITLE if flags & _FLAG_TITLE else ROLE_VERSE, bool(flags)):
+                kept.texts.append(text)
+                kept.flags.append(flags)
+                kept.indexes.append(index)
+        return kept
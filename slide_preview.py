@@ -0,0 +1,166 @@
+"""PNG previews of formatted slides, drawn with Pillow from extracted text.
+
+A preview follows create_formatted_slide(): the background image stretched
+over the slide (or black), then the text centred in the same full-width,
+7-inch box with half-inch margins, wrapped at word boundaries, in the title
+or verse font, size and colour. Fonts come from fonts.load_font(), so a
+family that is not installed is drawn with its closest substitute. Slides
+that text_fit would shrink or split are previewed that way (fitted_slides()).
+
+Previews are memoized by (text, styling, style digest, width), so restyling
+only redraws the slides actually shown and unchanged ones come from memory.
+Fitted slide lists are memoized too, so turning preview pages does not fit
+every slide of a long merge again.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+from fonts import load_font
+from merge_engine import resolve_style, style_digest
+from text_fit import LINE_SPACING, SLIDE_SIZE_PT, TEXT_MARGIN_PT, TEXTBOX_HEIGHT_PT, TextFitter, wrap_text
+
+PREVIEW_WIDTH = 480
+PREVIEW_CACHE_ENTRIES = 512
+FITTED_CACHE_ENTRIES = 8
+# Style settings that change how text is fitted
+_FIT_SETTINGS = ('text_fit', 'title_font', 'title_font_size', 'verse_font', 'verse_font_size')
+
+# Shown when there are no files yet
+SAMPLE_SLIDES = [
+    ("AMAZING GRACE", True),
+    ("Amazing grace, how sweet the sound\nThat saved a wretch like me", False),
+]
+
+_preview_cache = OrderedDict()  # preview key -> PNG bytes
+_preview_lock = threading.Lock()
+_background_cache = OrderedDict()  # (background sha256, size) -> RGB Image
+_background_lock = threading.Lock()
+_BACKGROUND_CACHE_ENTRIES = 4
+_fitted_cache = OrderedDict()  # digest of the slides and fit settings -> fitted_slides() result
+_fitted_lock = threading.Lock()
+
+
+def preview_size(width=PREVIEW_WIDTH):
+    """(width, height) in pixels of a preview `width` pixels wide"""
+    return width, round(width * SLIDE_SIZE_PT[1] / SLIDE_SIZE_PT[0])
+
+
+def _background(background_image, background_sha256, size):
+    """The style's background image scaled to the preview size, decoded once per image and size"""
+    key = (background_sha256, size)
+    with _background_lock:
+        image = _background_cache.get(key)
+        if image is not None:
+            _background_cache.move_to_end(key)
+            return image
+    image = Image.open(BytesIO(background_image)).convert('RGB').resize(size, Image.BILINEAR)
+    with _background_lock:
+        _background_cache[key] = image
+        while len(_background_cache) > _BACKGROUND_CACHE_ENTRIES:
+            _background_cache.popitem(last=False)
+    return image
+
+
+def fitted_slides(slides, style=None):
+    """(text, title_styled, font size or None) of the slides a merge renders for (text, title_styled) pairs"""
+    style = resolve_style(style)
+    if style['text_fit'] == 'off':
+        return [(text, title_styled, None) for text, title_styled in slides]
+    hasher = hashlib.sha256('\0'.join(str(style[name]) for name in _FIT_SETTINGS).encode('utf-8'))
+    for text, title_styled in slides:
+        hasher.update(f"\0{int(bool(title_styled))}{text}".encode('utf-8'))
+    key = hasher.hexdigest()
+    with _fitted_lock:
+        fitted = _fitted_cache.get(key)
+        if fitted is not None:
+            _fitted_cache.move_to_end(key)
+            return fitted
+    fitter = TextFitter(style)
+    fitted = [fitted for text, title_styled in slides for fitted in fitter.fit(text, title_styled)]
+    with _fitted_lock:
+        _fitted_cache[key] = fitted
+        while len(_fitted_cache) > FITTED_CACHE_ENTRIES:
+            _fitted_cache.popitem(last=False)
+    return fitted
+
+
+def draw_preview(text, title_styled, style, width=PREVIEW_WIDTH, background_sha256=None, font_size=None):
+    """Draw one slide preview (at `font_size` points instead of the style's size, if given) and return it as PNG bytes (not cached)"""
+    size = preview_size(width)
+    scale = width / SLIDE_SIZE_PT[0]  # Pixels per point
+
+    background_image = style['background_image']
+    if background_image:
+        background_sha256 = background_sha256 or hashlib.sha256(background_image).hexdigest()
+        image = _background(background_image, background_sha256, size).copy()
+    else:
+        image = Image.new('RGB', size, (0, 0, 0))
+
+    prefix = 'title' if title_styled else 'verse'
+    font_size = max(1, round((font_size or style[f'{prefix}_font_size']) * scale))
+    font = load_font(style[f'{prefix}_font'], font_size, bold=title_styled)
+    color = tuple(style[f'{prefix}_color'])
+
+    margin = TEXT_MARGIN_PT * scale
+    box_top = (SLIDE_SIZE_PT[1] - TEXTBOX_HEIGHT_PT) / 2 * scale
+    lines = wrap_text(text, font.getlength, width - 2 * margin)
+    line_height = font_size * LINE_SPACING
+    # Anchored in the middle of the box, like MSO_ANCHOR.MIDDLE (overflowing text spills out evenly)
+    top = box_top + TEXTBOX_HEIGHT_PT * scale / 2 - line_height * len(lines) / 2
+    draw = ImageDraw.Draw(image)
+    for number, line in enumerate(lines):
+        draw.text((width / 2, top + (number + 0.5) * line_height), line, font=font, fill=color, anchor='mm')
+
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def _preview_key(text, title_styled, font_size, style_key, width):
+    return hashlib.sha256(f"{style_key}\0{width}\0{int(bool(title_styled))}\0{font_size}\0{text}".encode('utf-8')).hexdigest()
+
+
+def render_previews(slides, style=None, width=PREVIEW_WIDTH, executor=None):
+    """PNG previews for (text, title_styled) pairs or (text, title_styled, font size) triples, in order.
+
+    Previews already drawn for the same text and style come from the cache;
+    the rest are drawn on `executor` when one is given (Pillow releases the
+    GIL while it resizes and encodes), else one after another.
+    """
+    style = resolve_style(style)
+    style_key = style_digest(style)
+    background_sha256 = hashlib.sha256(style['background_image']).hexdigest() if style['background_image'] else None
+    slides = [(slide[0], slide[1], slide[2] if len(slide) > 2 else None) for slide in slides]
+    keys = [_preview_key(text, title_styled, font_size, style_key, width) for text, title_styled, font_size in slides]
+
+    previews = []
+    with _preview_lock:
+        for key in keys:
+            png = _preview_cache.get(key)
+            if png is not None:
+                _preview_cache.move_to_end(key)
+            previews.append(png)
+
+    missing = [index for index, png in enumerate(previews) if png is None]
+    args = [(slides[index][0], slides[index][1], style, width, background_sha256, slides[index][2]) for index in missing]
+    if executor is not None and len(missing) > 1:
+        drawn = list(executor.map(lambda arg: draw_preview(*arg), args))
+    else:
+        drawn = [draw_preview(*arg) for arg in args]
+
+    with _preview_lock:
+        for index, png in zip(missing, drawn):
+            previews[index] = png
+            _preview_cache[keys[index]] = png
+        while len(_preview_cache) > PREVIEW_CACHE_ENTRIES:
+            _preview_cache.popitem(last=False)
+    return previews
+
+
+def render_preview(text, title_styled, style=None, width=PREVIEW_WIDTH):
+    """PNG preview of one slide (cached)"""
+    return render_previews([(text, title_styled)], style, width)[0]
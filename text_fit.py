@@ -0,0 +1,244 @@
+"""Fit slide text into the text box of create_formatted_slide().
+
+Every slide's text sits in a full-width, 7-inch-tall box with half-inch
+margins at a fixed font size, so a long verse overflows the slide. A
+TextFitter wraps each text the way PowerPoint does (at spaces, inside words
+wider than the box) using the advance widths of the real font, found with
+fonts.load_font(), and when the lines do not fit either shrinks the font size
+('shrink') or splits the verse at line breaks over several slides ('split';
+a single line that still does not fit is shrunk).
+
+Widths are measured once per (font, size, glyph) and summed, so fitting a
+slide costs a few dictionary lookups per character.
+"""
+import threading
+
+from fonts import load_font
+from slide_ir import is_all_caps
+
+# 'off' keeps every slide as it is
+FIT_MODES = ('off', 'shrink', 'split')
+MIN_FIT_FONT_SIZE = 20  # Never shrink text below this size (points)
+
+# Slide geometry of new_presentation() and create_formatted_slide(), in points
+SLIDE_SIZE_PT = (13.33 * 72, 7.5 * 72)
+TEXTBOX_HEIGHT_PT = 7 * 72
+TEXT_MARGIN_PT = 0.5 * 72
+TEXT_AREA_PT = (SLIDE_SIZE_PT[0] - 2 * TEXT_MARGIN_PT, TEXTBOX_HEIGHT_PT - 2 * TEXT_MARGIN_PT)
+LINE_SPACING = 1.2  # PowerPoint's single line spacing relative to the font size
+
+WORD_CACHE_ENTRIES = 4096  # Widths of whole words remembered per font face and size
+
+_glyph_metrics = {}  # (family, size, bold) -> GlyphMetrics
+_glyph_metrics_lock = threading.Lock()
+
+
+class GlyphMetrics:
+    """Advance widths of one font face at one size, in points, measured once per glyph"""
+
+    __slots__ = ('font', 'widths', 'words')
+
+    def __init__(self, family, size, bold=False):
+        self.font = load_font(family, size, bold)
+        self.widths = {}  # character -> advance width
+        self.words = {}  # word -> width, for the words lyrics keep repeating
+
+    def width(self, text):
+        """Width of `text` as the sum of its glyph advances (kerning is ignored)"""
+        widths = self.widths
+        try:
+            return sum(map(widths.__getitem__, text))
+        except KeyError:
+            for char in set(text).difference(widths):
+                widths[char] = self.font.getlength(char)
+            return sum(map(widths.__getitem__, text))
+
+    def word_width(self, word):
+        """width() of a single word, remembered"""
+        width = self.words.get(word)
+        if width is None:
+            if len(self.words) >= WORD_CACHE_ENTRIES:
+                self.words.clear()
+            width = self.words[word] = self.width(word)
+        return width
+
+
+def glyph_metrics(family, size, bold=False):
+    """Shared GlyphMetrics of a font face at `size` points"""
+    key = ((family or '').lower(), size, bool(bold))
+    metrics = _glyph_metrics.get(key)
+    if metrics is None:
+        with _glyph_metrics_lock:
+            metrics = _glyph_metrics.get(key)
+            if metrics is None:
+                metrics = _glyph_metrics[key] = GlyphMetrics(family, size, bold)
+    return metrics
+
+
+def glyph_cache_info():
+    """Font faces and glyph widths measured so far"""
+    faces = list(_glyph_metrics.values())
+    return {'faces': len(faces), 'glyphs': sum(len(face.widths) for face in faces)}
+
+
+def wrap_text(text, measure, max_width):
+    """Split text into lines no wider than `max_width`, breaking at spaces (or inside over-long words).
+
+    `measure` returns the width of a string in the same unit as `max_width`.
+    """
+    space = measure(' ')
+    lines = []
+    for paragraph in text.split('\n'):
+        line, line_width = '', 0.0
+        for word in paragraph.split(' '):
+            word_width = measure(word)
+            candidate_width = line_width + space + word_width if line else word_width
+            if candidate_width <= max_width:
+                line, line_width = (f"{line} {word}" if line else word), candidate_width
+                continue
+            if line:
+                lines.append(line)
+            # A word wider than the box is broken wherever it overflows
+            while word_width > max_width and len(word) > 1:
+                cut = len(word) - 1
+                while cut > 1 and measure(word[:cut]) > max_width:
+                    cut -= 1
+                lines.append(word[:cut])
+                word = word[cut:]
+                word_width = measure(word)
+            line, line_width = word, word_width
+        lines.append(line)
+    return lines
+
+
+def _row_count(paragraphs, space, max_width):
+    """Lines the paragraphs (lists of word widths) wrap to at `max_width`, as wrap_text() would break them"""
+    count = 0
+    for word_widths in paragraphs:
+        line = None
+        for width in word_widths:
+            if line is not None and line + space + width <= max_width:
+                line += space + width
+                continue
+            if line is not None:
+                count += 1
+            # A word wider than the box takes whole lines of its own, its remainder starts the next one
+            while width > max_width:
+                count += 1
+                width -= max_width
+            line = width
+        count += 1
+    return count
+
+
+def max_lines(size):
+    """Lines of text at `size` points that fit in the text box"""
+    return max(1, int(TEXT_AREA_PT[1] // (size * LINE_SPACING)))
+
+
+class TextFitter:
+    """Fit slide texts to the text box with the style's fonts (see FIT_MODES), counting the slides it changed"""
+
+    def __init__(self, style, mode=None, min_size=MIN_FIT_FONT_SIZE):
+        mode = mode or style.get('text_fit', 'off')
+        if mode not in FIT_MODES:
+            raise ValueError(f"Unsupported text fit mode: {mode!r}")
+        self.mode = mode
+        self.style = style
+        self.min_size = min_size
+        self.slides_shrunk = 0
+        self.slides_split = 0
+        self.slides_added = 0  # Extra slides created by splitting
+        self._fitted = {}  # (text, title_styled) -> fit() result
+
+    def _face(self, title_styled):
+        """(family, size, bold) used for a slide with this styling"""
+        prefix = 'title' if title_styled else 'verse'
+        return self.style[f'{prefix}_font'], self.style[f'{prefix}_font_size'], title_styled
+
+    def line_count(self, text, title_styled, size=None):
+        """Lines `text` wraps to at `size` points (default: the style's size)"""
+        family, style_size, bold = self._face(title_styled)
+        metrics = glyph_metrics(family, size or style_size, bold)
+        max_width = TEXT_AREA_PT[0]
+        count = 0
+        for paragraph in text.split('\n'):
+            # Most lines fit the box whole; only wider ones need wrapping
+            count += 1 if metrics.width(paragraph) <= max_width else len(wrap_text(paragraph, metrics.word_width, max_width))
+        return count
+
+    def fits(self, text, title_styled, size=None):
+        size = size or self._face(title_styled)[1]
+        return self.line_count(text, title_styled, size) <= max_lines(size)
+
+    def _shrunk_size(self, text, title_styled):
+        """Largest size from the style's size down to min_size that fits (min_size if none does)"""
+        family, style_size, bold = self._face(title_styled)
+        measure = glyph_metrics(family, style_size, bold).word_width
+        space = measure(' ')
+        paragraphs = [[measure(word) for word in paragraph.split(' ')] for paragraph in text.split('\n')]
+        # Advances scale with the size, so search with the widths at the style's size...
+        low, high = self.min_size, style_size - 1
+        size = low
+        while low <= high:
+            middle = (low + high) // 2
+            if _row_count(paragraphs, space, TEXT_AREA_PT[0] * style_size / middle) <= max_lines(middle):
+                size, low = middle, middle + 1
+            else:
+                high = middle - 1
+        # ...then confirm with the glyphs measured at that size (hinting rounds them differently)
+        while size > self.min_size and not self.fits(text, title_styled, size):
+            size -= 1
+        return size
+
+    def _split(self, text, title_styled):
+        """Texts of the slides `text` is split into at line breaks, about equally many lines each"""
+        size = self._face(title_styled)[1]
+        capacity = max_lines(size)
+        paragraphs = text.split('\n')
+        rows = [self.line_count(paragraph, title_styled) for paragraph in paragraphs]
+        slides = -(-sum(rows) // capacity)
+        target = -(-sum(rows) // slides)
+        chunks, chunk, chunk_rows = [], [], 0
+        for paragraph, paragraph_rows in zip(paragraphs, rows):
+            if chunk and chunk_rows + paragraph_rows > target:
+                chunks.append('\n'.join(chunk))
+                chunk, chunk_rows = [], 0
+            chunk.append(paragraph)
+            chunk_rows += paragraph_rows
+        chunks.append('\n'.join(chunk))
+        return chunks
+
+    def _fit_one(self, text, title_styled):
+        """(text, title_styled, font size or None) of a slide that needs no splitting"""
+        return text, title_styled, None if self.fits(text, title_styled) else self._shrunk_size(text, title_styled)
+
+    def fit(self, text, title_styled):
+        """[(text, title_styled, font size or None for the style's size), ...]: the slides to render for one slide"""
+        key = (text, title_styled)
+        fitted = self._fitted.get(key)
+        if fitted is None:
+            if self.mode == 'off':
+                fitted = [(text, title_styled, None)]
+            elif self.mode == 'split' and '\n' in text and not self.fits(text, title_styled):
+                # A part in all caps gets the title style, as it would on a slide of its own
+                fitted = [self._fit_one(chunk, title_styled or is_all_caps(chunk)) for chunk in self._split(text, title_styled)]
+            else:
+                fitted = [self._fit_one(text, title_styled)]
+            self._fitted[key] = fitted
+        if len(fitted) > 1:
+            self.slides_split += 1
+            self.slides_added += len(fitted) - 1
+        if any(size is not None for _, _, size in fitted):
+            self.slides_shrunk += 1
+        return fitted
+
+    def fit_slides(self, texts, title_styled):
+        """Fitted (texts, title_styled, font_sizes) lists for parallel lists of texts and styling flags"""
+        fitted_texts, fitted_styled, sizes = [], [], []
+        for text, styled in zip(texts, title_styled):
+            for chunk, chunk_styled, size in self.fit(text, styled):
+                fitted_texts.append(chunk)
+                fitted_styled.append(chunk_styled)
+                sizes.append(size)
+        return fitted_texts, fitted_styled, sizes
@@ -0,0 +1,101 @@
+"""Incremental decoding of uploaded text files.
+
+Text is read and decoded in fixed-size chunks and handed out line by line, so
+memory use does not grow with the file. The encoding comes from the byte
+order mark when there is one (UTF-8, UTF-16 and UTF-32); otherwise BOM-less
+UTF-16 is recognised by its NUL bytes and anything else is read as UTF-8,
+falling back to Windows-1252 at the first byte that is not valid UTF-8: the
+text before it keeps its UTF-8 decoding, the rest is decoded as Windows-1252.
+"""
+import codecs
+import os
+from io import BytesIO
+
+CHUNK_SIZE = 64 * 1024
+FALLBACK_ENCODING = 'cp1252'
+
+# UTF-32 marks first: the UTF-32-LE mark starts with the UTF-16-LE one
+_BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+
+
+def detect_encoding(head):
+    """Return (encoding, BOM length) for a file starting with the bytes `head`.
+
+    Files without a BOM that are not UTF-16 are 'utf-8'; iter_decoded() falls
+    back to Windows-1252 where they stop being valid UTF-8.
+    """
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding, len(bom)
+
+    # BOM-less UTF-16: mostly-ASCII text has a NUL in every other byte
+    sample = head[:4096]
+    if len(sample) >= 2 and b'\x00' in sample:
+        even_nuls = sample[0::2].count(0)
+        odd_nuls = sample[1::2].count(0)
+        pairs = len(sample) // 2
+        if odd_nuls > pairs * 0.4 and even_nuls < pairs * 0.1:
+            return 'utf-16-le', 0
+        if even_nuls > pairs * 0.4 and odd_nuls < pairs * 0.1:
+            return 'utf-16-be', 0
+    return 'utf-8', 0
+
+
+def _open_source(source):
+    """Binary file object for bytes, a path or a file object (and whether we opened it)"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return BytesIO(source), True
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, 'rb'), True
+    source.seek(0)
+    return source, False
+
+
+def iter_decoded(source, chunk_size=CHUNK_SIZE):
+    """Yield decoded text chunks of a file given as bytes, a path or a binary file object"""
+    stream, opened = _open_source(source)
+    try:
+        chunk = stream.read(chunk_size)
+        encoding, bom_length = detect_encoding(chunk)
+        # Only UTF-8 is decoded strictly, so that it can fall back part way through
+        decoder = codecs.getincrementaldecoder(encoding)('strict' if encoding == 'utf-8' else 'replace')
+        chunk = chunk[bom_length:]
+        while True:
+            final = not chunk  # An empty read: flush what the decoder still holds
+            pending = decoder.getstate()[0]
+            try:
+                text = decoder.decode(chunk, final=final)
+            except UnicodeDecodeError as e:
+                # Not UTF-8 after all: keep the valid part, decode the rest as Windows-1252
+                data = pending + chunk
+                decoder = codecs.getincrementaldecoder(FALLBACK_ENCODING)('replace')
+                text = data[:e.start].decode(encoding) + decoder.decode(data[e.start:], final=final)
+            if text:
+                yield text
+            if final:
+                break
+            chunk = stream.read(chunk_size)
+    finally:
+        if opened:
+            stream.close()
+
+
+def iter_line_batches(source, chunk_size=CHUNK_SIZE):
+    """Yield lists of the complete lines decoded so far, without their '\\n'.
+
+    Only '\\n' ends a line, like str.split('\\n'); the last line is yielded even
+    when empty, so the batches join up to exactly that split.
+    """
+    carry = ''
+    for text in iter_decoded(source, chunk_size):
+        lines = (carry + text).split('\n')
+        carry = lines.pop()
+        if lines:
+            yield lines
+    yield [carry]
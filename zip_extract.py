@@ -0,0 +1,108 @@
+"""Read slide text straight from a .pptx zip without loading a Presentation.
+
+Only the package relationships, ppt/presentation.xml and the slide XML parts
+are read; media, layouts and masters are never decompressed. Each slide is
+iterparsed and its top-level text shapes are reduced to the same string that
+merge_engine.extract_text_from_slide() returns for a python-pptx slide.
+"""
+import posixpath
+import zipfile
+from io import BytesIO
+
+from lxml import etree
+
+_NS_P = "http://schemas.openxmlformats.org/presentationml/2006/main"
+_NS_A = "http://schemas.openxmlformats.org/drawingml/2006/main"
+_NS_R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_PKG_RELS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_RT_OFFICE_DOCUMENT = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+
+_SP = f"{{{_NS_P}}}sp"
+_SP_TREE = f"{{{_NS_P}}}spTree"
+_C_SLD = f"{{{_NS_P}}}cSld"
+_TX_BODY = f"{{{_NS_P}}}txBody"
+_SLD_ID = f"{{{_NS_P}}}sldId"
+_A_P = f"{{{_NS_A}}}p"
+_A_R = f"{{{_NS_A}}}r"
+_A_T = f"{{{_NS_A}}}t"
+_R_ID = f"{{{_NS_R}}}id"
+_REL = f"{{{_NS_PKG_RELS}}}Relationship"
+
+
+def _parse(zf, member):
+    """Parse a whole (small) XML part with the same settings python-pptx uses"""
+    parser = etree.XMLParser(remove_blank_text=True, resolve_entities=False)
+    return etree.fromstring(zf.read(member), parser)
+
+
+def _rels_member(partname):
+    """Zip member holding the relationships of `partname` ('' for the package)"""
+    directory, filename = posixpath.split(partname)
+    return posixpath.join(directory, '_rels', f"{filename}.rels")
+
+
+def _read_rels(zf, partname):
+    """Map rId -> (reltype, target member name) for the part `partname`"""
+    rels = {}
+    base_dir = posixpath.dirname(partname)
+    for rel in _parse(zf, _rels_member(partname)).iter(_REL):
+        if rel.get('TargetMode') == 'External':
+            continue
+        target = rel.get('Target')
+        if target.startswith('/'):
+            member = target[1:]
+        else:
+            member = posixpath.normpath(posixpath.join(base_dir, target))
+        rels[rel.get('Id')] = (rel.get('Type'), member)
+    return rels
+
+
+def slide_members(zf):
+    """Zip member names of the slides, in presentation order"""
+    presentation_member = next(
+        member for reltype, member in _read_rels(zf, '').values()
+        if reltype == _RT_OFFICE_DOCUMENT
+    )
+    presentation_rels = _read_rels(zf, presentation_member)
+    presentation = _parse(zf, presentation_member)
+    return [presentation_rels[sld_id.get(_R_ID)][1] for sld_id in presentation.iter(_SLD_ID)]
+
+
+def _shape_text(sp):
+    """Non-blank paragraphs of one p:sp, matching extract_text_from_slide()"""
+    paragraphs = []
+    tx_body = sp.find(_TX_BODY)
+    if tx_body is None:
+        return paragraphs
+    for paragraph in tx_body.iterfind(_A_P):
+        para_text = ''.join(run.findtext(_A_T) or '' for run in paragraph.iterfind(_A_R))
+        if para_text.strip():
+            paragraphs.append(para_text.strip())
+    return paragraphs
+
+
+def slide_text(source):
+    """Text of one slide XML stream, one line per non-blank paragraph"""
+    text_content = []
+    for _, element in etree.iterparse(source, events=('end',), tag=_SP, remove_blank_text=True, resolve_entities=False):
+        parent = element.getparent()
+        # Only top-level shapes count (python-pptx does not look inside groups)
+        if parent.tag == _SP_TREE and parent.getparent().tag == _C_SLD:
+            text_content.extend(_shape_text(element))
+            element.clear()
+            # Drop shapes already read so the tree never holds the whole slide
+            while element.getprevious() is not None:
+                del parent[0]
+    return "\n".join(text_content)
+
+
+def iter_slide_texts(data):
+    """Yield the text of every slide in a .pptx given as bytes, a path or a file object"""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = BytesIO(data)
+    elif hasattr(data, 'seek'):
+        data.seek(0)
+    with zipfile.ZipFile(data) as zf:
+        for member in slide_members(zf):
+            with zf.open(member) as source:
+                yield slide_text(source)